@@ -0,0 +1,376 @@
+"""Benchmark the build and install pipeline on synthetic addons.
+
+Projects are generated with bench.generate, and every benchmark
+runs in its own process, so the peak RSS of one benchmark isn't
+affected by the others. HOME is pointed at a temporary folder
+with fake Blender config folders, so installs never touch a real
+Blender installation.
+
+Benchmarks:
+- build: a clean build, with the build folder removed first
+- build-noop: a build with --skip-unchanged and nothing changed
+- build-incremental: an incremental build after changing one file
+- install: installing an existing build into 3 Blender versions
+- version-expand: expanding version shorthands
+- extension: building and installing an extension, including
+  the manifest and compatibility checks of the extension action
+
+Every run also times a calibration workload, which copies and
+zips a fixed tree using only the standard library. Results can
+be saved as a baseline, and later runs compared against it by
+the time of each benchmark relative to the calibration, so the
+speed of the machine mostly cancels out and the stored baseline
+can be compared against on other hardware. Compare runs with
+the same sizes, and save a local baseline when comparing
+changes to the disk or Python version.
+
+Example, to save a baseline and compare a change against it:
+    python -m bench.bench_pipeline --save-baseline bench/baseline.json
+    python -m bench.bench_pipeline --compare bench/baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from decimal import getcontext
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, cast
+
+from attrs import asdict, evolve
+
+from bench.generate import ADDON_FOLDER, AddonSpec, generate, tree_size
+
+if TYPE_CHECKING:
+    from bpy_addon_build.build_context.core import BuildContext
+
+BENCHMARKS = [
+    "build",
+    "build-noop",
+    "build-incremental",
+    "install",
+    "version-expand",
+    "extension",
+]
+
+# Versions in the generated config, which get fake config folders
+BLENDER_VERSIONS = ["3.6", "4.1", "4.2"]
+
+SHORTHANDS = ["2.80..4.2", "3.0+", "2.93", "4.0..4.2"]
+
+# Slowdown compared to the baseline that counts as a regression
+THRESHOLD = 0.2
+
+# Workload every benchmark is compared to, which isn't in
+# BENCHMARKS as it doesn't use BpyBuild
+CALIBRATION = "calibrate"
+
+# Files of the calibration workload, and their size in bytes
+CALIBRATION_FILES = 2000
+CALIBRATION_SIZE = 4096
+
+# Result of a worker: wall times, files and bytes processed
+# per repeat, and peak RSS in KiB
+Result = dict[str, object]
+
+
+def _contexts(config: Path, *flags: str) -> list[BuildContext]:
+    from bpy_addon_build.args import parse_args
+    from bpy_addon_build.session import load_contexts
+
+    contexts = load_contexts(parse_args(["-c", str(config), "-b", "dev", *flags]))
+    if contexts is None:
+        raise SystemExit(f"Failed to load {config}")
+    return contexts
+
+
+def _build_size(archives: list[Path]) -> tuple[int, int]:
+    """Files and bytes in the built archives, which are what gets installed"""
+    files = 0
+    size = 0
+    for path in archives:
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    files += 1
+                    size += info.file_size
+    return files, size
+
+
+def _calibrate(root: Path) -> Callable[[], None]:
+    """Create the tree of the calibration workload in root, and
+    get a function that copies and zips it like a build does"""
+    source = root.joinpath("source")
+    for i in range(CALIBRATION_FILES):
+        folder = source.joinpath(f"pkg_{i % 10}", f"pkg_{i // 10 % 10}")
+        folder.mkdir(parents=True, exist_ok=True)
+        folder.joinpath(f"mod_{i}.py").write_bytes(
+            (f"VALUE_{i} = {i}\n" * CALIBRATION_SIZE)[:CALIBRATION_SIZE].encode()
+        )
+
+    def _run() -> None:
+        copy = root.joinpath("copy")
+        shutil.rmtree(copy, ignore_errors=True)
+        shutil.copytree(source, copy)
+        shutil.make_archive(str(root.joinpath("archive")), "zip", copy)
+
+    return _run
+
+
+def _timed(
+    repeat: int, setup: Callable[[], None], body: Callable[[], None]
+) -> list[float]:
+    times: list[float] = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        body()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _build_all(contexts: list[BuildContext]) -> None:
+    from bpy_addon_build.build_context.build import build
+
+    for ctx in contexts:
+        build(ctx)
+
+
+def _install_all(built: list[tuple[BuildContext, Path]]) -> None:
+    from bpy_addon_build.build_context.install import install
+
+    for ctx, path in built:
+        install(ctx, path)
+
+
+def run_worker(name: str, config: Path, repeat: int) -> Result:
+    """Run a single benchmark in this process"""
+    from bpy_addon_build.build_context.build import build
+    from bpy_addon_build.config import version_shorthand_expand
+    from bpy_addon_build.session import run
+
+    getcontext().prec = 3
+    build_folder = config.parent.joinpath("build")
+
+    def _clean() -> None:
+        shutil.rmtree(build_folder, ignore_errors=True)
+
+    def _nothing() -> None:
+        pass
+
+    files, size = tree_size(config.parent.joinpath(ADDON_FOLDER))
+    if name == "build":
+        contexts = _contexts(config, "-s")
+        times = _timed(repeat, _clean, lambda: _build_all(contexts))
+    elif name == "build-noop":
+        contexts = _contexts(config, "-s", "--skip-unchanged")
+        _clean()
+        _build_all(contexts)
+        times = _timed(repeat, _nothing, lambda: _build_all(contexts))
+    elif name == "build-incremental":
+        contexts = _contexts(config, "-s", "-i")
+        _clean()
+        _build_all(contexts)
+        changed = config.parent.joinpath(ADDON_FOLDER, "__init__.py")
+
+        def _change() -> None:
+            with open(changed, "a") as f:
+                f.write("# changed\n")
+
+        times = _timed(repeat, _change, lambda: _build_all(contexts))
+        files, size = 1, changed.stat().st_size
+    elif name == "install":
+        contexts = _contexts(config, "-s")
+        _clean()
+        built = [(ctx, build(ctx)) for ctx in contexts]
+        times = _timed(repeat, _nothing, lambda: _install_all(built))
+        files, size = _build_size([path for _, path in built])
+        files *= len(BLENDER_VERSIONS)
+        size *= len(BLENDER_VERSIONS)
+    elif name == "version-expand":
+
+        def _expand() -> None:
+            for _ in range(1000):
+                for ver in SHORTHANDS:
+                    version_shorthand_expand(ver)
+
+        times = _timed(repeat, _nothing, _expand)
+        files, size = 1000 * len(SHORTHANDS), 0
+    elif name == "extension":
+        contexts = _contexts(config, "-s")
+        times = _timed(repeat, _clean, lambda: run(contexts))
+    elif name == CALIBRATION:
+        with tempfile.TemporaryDirectory() as tmp:
+            times = _timed(repeat, _nothing, _calibrate(Path(tmp)))
+        files, size = CALIBRATION_FILES, CALIBRATION_FILES * CALIBRATION_SIZE
+    else:
+        raise SystemExit(f"Unknown benchmark {name}")
+
+    return {
+        "times": times,
+        "files": files,
+        "bytes": size,
+        "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def fake_home(root: Path) -> Path:
+    """Create a home folder with config folders for every Blender version"""
+    home = root.joinpath("home")
+    for ver in BLENDER_VERSIONS:
+        home.joinpath(".config", "blender", ver).mkdir(parents=True)
+    return home
+
+
+def run_benchmark(name: str, config: Path, home: Path, repeat: int) -> Result:
+    """Run a benchmark in a new process"""
+    env = dict(os.environ)
+    env["HOME"] = str(home)
+    repo = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [repo] + ([env["PYTHONPATH"]] if "PYTHONPATH" in env else [])
+    )
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "bench.bench_pipeline",
+            "--worker",
+            name,
+            "--config",
+            str(config),
+            "--repeat",
+            str(repeat),
+        ],
+        env=env,
+        cwd=config.parent,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"{name} failed:\n{proc.stdout}{proc.stderr}")
+    return cast(Result, json.loads(proc.stdout.splitlines()[-1]))
+
+
+def summarize(result: Result, calibration: float) -> dict[str, float]:
+    times = cast("list[float]", result["times"])
+    median = statistics.median(times)
+    files = cast(int, result["files"])
+    size = cast(int, result["bytes"])
+    return {
+        "min": min(times),
+        "median": median,
+        "relative": median / calibration if calibration else 0.0,
+        "items_per_s": files / median if median else 0.0,
+        "mb_per_s": size / 1024 / 1024 / median if median else 0.0,
+        "rss_mb": cast(int, result["rss"]) / 1024,
+    }
+
+
+def print_summary(name: str, r: dict[str, float]) -> None:
+    print(
+        f"{name:<18} median {r['median']:8.3f}s  min {r['min']:8.3f}s  "
+        f"{r['relative']:6.2f}x  "
+        f"{r['items_per_s']:10.0f} items/s  {r['mb_per_s']:8.1f} MB/s  "
+        f"RSS {r['rss_mb']:6.1f} MB"
+    )
+
+
+def compare(results: dict[str, dict[str, float]], spec: AddonSpec, path: Path) -> bool:
+    """Print the change of every benchmark compared to a baseline,
+    by their time relative to the calibration workload
+
+    Returns:
+        True if no benchmark regressed by more than THRESHOLD
+    """
+    with open(path, "r") as f:
+        data = cast("dict[str, dict[str, object]]", json.load(f))
+    if data["spec"] != asdict(spec):
+        print("Warning: the baseline was made with different sizes")
+    baseline = cast("dict[str, dict[str, float]]", data["results"])
+    if CALIBRATION not in baseline:
+        print("The baseline has no calibration, save it again")
+        return False
+    ok = True
+    for name, summary in results.items():
+        if name == CALIBRATION or name not in baseline:
+            continue
+        old = baseline[name]["relative"]
+        new = summary["relative"]
+        change = (new - old) / old if old else 0.0
+        regressed = change > THRESHOLD
+        ok = ok and not regressed
+        print(
+            f"{name:<18} {old:8.2f}x -> {new:8.2f}x "
+            f"({change:+.0%}){'  REGRESSION' if regressed else ''}"
+        )
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--py-files", type=int, default=2000)
+    parser.add_argument("--assets", type=int, default=10)
+    parser.add_argument("--asset-size", type=int, default=1024, help="In KiB")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--ignored", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--save-baseline", help="Save the results to this file")
+    parser.add_argument("--compare", help="Compare the results to this baseline")
+    parser.add_argument("--dir", help="Where to generate the projects")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_worker(args.worker, Path(args.config), args.repeat)))
+        return
+
+    spec = AddonSpec(
+        args.py_files,
+        args.assets,
+        args.asset_size * 1024,
+        args.depth,
+        args.ignored,
+    )
+    results: dict[str, dict[str, float]] = {}
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        home = fake_home(Path(tmp))
+        calibration = run_benchmark(
+            CALIBRATION, Path(tmp, "bpy-build.yaml"), home, args.repeat
+        )
+        median = statistics.median(cast("list[float]", calibration["times"]))
+        results[CALIBRATION] = summarize(calibration, median)
+        print_summary(CALIBRATION, results[CALIBRATION])
+        for name in args.only:
+            # Every benchmark gets a fresh project, since
+            # some of them change files in the addon
+            project = Path(tmp, name)
+            config = generate(project, evolve(spec, extension=name == "extension"))
+            result = run_benchmark(name, config, home, args.repeat)
+            results[name] = summarize(result, median)
+            print_summary(name, results[name])
+
+    if args.save_baseline is not None:
+        data: dict[str, object] = {"spec": asdict(spec), "results": results}
+        with open(args.save_baseline, "w") as f:
+            json.dump(data, f, indent=2)
+
+    if args.compare is not None:
+        print()
+        if not compare(results, spec, Path(args.compare)):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Generate synthetic addon projects for benchmarks.
+
+A project has a bpy-build.yaml, a dev action with ignore
+filters, and an addon folder with:
+- Python files spread over nested packages
+- Assets of a configurable size
+- Optionally, many files that the dev action ignores, like
+  backup .blend1 files and __pycache__ folders
+- Optionally, a blender_manifest.toml to build an extension
+
+Example, to generate a project to look at by hand:
+    python -m bench.generate /tmp/addon --py-files 2000 --assets 20 --depth 6
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+
+from attrs import frozen
+
+ADDON_FOLDER = "addon"
+
+MANIFEST = """schema_version = "1.0.0"
+
+id = "bench_addon"
+version = "1.0.0"
+name = "Bench Addon"
+tagline = "A synthetic addon for benchmarks"
+maintainer = "BpyBuild <bench@example.com>"
+type = "add-on"
+
+blender_version_min = "4.2.0"
+
+license = [
+  "SPDX:GPL-3.0-or-later",
+]
+"""
+
+CONFIG = """addon_folder: {addon_folder}
+build_name: bench_addon
+
+build_extension: {extension}
+
+install_versions:
+  - 3.6
+  - 4.1
+  - 4.2
+
+build_actions:
+  dev:
+    ignore_filters:
+      - "*.blend1"
+      - "__pycache__/"
+      - "/docs/"
+"""
+
+# Template of the Python files, which is valid code
+# that the compatibility checks of extensions can parse
+MODULE = """import math
+
+
+def function_{index}(value: int) -> int:
+    # {padding}
+    return math.floor(value * {index})
+"""
+
+
+@frozen
+class AddonSpec:
+    """Shape of a generated addon
+
+    Attributes
+    ----------
+    py_files: int
+        Number of Python files
+
+    assets: int
+        Number of asset files
+
+    asset_size: int
+        Size of each asset in bytes
+
+    depth: int
+        Number of nested packages that Python files are spread over
+
+    ignored: int
+        Number of files that the dev action ignores
+
+    extension: bool
+        Whether to build an extension
+    """
+
+    py_files: int = 1000
+    assets: int = 10
+    asset_size: int = 1024 * 1024
+    depth: int = 4
+    ignored: int = 0
+    extension: bool = False
+
+
+def package_path(root: Path, index: int, depth: int) -> Path:
+    """Get the nested package a file belongs to, like pkg_1/pkg_3/pkg_0"""
+    parts = [f"pkg_{(index // (10**level)) % 10}" for level in range(depth)]
+    return root.joinpath(*parts)
+
+
+def generate(root: Path, spec: AddonSpec) -> Path:
+    """Generate a project in root.
+
+    root: Folder to generate the project in, which is created
+    spec: Shape of the addon
+
+    Returns:
+        Path to bpy-build.yaml
+    """
+    addon = root.joinpath(ADDON_FOLDER)
+    addon.mkdir(parents=True)
+    addon.joinpath("__init__.py").write_text("")
+
+    for i in range(spec.py_files):
+        folder = package_path(addon, i, spec.depth)
+        if not folder.exists():
+            folder.mkdir(parents=True)
+            # Every package needs an __init__.py
+            rel = folder.relative_to(addon)
+            for parent in [rel, *rel.parents]:
+                addon.joinpath(parent, "__init__.py").touch()
+        folder.joinpath(f"mod_{i}.py").write_text(
+            MODULE.format(index=i, padding="x" * (i % 200))
+        )
+
+    assets = addon.joinpath("assets")
+    assets.mkdir()
+    data = os.urandom(min(spec.asset_size, 1024 * 1024))
+    for i in range(spec.assets):
+        with open(assets.joinpath(f"asset_{i}.blend"), "wb") as f:
+            remaining = spec.asset_size
+            while remaining > 0:
+                f.write(data[:remaining])
+                remaining -= len(data)
+
+    # Files the dev action ignores, spread over folders
+    # that are pruned and files that are filtered by name
+    for i in range(spec.ignored):
+        if i % 3 == 0:
+            folder = package_path(addon, i, spec.depth).joinpath("__pycache__")
+            folder.mkdir(parents=True, exist_ok=True)
+            folder.joinpath(f"mod_{i}.cpython-311.pyc").write_bytes(b"\0" * 512)
+        elif i % 3 == 1:
+            assets.joinpath(f"asset_{i}.blend1").write_bytes(b"\0" * 512)
+        else:
+            folder = addon.joinpath("docs", f"section_{i // 100}")
+            folder.mkdir(parents=True, exist_ok=True)
+            folder.joinpath(f"page_{i}.md").write_text("# Page\n")
+
+    if spec.extension:
+        addon.joinpath("blender_manifest.toml").write_text(MANIFEST)
+
+    config = root.joinpath("bpy-build.yaml")
+    config.write_text(
+        CONFIG.format(addon_folder=ADDON_FOLDER, extension=str(spec.extension).lower())
+    )
+    return config
+
+
+def tree_size(root: Path) -> tuple[int, int]:
+    """Get the number of files and bytes in a folder"""
+    files = 0
+    size = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return files, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root", help="Folder to generate the project in")
+    parser.add_argument("--py-files", type=int, default=1000)
+    parser.add_argument("--assets", type=int, default=10)
+    parser.add_argument("--asset-size", type=int, default=1024, help="In KiB")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--ignored", type=int, default=0)
+    parser.add_argument("--extension", action="store_true")
+    args = parser.parse_args()
+
+    spec = AddonSpec(
+        args.py_files,
+        args.assets,
+        args.asset_size * 1024,
+        args.depth,
+        args.ignored,
+        args.extension,
+    )
+    config = generate(Path(args.root), spec)
+    files, size = tree_size(config.parent.joinpath(ADDON_FOLDER))
+    print(f"Generated {files} files ({size / 1024 / 1024:.1f} MiB) in {config.parent}")
+
+
+if __name__ == "__main__":
+    main()
@@ -32,94 +32,23 @@
 
 from __future__ import annotations
 
-import copy
-from decimal import getcontext
-from typing import Optional
-
-import attrs
-import yaml
-from rich.console import Console
-
-from bpy_addon_build.api import Api
-from bpy_addon_build.build_context import hooks
-from bpy_addon_build.build_context.build import build
-from bpy_addon_build.build_context.install import install
-from bpy_addon_build.config import Config, ConfigDict, build_config
-
-from . import args
-from .build_context.core import BuildContext
+import sys
 
 
 def main() -> None:
-    # Set the precision for Decimal to
-    # 3, which corresponds to X.XX
-    getcontext().prec = 3
-
-    cli = args.parse_args()
-    console = Console()
-
-    if cli.debug_mode:
-        console.print(cli)
-
-    if not cli.path.exists():
-        print(f"Could not find {str(cli.path)}")
-
-    context: Optional[BuildContext] = None
-    with open(cli.path, "r") as f:
-        data: ConfigDict = yaml.safe_load(f)
-        config: Config = build_config(data)
-        api: Api = Api(config, cli, cli.debug_mode)
-        context = BuildContext(cli.path, config, cli, api)
-
-        if cli.debug_mode:
-            console.print(context)
-    if not cli.path.parent.joinpath(config.addon_folder).exists():
-        print("Addon folder does not exist!")
-        return
-
-    build_path = build(context)
-    install(context, build_path)
-    hooks.run_cleanup_hooks(context)
-
-    # Build legacy addon alongside extension
-    #
-    # To reduce as many issues as possible, we
-    # treat this as if it were a separate call
-    # of BpyBuild but with an altered config
-    if (
-        (config.build_extension and config.extension_settings is not None)
-        and config.extension_settings.build_legacy
-        and not cli.build_extension_only
-    ):
-        # Remove extension action in a copy
-        # of additional_actions
-        additional_actions = copy.deepcopy(config.additional_actions)
-        if "extension" in additional_actions:
-            additional_actions.remove("extension")
-
-        override_config = attrs.evolve(
-            config,
-            build_name=config.build_name + "_legacy",
-            build_extension=False,
-            extension_settings=None,
-            additional_actions=additional_actions,
-        )
-
-        override_api: Api = Api(override_config, cli, cli.debug_mode)
+    # This is kept light on purpose, so forwarding a build
+    # to the daemon doesn't pay for importing everything
+    # BpyBuild needs to build by itself
+    if "--use-daemon" in sys.argv[1:]:
+        from bpy_addon_build import client
 
-        # Change the context object. This is fine
-        # since this is ran last
-        context.config = override_config
-        context.api = override_api
+        code = client.forward(sys.argv[1:])
+        if code is not None:
+            sys.exit(code)
 
-        if cli.debug_mode:
-            console.print(override_config)
-            console.print(context)
-            console.print(context.api.actions_to_execute)
+    from bpy_addon_build.runner import run_cli
 
-        build_path = build(context)
-        install(context, build_path)
-        hooks.run_cleanup_hooks(context)
+    run_cli()
 
 
 if __name__ == "__main__":
@@ -11,7 +11,7 @@ from rich.console import Console
 
 from bpy_addon_build import util
 from bpy_addon_build.args import Args
-from bpy_addon_build.config import Config
+from bpy_addon_build.config import BuildAction, Config
 
 
 @dataclass
@@ -61,10 +61,14 @@ class Api:
 
     def __init__(self, conf: Config, cli: Args, debug_mode: bool) -> None:
         console = Console()
+
+        # Always define these, as hooks use them even
+        # if the config doesn't define any actions
+        self.build_actions: dict[str, BuildAction] = {}
+        self.action_mods: dict[str, ModuleType] = {}
+        self.actions_to_execute: list[str] = cli.actions + conf.additional_actions
         if conf.build_actions is not None:
             self.build_actions = conf.build_actions
-            self.action_mods: dict[str, ModuleType] = {}
-            self.actions_to_execute: list[str] = cli.actions + conf.additional_actions
 
             if cli.debug_mode:
                 print(self.actions_to_execute)
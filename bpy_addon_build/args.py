@@ -3,6 +3,35 @@ from typing import List, Optional, cast
 
 from attrs import Attribute, define, field
 
+# Commands that can be passed to bab
+COMMANDS = [
+    "build",
+    "fingerprint",
+    "daemon",
+    "workspace",
+    "cache",
+    "rollback",
+    "verify",
+]
+
+# Commands that don't read a config
+CONFIGLESS_COMMANDS = ["daemon", "cache"]
+
+# Subcommands of the cache command
+CACHE_COMMANDS = ["stats", "gc"]
+
+# Default workspace file of the workspace command
+WORKSPACE_FILE = "bab-workspace.yaml"
+
+# Ways files can be placed in stage-1
+STAGE_MODES = ["copy", "hardlink", "reflink"]
+
+# Where stage-1 can be kept
+STAGE_BACKENDS = ["disk", "tmpfs"]
+
+# Ways a build can be installed
+INSTALL_MODES = ["clean", "sync", "atomic", "link", "hardlink"]
+
 
 # Must be ignored to pass Mypy as this has
 # an expression of Any, likely due to how
@@ -17,7 +46,8 @@ class Args:
     ----------
     path: Path
         Path to build configuration; by default set to bpy-build.yaml in
-        the current directory.
+        the current directory. For the workspace command, this is
+        the workspace file, by default bab-workspace.yaml
 
         -c/--config can replace this path, should the user decide to do so.
 
@@ -32,6 +62,86 @@ class Args:
 
     supress_messages: bool
         Supress BpyBuild output
+
+    build_extension_only: bool
+        Only build an extension, if legacy building is enabled
+
+    incremental: bool
+        Keep stage-1 between builds and only copy changed files
+
+    jobs: Optional[int]
+        Number of workers to use for copying, compressing,
+        and installing files. If None, a default based on the number of CPUs
+        is used
+
+    fast: bool
+        Store every file in the final build without compressing it
+
+    skip_unchanged: bool
+        Reuse the last build if its fingerprint hasn't changed
+
+    command: str
+        Command to run, either build, fingerprint, daemon,
+        workspace, cache, or rollback
+
+    stage_mode: str
+        How files are placed in stage-1, either copy,
+        hardlink, or reflink
+
+    watch: bool
+        Rebuild and install every time the addon changes
+
+    use_daemon: bool
+        Whether this run was forwarded to the daemon
+
+    trace: Optional[Path]
+        Where to save a trace of the build, if anywhere
+
+    profiles: List[str]
+        Actions to build separate variants with, in
+        one run. Each profile is built with its action
+        on top of the actions in actions
+
+    cache: bool
+        Reuse archives from the artifact cache, and
+        add new archives to it
+
+    cache_size: int
+        Size of the artifact cache in MiB, after which
+        the least recently used archives are removed
+
+    cache_command: str
+        Subcommand of the cache command, either stats or gc
+
+    symlink_refs: bool
+        Fingerprint files reached through symlinks by their
+        inode and modification time instead of their contents
+
+    stage_backend: str
+        Where stage-1 is kept, either disk or tmpfs
+
+    scratch_root: Optional[Path]
+        Folder tmpfs stages are kept in. If None,
+        /dev/shm is used if it exists, otherwise
+        the temporary folder of the system
+
+    stage_memory: int
+        Size in MiB a tmpfs stage may use, after which
+        the stage is kept on disk instead
+
+    plan: bool
+        Print what a build and install would change
+        instead of building
+
+    install_mode: str
+        How builds are installed, either clean, sync,
+        atomic, link, or hardlink
+
+    all_installed: Optional[float]
+        Install to every Blender version that's installed,
+        at or above this version. If 0, the lowest version
+        in install_versions is used. If None, only the
+        versions from the config or -v are used
     """
 
     path: Path = field(default=Path("bpy-build.yaml"))
@@ -40,12 +150,32 @@ class Args:
     debug_mode: bool = field(default=False)
     supress_messages: bool = field(default=False)
     build_extension_only: bool = field(default=False)
+    incremental: bool = field(default=False)
+    jobs: Optional[int] = field(default=None)
+    fast: bool = field(default=False)
+    skip_unchanged: bool = field(default=False)
+    command: str = field(default="build")
+    stage_mode: str = field(default="copy")
+    watch: bool = field(default=False)
+    use_daemon: bool = field(default=False)
+    trace: Optional[Path] = field(default=None)
+    profiles: List[str] = field(factory=list)
+    cache: bool = field(default=False)
+    cache_size: int = field(default=1024)
+    cache_command: str = field(default="stats")
+    symlink_refs: bool = field(default=False)
+    stage_backend: str = field(default="disk")
+    scratch_root: Optional[Path] = field(default=None)
+    stage_memory: int = field(default=512)
+    plan: bool = field(default=False)
+    install_mode: str = field(default="clean")
+    all_installed: Optional[float] = field(default=None)
 
     @path.validator
     def path_validate(self, _: Attribute, value: Optional[Path]) -> None:
         # Assume the user did not pass
         # a path in
-        if value is None:
+        if value is None or self.command in CONFIGLESS_COMMANDS:
             return
         if not value.exists():
             raise FileNotFoundError(f"File {value} does not exist!")
@@ -61,6 +191,45 @@ class Args:
                 if not isinstance(ver, float):
                     raise ValueError("Expected List of floating point values!")
 
+    @jobs.validator
+    def jobs_validate(self, _: Attribute, value: Optional[int]) -> None:
+        if value is not None and value < 1:
+            raise ValueError("Expected at least 1 job!")
+
+    @stage_mode.validator
+    def stage_mode_validate(self, _: Attribute, value: str) -> None:
+        if value not in STAGE_MODES:
+            raise ValueError(f"Expected one of {', '.join(STAGE_MODES)}!")
+
+    @cache_size.validator
+    def cache_size_validate(self, _: Attribute, value: int) -> None:
+        if value < 0:
+            raise ValueError("Expected a cache size of at least 0!")
+
+    @stage_backend.validator
+    def stage_backend_validate(self, _: Attribute, value: str) -> None:
+        if value not in STAGE_BACKENDS:
+            raise ValueError(f"Expected one of {', '.join(STAGE_BACKENDS)}!")
+
+    @install_mode.validator
+    def install_mode_validate(self, _: Attribute, value: str) -> None:
+        if value not in INSTALL_MODES:
+            raise ValueError(f"Expected one of {', '.join(INSTALL_MODES)}!")
+
+    @stage_memory.validator
+    def stage_memory_validate(self, _: Attribute, value: int) -> None:
+        if value < 0:
+            raise ValueError("Expected a stage memory limit of at least 0!")
+
+    @all_installed.validator
+    def all_installed_validate(self, _: Attribute, value: Optional[float]) -> None:
+        if value is None:
+            return
+        if value < 0:
+            raise ValueError("Expected a version of at least 0!")
+        if len(self.versions):
+            raise ValueError("--all-installed can't be used with -v/--versions!")
+
     @actions.validator
     def actions_validate(self, _: Attribute, value: Optional[List[str]]) -> None:
         if value is None:
@@ -71,7 +240,7 @@ class Args:
                     raise ValueError("Expect List of strings!")
 
 
-def parse_args() -> Args:
+def parse_args(argv: Optional[List[str]] = None) -> Args:
     """
     Parses arguments passed in the CLI.
 
@@ -88,6 +257,8 @@ def parse_args() -> Args:
             - The list passed doesn't contain all floating
               point values
 
+    argv: Arguments without the program name, by default sys.argv
+
     Returns:
         Args
     """
@@ -132,13 +303,168 @@ def parse_args() -> Args:
         action="store_true",
     )
 
-    args: Namespace = parser.parse_args()
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        help="Keep stage-1 between builds and only copy files that changed",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of workers to use when copying, compressing, and installing files",
+        type=int,
+    )
+
+    parser.add_argument(
+        "--fast",
+        help="Store files in the final build without compressing them, for faster development builds",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--skip-unchanged",
+        help="Skip building if nothing changed since the last build, and reuse its output",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--stage-mode",
+        help="How files are placed in stage-1. hardlink and reflink avoid copying data, and fall back to copying when the filesystem doesn't support them",
+        choices=STAGE_MODES,
+        default="copy",
+    )
+
+    parser.add_argument(
+        "--stage-backend",
+        help="Where stage-1 is kept. tmpfs keeps it in memory, in --scratch-root, and falls back to disk if it's larger than --stage-memory",
+        choices=STAGE_BACKENDS,
+        default="disk",
+    )
+
+    parser.add_argument(
+        "--scratch-root",
+        help="Folder to keep tmpfs stages in (default /dev/shm, or the temporary folder if it doesn't exist)",
+    )
+
+    parser.add_argument(
+        "--stage-memory",
+        help="Size in MiB a tmpfs stage may use before falling back to disk (default 512)",
+        type=int,
+        default=512,
+    )
+
+    parser.add_argument(
+        "--install-mode",
+        help="How builds are installed. clean removes the previous install and extracts everything, sync only writes files that changed and removes files that are gone, atomic extracts next to the previous install and swaps it in, keeping it for the rollback command, link makes every install a symlink to build/linked, and hardlink makes every install out of hardlinks to the files in build/linked",
+        choices=INSTALL_MODES,
+        default="clean",
+    )
+
+    parser.add_argument(
+        "--all-installed",
+        help="Install to every Blender version found on this system, at or above the given version. Without a version, the lowest version in install_versions is used",
+        nargs="?",
+        type=float,
+        const=0.0,
+        metavar="FLOOR",
+    )
+
+    parser.add_argument(
+        "--plan",
+        help="Print which files a build and install would add, change, and remove, and which hooks would run, without building",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--watch",
+        help="Build and install, then do so again whenever the addon folder, config, or action scripts change. Implies --incremental and --skip-unchanged",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--use-daemon",
+        help="Forward the build to a running daemon (see bab daemon), or build normally if none is running",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--trace",
+        help="Save a timeline of the build to this file, which can be opened in chrome://tracing or Perfetto",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-P",
+        "--profiles",
+        help="Build a variant with this action, alongside the variants of other -P flags, in one run sharing a single scan of the addon folder. Can be repeated, and only the first profile is installed",
+        action="append",
+        type=str,
+        metavar="PROFILE",
+    )
+
+    parser.add_argument(
+        "--cache",
+        help="Reuse archives of earlier builds with the same inputs from the artifact cache (~/.cache/bpy-build), and add new archives to it",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        help="Size of the artifact cache in MiB, after which the least recently used archives are removed (default 1024)",
+        type=int,
+        default=1024,
+    )
+
+    parser.add_argument(
+        "--symlink-refs",
+        help="Fingerprint files reached through symlinks by their inode and modification time instead of hashing them, for large external assets",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "command",
+        help="Command to run. fingerprint prints the fingerprint of each build without building, daemon starts a daemon that builds requests from --use-daemon, and workspace builds every config listed in a workspace file (-c, by default bab-workspace.yaml), cache manages the artifact cache, rollback restores the installs replaced by the last --install-mode atomic install, and verify checks every install against its receipt",
+        nargs="?",
+        choices=COMMANDS,
+        default="build",
+    )
+
+    parser.add_argument(
+        "cache_command",
+        help="For the cache command, stats prints the entries of the artifact cache, and gc removes the least recently used ones over --cache-size",
+        nargs="?",
+        choices=CACHE_COMMANDS,
+        default="stats",
+    )
+
+    args: Namespace = parser.parse_args(argv)
     config: str = "bpy-build.yaml"
     actions: List[str] = ["default"]
 
+    trace = cast(Optional[str], args.trace)
+    scratch_root = cast(Optional[str], args.scratch_root)
+    profiles = cast(Optional[List[str]], args.profiles)
+    if profiles is not None:
+        # Profiles share a build folder, so each
+        # one can only be built once
+        profiles = [p for i, p in enumerate(profiles) if p not in profiles[:i]]
+
     # The config path can be None
     if cast(Optional[str], args.config) is not None:
         config = args.config
+    elif cast(str, args.command) == "workspace":
+        config = WORKSPACE_FILE
 
     # This allows the default action to always
     # be executed
@@ -154,4 +480,26 @@ def parse_args() -> Args:
         cast(bool, args.debug_mode),
         cast(bool, args.supress_output),
         cast(bool, args.build_extension_only),
+        # Watch mode rebuilds often, so it only
+        # copies and compresses what changed
+        incremental=cast(bool, args.incremental) or cast(bool, args.watch),
+        jobs=cast(Optional[int], args.jobs),
+        fast=cast(bool, args.fast),
+        skip_unchanged=cast(bool, args.skip_unchanged) or cast(bool, args.watch),
+        command=cast(str, args.command),
+        stage_mode=cast(str, args.stage_mode),
+        watch=cast(bool, args.watch),
+        use_daemon=cast(bool, args.use_daemon),
+        trace=Path(trace) if trace is not None else None,
+        profiles=profiles if profiles is not None else [],
+        cache=cast(bool, args.cache),
+        cache_size=cast(int, args.cache_size),
+        cache_command=cast(str, args.cache_command),
+        symlink_refs=cast(bool, args.symlink_refs),
+        stage_backend=cast(str, args.stage_backend),
+        scratch_root=Path(scratch_root) if scratch_root is not None else None,
+        stage_memory=cast(int, args.stage_memory),
+        plan=cast(bool, args.plan),
+        install_mode=cast(str, args.install_mode),
+        all_installed=cast(Optional[float], args.all_installed),
     )
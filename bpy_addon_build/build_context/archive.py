@@ -0,0 +1,598 @@
+from __future__ import annotations
+
+import bz2
+import io
+import json
+import lzma
+import os
+import stat
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional, Protocol, cast
+
+from attrs import define, frozen
+
+from bpy_addon_build.build_context import fileio, stage
+from bpy_addon_build.config import CompressionRule
+from lib_bpybuild_ext.ignore import IgnoreMatcher
+
+# Size of a local file header without the
+# file name and extra field, see APPNOTE.TXT
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+# Bit 3 of the general purpose flags, used when the CRC and
+# sizes are written after the data instead of in the header
+DATA_DESCRIPTOR_FLAG = 0x08
+
+# Earliest date a zip file can store, used as the
+# timestamp of every member to make archives reproducible
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+# Compressed data larger than this is spooled to a temporary
+# file on disk. Up to twice as many files as there are workers
+# are in flight at once, so this bounds the memory they use
+SPOOL_SIZE = 4 * 1024 * 1024
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@define  # type: ignore
+class ArchiveStats:
+    """Statistics of writing an archive, mostly for debugging
+
+    Attributes
+    ----------
+    compressed: int
+        Number of members that were compressed
+
+    reused: int
+        Number of members copied as is from the previous archive
+    """
+
+    compressed: int = 0
+    reused: int = 0
+
+
+def state_file(zip_path: Path) -> Path:
+    """Get the path of the file storing the state of an archive"""
+    return zip_path.parent.joinpath(stage.STATE_FOLDER, zip_path.name + ".json")
+
+
+def _walk(
+    root: Path, exclude: Optional[IgnoreMatcher] = None
+) -> list[tuple[str, str, bool]]:
+    """Get all entries to archive, in the same order shutil.make_archive uses.
+
+    root: Folder to archive
+    exclude: Patterns of paths to leave out, relative to
+        the folders in root
+
+    Returns:
+        List of (path, arcname, is_dir)
+    """
+    entries: list[tuple[str, str, bool]] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        if exclude is not None and rel_dir != ".":
+            # Patterns are relative to the addon folder, which
+            # is the first component of the path in the stage
+            parts = Path(rel_dir).parts
+            filenames = exclude.prune("/".join(parts[1:]), dirnames, filenames)
+        dirnames.sort()
+        for name in dirnames:
+            arcname = os.path.normpath(os.path.join(rel_dir, name))
+            entries.append((os.path.join(dirpath, name), arcname, True))
+        for name in sorted(filenames):
+            arcname = os.path.normpath(os.path.join(rel_dir, name))
+            entries.append((os.path.join(dirpath, name), arcname, False))
+    return entries
+
+
+def _load_state(zip_path: Path, path: Path) -> dict[str, list[int]]:
+    """Load the stage state of every member of the previous archive.
+
+    If the archive doesn't match the state that was
+    saved alongside it, nothing can be reused.
+    """
+    if not zip_path.exists() or not path.exists():
+        return {}
+    try:
+        with open(path, "r") as f:
+            data = cast("dict[str, dict[str, list[int]]]", json.load(f))
+        st = zip_path.stat()
+        if data["archive"]["stat"] != [st.st_size, st.st_mtime_ns]:
+            return {}
+        return data["members"]
+    except (ValueError, KeyError, TypeError):
+        return {}
+
+
+def _save_state(zip_path: Path, path: Path, members: dict[str, list[int]]) -> None:
+    st = zip_path.stat()
+    data: dict[str, dict[str, list[int]]] = {
+        "archive": {"stat": [st.st_size, st.st_mtime_ns]},
+        "members": members,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def archive_date() -> tuple[int, int, int, int, int, int]:
+    """Get the timestamp used for every member of an archive.
+
+    This follows the SOURCE_DATE_EPOCH convention from
+    reproducible-builds.org, and otherwise uses the
+    earliest date a zip file can store.
+    """
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if epoch is None:
+        return ZIP_EPOCH
+    try:
+        date = time.gmtime(int(epoch))
+    except (ValueError, OverflowError):
+        return ZIP_EPOCH
+    if date.tm_year < 1980:
+        return ZIP_EPOCH
+    return (
+        date.tm_year,
+        date.tm_mon,
+        date.tm_mday,
+        date.tm_hour,
+        date.tm_min,
+        date.tm_sec,
+    )
+
+
+def make_info(arcname: str, mode: int, is_dir: bool = False) -> zipfile.ZipInfo:
+    """Create a ZipInfo with metadata that doesn't depend on the machine.
+
+    The timestamp is fixed, and permissions are normalized to
+    0o755 for folders and executable files, and 0o644 for
+    everything else, so building the same files always
+    produces the same archive.
+
+    arcname: Name of the member
+    mode: st_mode of the file, only the executable bit is kept
+    is_dir: Whether the member is a folder
+
+    Returns:
+        ZipInfo without the CRC and sizes
+    """
+    if is_dir and not arcname.endswith("/"):
+        arcname += "/"
+    info = zipfile.ZipInfo(arcname, archive_date())
+    info.create_system = 3
+    if is_dir:
+        info.external_attr = ((stat.S_IFDIR | 0o755) << 16) | 0x10
+    else:
+        perms = 0o755 if mode & stat.S_IXUSR else 0o644
+        info.external_attr = (stat.S_IFREG | perms) << 16
+    return info
+
+
+def _copy_bytes(src: BinaryIO, dst: BinaryIO, size: int) -> None:
+    try:
+        fileio.copy_stream(src, dst, size)
+    except EOFError:
+        raise zipfile.BadZipFile("Unexpected end of archive")
+
+
+def _write_member(
+    zf: zipfile.ZipFile, info: zipfile.ZipInfo, src: BinaryIO, size: int
+) -> None:
+    """Write a member with data that's already compressed.
+
+    zipfile doesn't have a public API for this, so we do
+    what ZipFile.write does: write the local header and
+    data, and let ZipFile.close write the central directory.
+
+    zf: Archive opened for writing
+    info: ZipInfo of the member, with the CRC and sizes set
+    src: File object to read the compressed data from
+    size: Number of bytes to read from src
+    """
+    if zf.fp is None:
+        raise ValueError("Attempt to write to ZIP archive that was already closed")
+
+    # The sizes are known beforehand, so the header
+    # is written with them instead of a data descriptor
+    info.flag_bits &= ~DATA_DESCRIPTOR_FLAG
+    info.header_offset = zf.fp.tell()
+    zf.fp.write(info.FileHeader())
+    _copy_bytes(src, cast(BinaryIO, zf.fp), size)
+
+    zf.start_dir = zf.fp.tell()
+    zf.filelist.append(info)
+    zf.NameToInfo[info.filename] = info
+
+
+def copy_raw(src_fp: BinaryIO, info: zipfile.ZipInfo, zf: zipfile.ZipFile) -> None:
+    """Copy a member from another archive without decompressing it.
+
+    src_fp: File object of the archive the member is from
+    info: ZipInfo of the member
+    zf: Archive opened for writing
+    """
+    src_fp.seek(info.header_offset)
+    header = src_fp.read(LOCAL_HEADER_SIZE)
+    if header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+    name_len, extra_len = cast("tuple[int, int]", struct.unpack("<HH", header[26:]))
+
+    # Normalize the metadata again, in case the
+    # member is from an older, non-reproducible archive
+    new_info = make_info(info.filename, info.external_attr >> 16)
+    new_info.compress_type = info.compress_type
+    new_info.flag_bits = info.flag_bits
+    new_info.CRC = info.CRC
+    new_info.compress_size = info.compress_size
+    new_info.file_size = info.file_size
+
+    src_fp.seek(info.header_offset + LOCAL_HEADER_SIZE + name_len + extra_len)
+    _write_member(zf, new_info, src_fp, info.compress_size)
+
+
+class Compressor(Protocol):
+    """Interface shared by the compressors of all methods"""
+
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class StoreCompressor:
+    """Compressor that doesn't compress, for ZIP_STORED"""
+
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class LzmaCompressor:
+    """Compressor for ZIP_LZMA.
+
+    This is the same as zipfile.LZMACompressor, which isn't
+    public. Zip files expect the LZMA properties of the default
+    filter before the raw stream, which are hardcoded here as the
+    lzma module only exposes them through private functions.
+    """
+
+    # Properties of the default LZMA1 filter: lc=3, lp=0,
+    # pb=2, and a dictionary size of 8 MiB
+    PROPERTIES = bytes([(2 * 5 + 0) * 9 + 3]) + struct.pack("<I", 1 << 23)
+
+    def __init__(self) -> None:
+        filters: list[dict[str, int]] = [
+            {"id": lzma.FILTER_LZMA1, "dict_size": 1 << 23, "lc": 3, "lp": 0, "pb": 2}
+        ]
+        self._comp = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=filters)
+        self._header: bytes = (
+            struct.pack("<BBH", 9, 4, len(self.PROPERTIES)) + self.PROPERTIES
+        )
+
+    def _take_header(self) -> bytes:
+        header = self._header
+        self._header = b""
+        return header
+
+    def compress(self, data: bytes) -> bytes:
+        return self._take_header() + self._comp.compress(data)
+
+    def flush(self) -> bytes:
+        return self._take_header() + self._comp.flush()
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class Compression:
+    """How a single file is compressed
+
+    Attributes
+    ----------
+    compress_type: int
+        One of the zipfile.ZIP_* constants
+
+    level: Optional[int]
+        Compression level, or None for the default
+    """
+
+    compress_type: int = zipfile.ZIP_DEFLATED
+    level: Optional[int] = None
+
+    def compressor(self) -> Compressor:
+        """Create a compressor that outputs the same data zipfile does"""
+        if self.compress_type == zipfile.ZIP_DEFLATED:
+            level = zlib.Z_DEFAULT_COMPRESSION if self.level is None else self.level
+            return zlib.compressobj(level, zlib.DEFLATED, -15)
+        elif self.compress_type == zipfile.ZIP_BZIP2:
+            return bz2.BZ2Compressor(9 if self.level is None else self.level)
+        elif self.compress_type == zipfile.ZIP_LZMA:
+            return LzmaCompressor()
+        return StoreCompressor()
+
+
+# Map of compression methods in the config to zipfile constants
+COMPRESS_TYPES: dict[str, int] = {
+    "store": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+
+# Function that returns how to compress a file, given
+# its path relative to the addon folder
+CompressionPolicy = Callable[[str], Compression]
+
+
+def compression_policy(
+    rules: Optional[list[CompressionRule]], fast: bool = False
+) -> CompressionPolicy:
+    """Create a function that decides how each file is compressed.
+
+    Patterns are matched like ignore_filters, with IgnoreMatcher,
+    so a pattern ending with "/" matches every file in a matching
+    folder. Like with ignore_filters, the last rule that matches
+    is used. Files that don't match any rule are deflated with the
+    default level, like shutil.make_archive does.
+
+    rules: Compression rules from the config
+    fast: Store every file without compressing it
+
+    Returns:
+        CompressionPolicy for the rules
+    """
+    if fast:
+        return lambda _: Compression(zipfile.ZIP_STORED)
+
+    default = Compression()
+
+    # Checked last to first, as later rules win
+    compiled = [
+        (
+            IgnoreMatcher([rule.pattern]),
+            Compression(COMPRESS_TYPES[rule.method], rule.level),
+        )
+        for rule in reversed(rules if rules is not None else [])
+    ]
+
+    def _policy(rel_path: str) -> Compression:
+        parts = rel_path.split("/")
+        folders = ["/".join(parts[:i]) for i in range(1, len(parts))]
+        for matcher, compression in compiled:
+            if matcher.match(rel_path) or any(
+                matcher.match(folder, True) for folder in folders
+            ):
+                return compression
+        return default
+
+    return _policy
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class CompressedFile:
+    """A file compressed by compress_file
+
+    Attributes
+    ----------
+    crc: int
+        CRC-32 of the uncompressed data
+
+    file_size: int
+        Size of the uncompressed data
+
+    compress_size: int
+        Size of the compressed data
+
+    data: BinaryIO
+        Compressed data, spooled to disk for large files.
+        Stored files are read from the file itself
+    """
+
+    crc: int
+    file_size: int
+    compress_size: int
+    data: BinaryIO
+
+
+def compress_file(path: str, compression: Compression) -> CompressedFile:
+    """Compress a file into a raw stream, like zipfile does.
+
+    This can be called from multiple threads at once, as
+    zlib, bz2, and lzma release the GIL while compressing.
+
+    Stored files aren't copied at all, their CRC is
+    computed first and the file is written to the
+    archive straight from disk.
+
+    path: Path of the file to compress
+    compression: How to compress the file
+
+    Returns:
+        CompressedFile with the compressed data
+    """
+    if compression.compress_type == zipfile.ZIP_STORED:
+        crc, file_size = fileio.crc32_file(path)
+        return CompressedFile(crc, file_size, file_size, open(path, "rb"))
+
+    crc = 0
+    file_size = 0
+    compressor = compression.compressor()
+    data = cast(BinaryIO, tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE))
+    for chunk in fileio.read_chunks(path):
+        crc = zlib.crc32(chunk, crc)
+        file_size += len(chunk)
+        data.write(compressor.compress(chunk))
+    data.write(compressor.flush())
+    compress_size = data.tell()
+    data.seek(0)
+    return CompressedFile(crc, file_size, compress_size, data)
+
+
+def _write_compressed(
+    zf: zipfile.ZipFile,
+    path: str,
+    arcname: str,
+    compression: Compression,
+    compressed: CompressedFile,
+) -> None:
+    info = make_info(Path(arcname).as_posix(), os.stat(path).st_mode)
+    info.compress_type = compression.compress_type
+    info.CRC = compressed.crc
+    info.file_size = compressed.file_size
+    info.compress_size = compressed.compress_size
+
+    # Compressed LZMA data includes an end-of-stream
+    # marker, which zipfile records in the flags
+    if compression.compress_type == zipfile.ZIP_LZMA:
+        info.flag_bits |= 0x02
+    with compressed.data:
+        _write_member(zf, info, compressed.data, compressed.compress_size)
+
+
+def write_archive(
+    root: Path,
+    zip_path: Path,
+    incremental: bool = False,
+    workers: int = 1,
+    policy: Optional[CompressionPolicy] = None,
+    exclude: Optional[IgnoreMatcher] = None,
+) -> ArchiveStats:
+    """Archive a folder, like shutil.make_archive does for zip files.
+
+    Files are compressed by a pool of workers, and written to
+    the archive in a fixed order by this thread, so the archive
+    is the same no matter how many workers are used. Members are
+    sorted, and their timestamps and permissions are normalized
+    with make_info, so the same files always produce the same archive.
+
+    In incremental mode, members that haven't changed since
+    the last archive are copied from it as is, without being
+    compressed again. A member counts as unchanged if the stage
+    file has the same inode, ctime, modification time, and size,
+    which is only the case if stage-1 was synced incrementally
+    and no main hook touched the file, and if it's compressed
+    the same way.
+
+    root: Folder to archive
+    zip_path: Path of the archive to create
+    incremental: Whether to reuse members of the previous archive
+    workers: Number of threads used to compress files
+    policy: How to compress files, by default everything is deflated
+    exclude: Patterns of paths to leave out, relative to the folders in root
+
+    Returns:
+        ArchiveStats of the archive
+    """
+    stats = ArchiveStats()
+    state_path = state_file(zip_path)
+    previous = _load_state(zip_path, state_path) if incremental else {}
+    stage.forget(state_path)
+    if policy is None:
+        policy = compression_policy(None)
+
+    members: dict[str, list[int]] = {}
+    tmp_path = zip_path.with_name(zip_path.name + ".tmp")
+    old_zf: Optional[zipfile.ZipFile] = None
+    old_fp: Optional[BinaryIO] = None
+    executor: Optional[ThreadPoolExecutor] = None
+    try:
+        if len(previous):
+            try:
+                old_fp = open(zip_path, "rb")
+                old_zf = zipfile.ZipFile(old_fp)
+            except zipfile.BadZipFile:
+                old_zf = None
+
+        # Figure out what to do with every entry first,
+        # so we know what the workers need to compress
+        plan: list[tuple[str, str, bool, Compression, Optional[zipfile.ZipInfo]]] = []
+        for path, arcname, is_dir in _walk(root, exclude):
+            if is_dir:
+                plan.append((path, arcname, True, Compression(), None))
+                continue
+
+            # Zip files always use forward slashes, and the policy
+            # works on paths relative to the folder in the stage
+            posix_name = Path(arcname).as_posix()
+            compression = policy(posix_name.split("/", 1)[-1])
+            st = os.lstat(path)
+            key = list(stage.staged_state(st)) + [
+                compression.compress_type,
+                -1 if compression.level is None else compression.level,
+            ]
+            members[arcname] = key
+
+            old_info: Optional[zipfile.ZipInfo] = None
+            if old_zf is not None and previous.get(arcname) == key:
+                old_info = old_zf.NameToInfo.get(posix_name)
+            if old_info is not None and (
+                old_info.file_size != st.st_size
+                or old_info.compress_type != compression.compress_type
+            ):
+                old_info = None
+            plan.append((path, arcname, False, compression, old_info))
+
+        to_compress = iter(
+            [
+                (path, compression)
+                for path, _, is_dir, compression, old_info in plan
+                if not is_dir and old_info is None
+            ]
+        )
+        pending: deque[Future[CompressedFile]] = deque()
+        if workers > 1:
+            executor = ThreadPoolExecutor(max_workers=workers)
+
+        def _next_compressed() -> CompressedFile:
+            # Keep a bounded number of files in flight, so
+            # memory use doesn't grow with the size of the addon
+            if executor is None:
+                return compress_file(*next(to_compress))
+            while len(pending) < workers * 2:
+                item = next(to_compress, None)
+                if item is None:
+                    break
+                pending.append(executor.submit(compress_file, *item))
+            return pending.popleft().result()
+
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for path, arcname, is_dir, compression, old_info in plan:
+                if is_dir:
+                    info = make_info(Path(arcname).as_posix(), 0, True)
+                    info.CRC = 0
+                    _write_member(zf, info, io.BytesIO(), 0)
+                elif old_fp is not None and old_info is not None:
+                    copy_raw(old_fp, old_info, zf)
+                    stats.reused += 1
+                else:
+                    compressed = _next_compressed()
+                    _write_compressed(zf, path, arcname, compression, compressed)
+                    stats.compressed += 1
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if old_zf is not None:
+            old_zf.close()
+        if old_fp is not None:
+            old_fp.close()
+
+    os.replace(tmp_path, zip_path)
+    if incremental:
+        _save_state(zip_path, state_path, members)
+    return stats
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Optional, cast
+
+from attrs import frozen
+
+from bpy_addon_build.build_context import fileio
+
+# Bump this when the layout of entries changes
+CACHE_VERSION = "1"
+
+ARCHIVE = "archive.zip"
+MANIFEST = "manifest.json"
+
+# Default size of the cache, in MiB
+DEFAULT_MAX_SIZE = 1024
+
+
+def cache_dir() -> Path:
+    """Get the folder of the artifact cache, which
+    is $XDG_CACHE_HOME/bpy-build, or ~/.cache/bpy-build"""
+    base = os.environ.get("XDG_CACHE_HOME")
+    root = Path(base) if base else Path("~/.cache").expanduser()
+    return root.joinpath("bpy-build", f"v{CACHE_VERSION}")
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class CacheEntry:
+    """
+    A cached archive
+
+    Attributes
+    ----------
+    path: Path
+        Folder of the entry
+
+    size: int
+        Size of the entry in bytes
+
+    last_used: float
+        Time the entry was last stored or restored
+    """
+
+    path: Path
+    size: int
+    last_used: float
+
+
+def _entry_path(root: Path, key: str) -> Path:
+    return root.joinpath(key[:2], key)
+
+
+def restore(key: str, zip_path: Path, root: Optional[Path] = None) -> bool:
+    """
+    Copy a cached archive to zip_path, if there is one
+
+    key: Fingerprint of the build
+    zip_path: Where to place the archive
+    root: Folder of the cache, by default cache_dir()
+
+    Returns:
+        True if the archive was in the cache
+    """
+    entry = _entry_path(root if root is not None else cache_dir(), key)
+    archive = entry.joinpath(ARCHIVE)
+    tmp_path = zip_path.with_name(zip_path.name + ".tmp")
+    try:
+        fileio.copy_file(archive, tmp_path)
+    except FileNotFoundError:
+        return False
+    os.replace(tmp_path, zip_path)
+
+    # The modification time of the manifest
+    # records when the entry was last used
+    try:
+        os.utime(entry.joinpath(MANIFEST))
+    except OSError:
+        pass
+    return True
+
+
+def contains(key: str, root: Optional[Path] = None) -> bool:
+    """
+    Check if the cache has the archive of a build
+
+    key: Fingerprint of the build
+    root: Folder of the cache, by default cache_dir()
+
+    Returns:
+        True if the archive is in the cache
+    """
+    entry = _entry_path(root if root is not None else cache_dir(), key)
+    return entry.joinpath(ARCHIVE).exists()
+
+
+def store(
+    key: str,
+    zip_path: Path,
+    build_name: str,
+    max_size: int = DEFAULT_MAX_SIZE,
+    root: Optional[Path] = None,
+) -> None:
+    """
+    Add a finished archive to the cache, along with a manifest
+    of its contents, then evict entries over max_size
+
+    Entries are written to a temporary folder and renamed
+    into place, so builds storing the same entry at the
+    same time never see a partial entry.
+
+    key: Fingerprint of the build
+    zip_path: Archive to store
+    build_name: Name of the build, for cache stats
+    max_size: Size of the cache in MiB
+    root: Folder of the cache, by default cache_dir()
+
+    Returns:
+        None
+    """
+    root = root if root is not None else cache_dir()
+    entry = _entry_path(root, key)
+    if entry.exists():
+        return
+
+    with zipfile.ZipFile(zip_path) as zf:
+        files: dict[str, list[int]] = {
+            info.filename: [info.file_size, info.CRC] for info in zf.infolist()
+        }
+    manifest: dict[str, object] = {
+        "key": key,
+        "build_name": build_name,
+        "created": time.time(),
+        "files": files,
+    }
+
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=".tmp-", dir=root))
+    try:
+        fileio.copy_file(zip_path, tmp.joinpath(ARCHIVE))
+        with open(tmp.joinpath(MANIFEST), "w") as f:
+            json.dump(manifest, f)
+        entry.parent.mkdir(exist_ok=True)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Another build stored the same entry first
+            pass
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    gc(max_size, root)
+
+
+def _last_used(entry: CacheEntry) -> float:
+    return entry.last_used
+
+
+def entries(root: Optional[Path] = None) -> list[CacheEntry]:
+    """
+    Get all entries of the cache
+
+    root: Folder of the cache, by default cache_dir()
+
+    Returns:
+        Entries, least recently used first
+    """
+    root = root if root is not None else cache_dir()
+    found: list[CacheEntry] = []
+    if not root.exists():
+        return found
+    for prefix in root.iterdir():
+        if prefix.name.startswith(".") or not prefix.is_dir():
+            continue
+        for entry in prefix.iterdir():
+            try:
+                size = sum(p.stat().st_size for p in entry.iterdir())
+                last_used = entry.joinpath(MANIFEST).stat().st_mtime
+            except OSError:
+                # Partial entries, which gc removes
+                found.append(CacheEntry(entry, 0, 0.0))
+                continue
+            found.append(CacheEntry(entry, size, last_used))
+    found.sort(key=_last_used)
+    return found
+
+
+def gc(max_size: int = DEFAULT_MAX_SIZE, root: Optional[Path] = None) -> list[Path]:
+    """
+    Remove the least recently used entries until the
+    cache is at most max_size MiB
+
+    max_size: Size of the cache in MiB
+    root: Folder of the cache, by default cache_dir()
+
+    Returns:
+        Folders of the removed entries
+    """
+    found = entries(root)
+    total = sum(e.size for e in found)
+    limit = max_size * 1024 * 1024
+    removed: list[Path] = []
+    for entry in found:
+        if total <= limit and entry.size > 0:
+            break
+        shutil.rmtree(entry.path, ignore_errors=True)
+        total -= entry.size
+        removed.append(entry.path)
+    return removed
+
+
+def build_name(entry: CacheEntry) -> str:
+    """Get the build name recorded in an entry's manifest"""
+    try:
+        with open(entry.path.joinpath(MANIFEST), "r") as f:
+            data = cast("dict[str, object]", json.load(f))
+        return str(data["build_name"])
+    except (OSError, ValueError, KeyError):
+        return "?"
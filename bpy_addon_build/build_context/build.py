@@ -1,8 +1,29 @@
+from __future__ import annotations
+
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
+
+import attrs
+from attrs import define, frozen
 
-from bpy_addon_build.build_context import hooks
-from bpy_addon_build.build_context.core import BuildContext
+from bpy_addon_build import trace
+from bpy_addon_build.build_context import (
+    archive,
+    artifacts,
+    fingerprint,
+    hooks,
+    stage,
+)
+from bpy_addon_build.build_context.core import (
+    BuildContext,
+    action_filters,
+    manifest_excludes,
+    output_dir,
+)
+from lib_bpybuild_ext.ignore import IgnoreMatcher
 
 
 def combine_with_build(ctx: BuildContext, path: Path) -> Path:
@@ -21,6 +42,104 @@ def combine_with_build(ctx: BuildContext, path: Path) -> Path:
     return path.joinpath(Path(ctx.config.build_name))
 
 
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class Built:
+    """
+    Archive of a variant after build_all
+
+    Attributes
+    ----------
+    path: Path
+        Path to the final archive
+
+    built: bool
+        Whether the variant was built, and so ran its
+        pre_build hooks, instead of reusing the last
+        archive or restoring it from the cache
+    """
+
+    path: Path
+    built: bool
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@define  # type: ignore
+class Variant:
+    """
+    State of a single build, when building
+    several variants of an addon at once
+
+    Attributes
+    ----------
+    ctx: BuildContext
+        Context of the build
+
+    stage_one: Path
+        Stage the build is assembled in, which is
+        moved to a scratch root with --stage-backend tmpfs
+
+    excludes: list[str]
+        Exclude patterns from the manifest, which are
+        also applied to files added by main hooks
+
+    ignore: IgnoreMatcher
+        Patterns of files that aren't copied to the stage
+
+    zip_path: Path
+        Path of the final archive
+
+    fingerprint: Optional[str]
+        Fingerprint of the build, if --skip-unchanged
+        or --cache was passed
+
+    touched: Optional[set[str]]
+        Files main hooks changed in the last incremental build
+
+    scan: Optional[stage.TreeScan]
+        Files to copy to the stage
+
+    concurrent: int
+        Number of variants built at the same time,
+        which share the workers for copying and compressing
+
+    scratch: bool
+        Whether the stage is in a scratch root
+    """
+
+    ctx: BuildContext
+    stage_one: Path
+    excludes: list[str]
+    ignore: IgnoreMatcher
+    zip_path: Path
+    fingerprint: Optional[str] = None
+    touched: Optional[set[str]] = None
+    scan: Optional[stage.TreeScan] = None
+    concurrent: int = 1
+    scratch: bool = False
+
+    def workers(self, default: int) -> int:
+        """Get this variant's share of the workers"""
+        total = self.ctx.cli.jobs if self.ctx.cli.jobs is not None else default
+        return max(1, total // self.concurrent)
+
+    @property
+    def stage_dest(self) -> Path:
+        return combine_with_build(self.ctx, self.stage_one)
+
+    @property
+    def state_file(self) -> Path:
+        return stage.state_file(output_dir(self.ctx), self.stage_one)
+
+    @property
+    def addon_folder(self) -> Path:
+        return self.ctx.config_path.parent.joinpath(self.ctx.config.addon_folder)
+
+
 def build(ctx: BuildContext) -> Path:
     """
     Function that does the actual building.
@@ -28,49 +147,275 @@ def build(ctx: BuildContext) -> Path:
     ctx: Build context
 
     Returns:
-        None
+        Path to the final archive
     """
+    return build_all([ctx])[0].path
 
-    # Create some constants
-    BUILD_DIR = ctx.config_path.parent / Path("build")
-    STAGE_ONE = BUILD_DIR.joinpath(
-        Path("stage-1_extension" if ctx.config.build_extension else "stage-1")
-    )
-    FILTERS = []
-
-    # Get all filters from currently used actions
-    if ctx.config.build_actions:
-        for name, act in ctx.config.build_actions.items():
-            if act.ignore_filters and name in ctx.cli.actions:
-                FILTERS += act.ignore_filters
-
-    ADDON_FOLDER = ctx.config_path.parent.joinpath(ctx.config.addon_folder)
-
-    if not BUILD_DIR.exists():
-        BUILD_DIR.mkdir()
-    if not STAGE_ONE.exists():
-        STAGE_ONE.mkdir()
-    if STAGE_ONE.exists():
-        shutil.rmtree(STAGE_ONE)
-        STAGE_ONE.mkdir()
-
-    hooks.run_prebuild_hooks(ctx)
-    # For some weird reason, shutil.ignore_patterns
-    # expects positional arguments for all patterns,
-    # and not a list like most would expect.
-    #
-    # Sigh...
-    #
-    # Due to weirdness of the ignore argument, we also
-    # need to add an ignore comment for Mypy
-    shutil.copytree(
-        ADDON_FOLDER,
-        combine_with_build(ctx, STAGE_ONE),
-        ignore=shutil.ignore_patterns(*FILTERS),  # type: ignore
+
+def build_all(contexts: list[BuildContext]) -> list[Built]:
+    """
+    Build several variants of an addon, like an extension
+    and its legacy addon, or multiple profiles.
+
+    The addon folder is only walked and hashed once for all
+    variants. Pre-build hooks run one variant at a time, in
+    order, as they may change the addon folder. Each variant
+    then gets its own stage, which is copied, passed to main
+    hooks and compressed in parallel with the others.
+
+    session.run only passes several variants when none of
+    them has pre_build or clean_up hooks.
+
+    contexts: Build contexts, in order
+
+    Returns:
+        Archives of the variants, in the same order, and
+        whether they were built, which is when clean_up
+        hooks have a pre_build hook to undo
+    """
+    variants = [_create_variant(ctx) for ctx in contexts]
+
+    # Fingerprint before any hooks run, as
+    # pre_build hooks may change the addon folder
+    checked = [v for v in variants if v.ctx.cli.skip_unchanged or v.ctx.cli.cache]
+    if len(checked):
+        with trace.span("fingerprint"):
+            for folder, group in _by_folder(checked).items():
+                shared = stage.scan_shared(folder, [v.ignore for v in group])
+                for v in group:
+                    v.scan = stage.filter_scan(shared, v.ignore)
+                    v.fingerprint = fingerprint.compute(v.ctx, scan=v.scan)
+
+    pending: list[Variant] = []
+    for v in variants:
+        if v.fingerprint is not None and fingerprint.matches_last(
+            v.zip_path, v.fingerprint
+        ):
+            if not v.ctx.cli.supress_messages:
+                print(f"Nothing changed, reusing {v.zip_path.name} ({v.fingerprint})")
+        elif (
+            v.fingerprint is not None and v.ctx.cli.cache and _restore(v, v.fingerprint)
+        ):
+            if not v.ctx.cli.supress_messages:
+                print(f"Restored {v.zip_path.name} from cache ({v.fingerprint})")
+        else:
+            pending.append(v)
+
+    for v in pending:
+        hooks.run_prebuild_hooks(v.ctx)
+
+    # Scan after the pre_build hooks, as
+    # they may change the addon folder
+    for folder, group in _by_folder(pending).items():
+        with trace.span("scan", variants=len(group)) as scan_span:
+            shared = stage.scan_shared(folder, [v.ignore for v in group])
+            for v in group:
+                v.scan = stage.filter_scan(shared, v.ignore)
+            scan_span.set(files=len(shared.files), dirs=len(shared.dirs))
+
+    # The size of the stage is only known after
+    # scanning, so that's when its backend is picked
+    for v in pending:
+        if v.ctx.cli.stage_backend == "tmpfs":
+            _use_scratch(v)
+        _prepare_stage(v)
+
+    # Building variants at the same time only helps
+    # if there are enough CPUs to go around
+    concurrent = min(len(pending), os.cpu_count() or 1)
+    if concurrent > 1:
+        for v in pending:
+            v.concurrent = concurrent
+        with ThreadPoolExecutor(concurrent) as executor:
+            list(executor.map(_package, pending))
+    else:
+        for v in pending:
+            _package(v)
+    return [Built(v.zip_path, v in pending) for v in variants]
+
+
+def _restore(v: Variant, key: str) -> bool:
+    """Restore the archive of a variant from the artifact cache"""
+    with trace.span("cache restore"):
+        if not artifacts.restore(key, v.zip_path):
+            return False
+
+    # The stage doesn't match the archive anymore, so
+    # the next incremental build has to recreate it
+    stage.forget(v.state_file)
+    fingerprint.save_last(v.zip_path, key)
+    if v.scan is not None:
+        stage.save_scan(stage.sources_file(v.zip_path), v.scan)
+    return True
+
+
+def _create_variant(ctx: BuildContext) -> Variant:
+    # Variants are packaged at the same time, while main hooks
+    # without arguments change the working directory, so every
+    # path of a variant must be absolute
+    ctx = attrs.evolve(ctx, config_path=ctx.config_path.resolve())
+    build_dir = output_dir(ctx)
+    if not build_dir.exists():
+        build_dir.mkdir(parents=True)
+
+    # Get all filters from currently used actions,
+    # and the manifest if we're building an extension
+    excludes = manifest_excludes(ctx)
+    return Variant(
+        ctx,
+        build_dir.joinpath(
+            Path("stage-1_extension" if ctx.config.build_extension else "stage-1")
+        ),
+        excludes,
+        IgnoreMatcher(action_filters(ctx) + excludes),
+        Path(str(combine_with_build(ctx, build_dir)) + ".zip"),
     )
 
-    hooks.run_main_hooks(ctx, STAGE_ONE, Path(ctx.config.build_name))
 
-    combined_str = str(combine_with_build(ctx, BUILD_DIR))
-    _ = shutil.make_archive(combined_str, "zip", STAGE_ONE)
-    return Path(combined_str + ".zip")
+def _by_folder(variants: list[Variant]) -> dict[Path, list[Variant]]:
+    groups: dict[Path, list[Variant]] = {}
+    for v in variants:
+        groups.setdefault(v.addon_folder, []).append(v)
+    return groups
+
+
+def _use_scratch(v: Variant) -> None:
+    """Move the stage of a variant to the scratch root,
+    if its files fit in the memory limit"""
+    cli = v.ctx.cli
+    assert v.scan is not None
+    root = stage.scratch_root(cli.scratch_root)
+    scratch = stage.scratch_stage(root, output_dir(v.ctx), v.stage_one)
+    if stage.fits_in_scratch(root, v.scan, cli.stage_memory * 1024 * 1024):
+        v.stage_one = scratch
+        v.scratch = True
+        v.stage_one.parent.mkdir(parents=True, exist_ok=True)
+        return
+
+    # Free the memory of a stage kept by an earlier build
+    if scratch.exists():
+        shutil.rmtree(scratch)
+        stage.forget(stage.state_file(output_dir(v.ctx), scratch))
+    if cli.debug_mode:
+        print(f"Stage doesn't fit in {root}, using {v.stage_one}")
+
+
+def _prepare_stage(v: Variant) -> None:
+    # In incremental mode, we keep stage-1 around
+    # and only copy what changed. If we don't know
+    # what main hooks did in the last build, the
+    # stage can't be trusted and is recreated.
+    v.touched = stage.load_touched(v.state_file) if v.ctx.cli.incremental else None
+
+    # The stage may be gone, like a stage
+    # in a scratch root after a reboot
+    if not v.stage_one.exists():
+        v.touched = None
+
+    # The stage is considered dirty until the
+    # main hooks finish running
+    with trace.span("stage prep", incremental=v.touched is not None):
+        stage.forget(v.state_file)
+        if v.touched is None:
+            if v.stage_one.exists():
+                shutil.rmtree(v.stage_one)
+            v.stage_one.mkdir()
+        else:
+            stage.clear_extra(v.stage_one, v.ctx.config.build_name)
+
+
+def _package(v: Variant) -> None:
+    """Copy the files of a variant to its stage, run
+    main hooks on it, and compress it"""
+    with trace.span("package", build_name=v.ctx.config.build_name):
+        _copy_and_run_hooks(v)
+        _compress(v)
+
+    # Only incremental builds reuse the stage,
+    # so others give the memory back right away
+    if v.scratch and not v.ctx.cli.incremental:
+        shutil.rmtree(v.stage_one, ignore_errors=True)
+
+
+def _copy_and_run_hooks(v: Variant) -> None:
+    ctx = v.ctx
+    assert v.scan is not None
+
+    # Hardlinked files share their data with the addon folder,
+    # and any file may be written to by main hooks, so
+    # builds with main hooks copy the stage instead
+    mode = ctx.cli.stage_mode
+    if mode == "hardlink" and hooks.has_main_hooks(ctx):
+        mode = "copy"
+        if ctx.cli.debug_mode:
+            print("main hooks may write to the stage, copying instead of hardlinking")
+    with trace.span("copy", mode=mode) as copy_span:
+        stats = stage.sync_tree(
+            v.addon_folder,
+            v.scan,
+            v.stage_dest,
+            v.touched if v.touched is not None else set(),
+            v.workers(stage.default_workers()),
+            mode,
+        )
+        copy_span.set(
+            files=stats.files,
+            bytes=stats.bytes,
+            removed=stats.removed,
+            linked=len(stats.linked),
+        )
+    if ctx.cli.debug_mode:
+        print(
+            "Copied",
+            stats.files,
+            "files, removed",
+            stats.removed,
+            "hardlinked",
+            len(stats.linked),
+        )
+
+    hooks.run_main_hooks(ctx, v.stage_one, Path(ctx.config.build_name))
+
+    if ctx.cli.incremental:
+        stage.save_touched(v.state_file, stage.find_touched(v.stage_dest, stats.staged))
+
+
+def _compress(v: Variant) -> None:
+    ctx = v.ctx
+    with trace.span("archive") as archive_span:
+        archive_stats = archive.write_archive(
+            v.stage_one,
+            v.zip_path,
+            ctx.cli.incremental,
+            v.workers(os.cpu_count() or 1),
+            archive.compression_policy(ctx.config.compression, ctx.cli.fast),
+            IgnoreMatcher(v.excludes),
+        )
+        archive_span.set(
+            files=archive_stats.compressed + archive_stats.reused,
+            compressed=archive_stats.compressed,
+            reused=archive_stats.reused,
+            bytes=v.zip_path.stat().st_size,
+        )
+    if ctx.cli.debug_mode:
+        print(
+            "Compressed",
+            archive_stats.compressed,
+            "files, reused",
+            archive_stats.reused,
+        )
+
+    # Lets --plan tell what changed since this build
+    if v.scan is not None:
+        stage.save_scan(stage.sources_file(v.zip_path), v.scan)
+
+    if v.fingerprint is not None:
+        fingerprint.save_last(v.zip_path, v.fingerprint)
+        if ctx.cli.cache:
+            with trace.span("cache store"):
+                artifacts.store(
+                    v.fingerprint,
+                    v.zip_path,
+                    ctx.config.build_name,
+                    ctx.cli.cache_size,
+                )
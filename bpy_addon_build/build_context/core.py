@@ -1,13 +1,17 @@
 from __future__ import annotations
 
 from pathlib import Path
+from typing import Optional
 
+import tomli
 from attrs import define
 from rich.console import Console
 
 from bpy_addon_build.api import Api
 from bpy_addon_build.args import Args
 from bpy_addon_build.config import Config
+from lib_bpybuild_ext import BLENDER_MANIFEST, get_manifest_data
+from lib_bpybuild_ext.ignore import IgnoreMatcher
 
 INSTALL_PATHS: list[str] = [
     "~/AppData/Roaming/Blender Foundation/Blender/",
@@ -41,9 +45,97 @@ class BuildContext:
 
     cli: Args
         Arguments passed by the user
+
+    profile: Optional[str]
+        Profile this context builds, if profiles were passed
     """
 
     config_path: Path
     config: Config
     cli: Args
     api: Api
+    profile: Optional[str] = None
+
+
+def build_dir(ctx: BuildContext) -> Path:
+    """Get the build folder, which sits next to the config"""
+    return ctx.config_path.parent / Path("build")
+
+
+def output_dir(ctx: BuildContext) -> Path:
+    """
+    Get the folder a build writes its stages and archive to
+
+    Every profile gets its own folder, so profiles
+    can be built at the same time without sharing
+    stages, and keep the same archive name
+
+    ctx: Build context
+
+    Returns:
+        build/ or build/<profile>
+    """
+    if ctx.profile is None:
+        return build_dir(ctx)
+    return build_dir(ctx).joinpath(ctx.profile)
+
+
+def action_filters(ctx: BuildContext) -> list[str]:
+    """
+    Get the ignore filters of all actions
+    that are currently used
+
+    ctx: Build context
+
+    Returns:
+        List of glob patterns
+    """
+    filters: list[str] = []
+    if ctx.config.build_actions:
+        for name, act in ctx.config.build_actions.items():
+            if act.ignore_filters and name in ctx.cli.actions:
+                filters += act.ignore_filters
+    return filters
+
+
+def manifest_excludes(ctx: BuildContext) -> list[str]:
+    """
+    Get build.paths_exclude_pattern from blender_manifest.toml,
+    if we're building an extension
+
+    Errors in the manifest are ignored here, as
+    the extension action reports them
+
+    ctx: Build context
+
+    Returns:
+        List of gitignore-style patterns
+    """
+    if not ctx.config.build_extension:
+        return []
+    manifest_path = ctx.config_path.parent.joinpath(
+        ctx.config.addon_folder, BLENDER_MANIFEST
+    )
+    if not manifest_path.exists():
+        return []
+    try:
+        build = get_manifest_data(manifest_path).build
+    except (tomli.TOMLDecodeError, TypeError):
+        return []
+    if build is None or "paths_exclude_pattern" not in build:
+        return []
+    return build["paths_exclude_pattern"]
+
+
+def ignore_matcher(ctx: BuildContext) -> IgnoreMatcher:
+    """
+    Compile the patterns of files that shouldn't be
+    copied from addon_folder: the ignore filters of
+    used actions, then the manifest's exclude patterns
+
+    ctx: Build context
+
+    Returns:
+        IgnoreMatcher relative to addon_folder
+    """
+    return IgnoreMatcher(action_filters(ctx) + manifest_excludes(ctx))
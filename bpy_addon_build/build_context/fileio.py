@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import errno
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import sys
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Callable, Iterator, Optional, Union, cast
+
+# Size of the buffer used when streaming files
+CHUNK_SIZE = 1024 * 1024
+
+# Files are mapped this much at a time when hashing, and each
+# window is unmapped before the next one, so the pages of a
+# multi-GB file never count towards memory use all at once.
+# This must be a multiple of mmap.ALLOCATIONGRANULARITY
+MMAP_WINDOW = 16 * 1024 * 1024
+
+# Smaller files are read into a buffer instead,
+# as mapping them costs more than it saves
+MMAP_MIN_SIZE = CHUNK_SIZE
+
+# Errors raised when copy_file_range can't be used
+# between two files, in which case the copy falls back
+COPY_RANGE_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}
+
+# Flag of renameat2 from linux/fs.h that swaps two paths,
+# and the value that makes it resolve relative paths from
+# the working directory
+RENAME_EXCHANGE = 2
+AT_FDCWD = -100
+
+# Errors raised when a filesystem can't swap paths
+EXCHANGE_ERRORS = {errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}
+
+# Errors raised when a file can't be hardlinked, like
+# across devices or on filesystems without hardlinks, in
+# which case it's copied instead
+LINK_ERRORS = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EMLINK,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.EACCES,
+}
+
+StrPath = Union[str, "os.PathLike[str]"]
+
+
+def read_chunks(path: StrPath) -> Iterator[memoryview]:
+    """Read a file in chunks of at most CHUNK_SIZE bytes.
+
+    The same buffer is reused for every chunk, so each
+    chunk must be used before getting the next one.
+
+    path: File to read
+
+    Returns:
+        Iterator of chunks
+    """
+    with open(path, "rb", buffering=0) as f:
+        yield from _read_into(f)
+
+
+def _read_into(f: io.FileIO) -> Iterator[memoryview]:
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            break
+        yield view[:n]
+
+
+def _windows(path: StrPath) -> Iterator[Union[memoryview, mmap.mmap]]:
+    """Get the contents of a file in bounded windows,
+    mapping large files and reading small ones"""
+    with open(path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_MIN_SIZE:
+            yield memoryview(f.read())
+            return
+
+        offset = 0
+        while offset < size:
+            length = min(MMAP_WINDOW, size - offset)
+            try:
+                window = mmap.mmap(
+                    f.fileno(), length, access=mmap.ACCESS_READ, offset=offset
+                )
+            except (OSError, ValueError):
+                # Some filesystems can't be mapped,
+                # so the rest is read instead
+                f.seek(offset)
+                yield from _read_into(f)
+                return
+            with window:
+                if hasattr(window, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                    window.madvise(mmap.MADV_SEQUENTIAL)
+                yield window
+            offset += length
+
+
+def hash_file(path: StrPath, algorithm: str = "sha256") -> str:
+    """Hash a file without reading it into memory.
+
+    path: File to hash
+    algorithm: Name of a hashlib algorithm
+
+    Returns:
+        Hex digest of the file
+    """
+    hasher = hashlib.new(algorithm)
+    for window in _windows(path):
+        hasher.update(window)
+    return hasher.hexdigest()
+
+
+def crc32_file(path: StrPath) -> tuple[int, int]:
+    """Get the CRC-32 of a file, as stored in zip files,
+    without reading it into memory.
+
+    path: File to check
+
+    Returns:
+        CRC-32 and size of the file
+    """
+    crc = 0
+    size = 0
+    for window in _windows(path):
+        crc = zlib.crc32(window, crc)
+        size += len(window)
+    return crc, size
+
+
+def copy_stream(src: IO[bytes], dst: IO[bytes], size: Optional[int] = None) -> int:
+    """Copy data between open files in chunks.
+
+    src: File to read from
+    dst: File to write to
+    size: Number of bytes to copy, or None to copy until the end of src
+
+    Returns:
+        Number of bytes copied
+
+    Raises:
+        EOFError: If src ends before size bytes were copied
+    """
+    copied = 0
+    while size is None or copied < size:
+        want = CHUNK_SIZE if size is None else min(CHUNK_SIZE, size - copied)
+        chunk = src.read(want)
+        if not chunk:
+            if size is not None:
+                raise EOFError(f"Expected {size} bytes, got {copied}")
+            break
+        dst.write(chunk)
+        copied += len(chunk)
+    return copied
+
+
+def copy_file(src: StrPath, dst: StrPath) -> None:
+    """Copy the data of a file, like shutil.copyfile.
+
+    On Linux, this lets the kernel copy the data with
+    copy_file_range, which never passes it through
+    user space and can share extents on filesystems
+    that support it. Elsewhere, shutil.copyfile is
+    used, which also avoids buffering whole files.
+
+    src: File to copy
+    dst: Path of the copy, which is replaced if it exists
+    """
+    copy_range: Optional[Callable[[int, int, int], int]] = getattr(
+        os, "copy_file_range", None
+    )
+    if copy_range is None:
+        shutil.copyfile(src, dst)
+        return
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        try:
+            while remaining > 0:
+                n = copy_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30))
+                if n == 0:
+                    break
+                remaining -= n
+        except OSError as e:
+            if e.errno not in COPY_RANGE_ERRORS:
+                raise
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+
+
+def copy_file_with_stat(src: StrPath, dst: StrPath) -> None:
+    """Copy a file with its metadata, like shutil.copy2"""
+    copy_file(src, dst)
+    shutil.copystat(src, dst)
+
+
+def is_safe_member(name: str) -> bool:
+    """Check if a member of an archive stays in the folder it's extracted to"""
+    return not name.startswith("/") and ".." not in name.split("/")
+
+
+def extract_zip(zip_path: Path, dest: Path, workers: int = 1) -> tuple[int, int]:
+    """Extract an archive, streaming every member to disk.
+
+    Like shutil.unpack_archive, members with absolute
+    paths or .. in them are skipped. With several
+    workers, members are split between threads that
+    each open the archive, as a ZipFile can't be
+    shared between threads that read from it.
+
+    zip_path: Archive to extract
+    dest: Folder to extract to
+    workers: Number of threads to extract with
+
+    Returns:
+        Number of files and bytes extracted
+    """
+    members: list[tuple[zipfile.ZipInfo, Path]] = []
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if not is_safe_member(name):
+                continue
+            target = dest.joinpath(*name.split("/"))
+            if info.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            members.append((info, target))
+
+    return len(members), extract_members(zip_path, members, workers)
+
+
+def extract_members(
+    zip_path: Path, members: list[tuple[zipfile.ZipInfo, Path]], workers: int = 1
+) -> int:
+    """Extract some members of an archive to the given paths.
+
+    The folders of the paths must already exist.
+
+    zip_path: Archive to extract from
+    members: Members and the paths to extract them to
+    workers: Number of threads to extract with
+
+    Returns:
+        Number of bytes extracted
+    """
+    workers = min(workers, len(members))
+    if workers <= 1:
+        return _extract_members(zip_path, members)
+
+    # Deal the largest members out first, so
+    # every thread gets about the same amount
+    members = sorted(members, key=_member_size, reverse=True)
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(_extract_members, zip_path, members[i::workers])
+            for i in range(workers)
+        ]
+        return sum(future.result() for future in futures)
+
+
+def _member_size(member: tuple[zipfile.ZipInfo, Path]) -> int:
+    return member[0].file_size
+
+
+def _extract_members(
+    zip_path: Path, members: list[tuple[zipfile.ZipInfo, Path]]
+) -> int:
+    size = 0
+    with zipfile.ZipFile(zip_path) as zf:
+        for info, target in members:
+            with zf.open(info) as src, open(target, "wb") as dst:
+                size += copy_stream(src, dst)
+    return size
+
+
+def exchange(a: StrPath, b: StrPath) -> bool:
+    """Swap two paths in a single step, so there's no
+    moment where either of them doesn't exist.
+
+    This uses renameat2, which is only supported on
+    Linux, with filesystems like ext4, Btrfs, XFS,
+    and tmpfs. NFS doesn't support it.
+
+    a: First path
+    b: Second path, on the same filesystem
+
+    Returns:
+        - True if the paths were swapped
+        - False if swapping isn't supported, in which case nothing changed
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        renameat2 = cast(Callable[[int, bytes, int, bytes, int], int], libc.renameat2)
+    except (OSError, AttributeError):
+        return False
+
+    result = renameat2(
+        AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE
+    )
+    if result == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in EXCHANGE_ERRORS:
+        return False
+    raise OSError(err, os.strerror(err), os.fsdecode(a))
+
+
+def link_tree(src: Path, dst: Path) -> tuple[int, int]:
+    """Recreate a folder with hardlinks to its files.
+
+    Files that can't be linked, like when dst is on another
+    device, are copied instead. Once a link fails for any
+    reason but the file having too many links, the rest is
+    copied without trying to link it first.
+
+    src: Folder to recreate
+    dst: Path of the new folder, which must not exist
+
+    Returns:
+        Number of files linked and copied
+    """
+    linked = 0
+    copied = 0
+    can_link = True
+    for dirpath, _, filenames in os.walk(src):
+        target = dst.joinpath(Path(dirpath).relative_to(src))
+        target.mkdir(parents=True, exist_ok=True)
+        for name in filenames:
+            source = os.path.join(dirpath, name)
+            if can_link:
+                try:
+                    os.link(source, target.joinpath(name), follow_symlinks=False)
+                    linked += 1
+                    continue
+                except OSError as e:
+                    if e.errno not in LINK_ERRORS:
+                        raise
+                    can_link = e.errno == errno.EMLINK
+            copy_file_with_stat(source, target.joinpath(name))
+            copied += 1
+    return linked, copied
+
+
+def reference_key(st: os.stat_result) -> str:
+    """Get a key identifying the contents of a file by its
+    inode instead of its data, for external assets that
+    are too large to hash on every build"""
+    return f"ref:{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
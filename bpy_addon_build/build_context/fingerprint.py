@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional, cast
+
+from bpy_addon_build.build_context import archive, fileio, stage
+from bpy_addon_build.build_context.core import BuildContext, build_dir, ignore_matcher
+
+# Bump this when the fingerprint or the build output
+# changes in a way that isn't covered by the inputs
+FINGERPRINT_VERSION = "1"
+
+HASH_CACHE = "hashes.json"
+
+
+def hash_file(path: Path) -> str:
+    """Get the SHA-256 of a file, without reading it into memory"""
+    return fileio.hash_file(path)
+
+
+class HashCache:
+    """
+    Cache of file hashes, stored in build/.bab
+
+    Hashes are keyed by the absolute path of the file, and
+    are only reused if the size, modification time, ctime,
+    and inode of the file are the same. Files reached
+    through several paths, like hardlinks or symlinks to
+    the same asset, are only hashed once per run.
+
+    Attributes
+    ----------
+    path: Path
+        Path to the cache file
+
+    entries: dict[str, list[str]]
+        Path to the stat key and hash of the file
+
+    inodes: dict[str, str]
+        Device, inode, and stat key to the hash of the
+        file, for files hashed in this run
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, list[str]] = {}
+        self.inodes: dict[str, str] = {}
+        self.modified = False
+        if path.exists():
+            try:
+                with open(path, "r") as f:
+                    self.entries = cast("dict[str, list[str]]", json.load(f))
+            except ValueError:
+                self.entries = {}
+
+    def hash(self, path: Path) -> str:
+        """Get the SHA-256 of a file, using the cached hash if possible"""
+        st = os.stat(path)
+        key = f"{st.st_size}:{st.st_mtime_ns}:{st.st_ctime_ns}:{st.st_ino}"
+        name = str(path.absolute())
+        entry = self.entries.get(name)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        inode = f"{st.st_dev}:{key}"
+        digest = self.inodes.get(inode)
+        if digest is None:
+            digest = hash_file(path)
+            self.inodes[inode] = digest
+        self.entries[name] = [key, digest]
+        self.modified = True
+        return digest
+
+    def save(self) -> None:
+        if not self.modified:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f)
+        self.modified = False
+
+
+# Hash caches that were loaded, by path
+CACHES: dict[Path, HashCache] = {}
+
+
+def compute(
+    ctx: BuildContext,
+    cache: Optional[HashCache] = None,
+    scan: Optional[stage.TreeScan] = None,
+) -> str:
+    """Compute the fingerprint of a build.
+
+    The fingerprint covers everything that goes into a build:
+    the contents of addon_folder (with ignore filters applied),
+    the parsed config, the selected actions, options that change
+    the output, the source of every action script, and the date
+    archive members get, which SOURCE_DATE_EPOCH changes.
+    Compression rules are covered by the config.
+
+    ctx: Build context
+    cache: Hash cache to use, by default the one in build/.bab
+    scan: Scan of addon_folder with the ignore filters of ctx
+        applied, to avoid walking it again
+
+    Returns:
+        Fingerprint as a hex string
+    """
+    save = cache is None
+    if cache is None:
+        # Caches are kept in memory as well, so a
+        # long running process only loads them once
+        path = build_dir(ctx).joinpath(stage.STATE_FOLDER, HASH_CACHE)
+        if path not in CACHES:
+            CACHES[path] = HashCache(path)
+        cache = CACHES[path]
+
+    hasher = hashlib.sha256()
+
+    def _add(label: str, value: str) -> None:
+        hasher.update(label.encode() + b"\0" + value.encode() + b"\0")
+
+    actions = ctx.cli.actions + ctx.config.additional_actions
+    _add("version", FINGERPRINT_VERSION)
+    _add("config", repr(ctx.config))
+    _add("actions", "\n".join(actions))
+    _add("fast", str(ctx.cli.fast))
+    _add("symlink_refs", str(ctx.cli.symlink_refs))
+    _add("date", repr(archive.archive_date()))
+
+    if ctx.config.build_actions is not None:
+        for action in actions:
+            if action not in ctx.config.build_actions:
+                continue
+            script = ctx.config.build_actions[action].script
+            if script is None:
+                continue
+
+            # Resolved the same way Api.add_modules does
+            path = ctx.config_path.parent.resolve().joinpath(Path(script))
+            _add(f"script:{action}", cache.hash(path))
+
+    addon_folder = ctx.config_path.parent.joinpath(ctx.config.addon_folder)
+    if scan is None:
+        scan = stage.scan_tree(addon_folder, ignore_matcher(ctx))
+    linked: list[str] = []
+    for rel in scan.dirs:
+        _add("dir", rel)
+        if ctx.cli.symlink_refs and os.path.islink(addon_folder.joinpath(rel)):
+            linked.append(rel + "/")
+    for rel, state in scan.files.items():
+        path = addon_folder.joinpath(rel)
+        if ctx.cli.symlink_refs and (
+            os.path.islink(path) or any(rel.startswith(d) for d in linked)
+        ):
+            digest = fileio.reference_key(os.stat(path))
+        else:
+            digest = cache.hash(path)
+        _add("file", f"{rel}:{state.mode:o}:{digest}")
+
+    if save:
+        cache.save()
+    return hasher.hexdigest()
+
+
+def record_file(zip_path: Path) -> Path:
+    """Get the path of the file storing the fingerprint of the last build"""
+    return zip_path.parent.joinpath(stage.STATE_FOLDER, zip_path.name + ".fingerprint")
+
+
+def matches_last(zip_path: Path, fingerprint: str) -> bool:
+    """Check if the last successful build had the same fingerprint.
+
+    The archive must also be the same one that build
+    produced, so a changed or missing archive is rebuilt.
+    """
+    path = record_file(zip_path)
+    if not zip_path.exists() or not path.exists():
+        return False
+    try:
+        with open(path, "r") as f:
+            data = cast("dict[str, str]", json.load(f))
+        st = zip_path.stat()
+        return data["fingerprint"] == fingerprint and data["archive"] == (
+            f"{st.st_size}:{st.st_mtime_ns}"
+        )
+    except (ValueError, KeyError, TypeError):
+        return False
+
+
+def save_last(zip_path: Path, fingerprint: str) -> None:
+    """Record the fingerprint of a successful build"""
+    st = zip_path.stat()
+    data: dict[str, str] = {
+        "fingerprint": fingerprint,
+        "archive": f"{st.st_size}:{st.st_mtime_ns}",
+    }
+    path = record_file(zip_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f)
@@ -1,4 +1,5 @@
 import os
+import sys
 from enum import Enum
 from typing import Callable, Optional, Union, cast, get_type_hints
 
@@ -6,7 +7,7 @@ from rich.console import Console
 from typeguard import TypeCheckError, check_type
 
 from bpy_addon_build.api import BabContext, BpyError, BpyWarning
-from bpy_addon_build.build_context.core import WORKING_DIR, BuildContext
+from bpy_addon_build.build_context.core import BuildContext
 from bpy_addon_build.util import print_error, print_warning
 
 # Function signature of all hooks
@@ -116,7 +117,10 @@ def perform_returns(
     if res is not None:
         if isinstance(res, BpyError):
             print_error(res.msg, console)
-            quit(-1)
+
+            # This raises SystemExit instead of calling quit, which
+            # closes stdin, so the daemon can fail a single build
+            sys.exit(-1)
         elif isinstance(res, BpyWarning):
             print_error(res.msg, console)
 
@@ -162,9 +166,12 @@ def build_action_main(
         func: Union[ApiFunction, OldMain] = ctx.api.action_mods[action].main
         if check_api_func(MAIN, func, action, console) == APIFunc.NO_ARG:
             # Backwards compatibility
+            cwd = os.getcwd()
             os.chdir(api_ctx.current_path)
-            cast(OldMain, func)()
-            os.chdir(WORKING_DIR)
+            try:
+                cast(OldMain, func)()
+            finally:
+                os.chdir(cwd)
         else:
             res: Optional[Union[BpyError, BpyWarning]] = cast(ApiFunction, func)(
                 api_ctx
@@ -1,8 +1,11 @@
+import threading
 from pathlib import Path
 
+from bpy_addon_build import trace
 from bpy_addon_build.api import BabContext
 from bpy_addon_build.build_context.core import BuildContext, console
 from bpy_addon_build.build_context.hook_definitions import (
+    MAIN,
     build_action_cleanup,
     build_action_main,
     build_action_postinstall,
@@ -10,49 +13,86 @@ from bpy_addon_build.build_context.hook_definitions import (
     build_action_preinstall,
 )
 
+# Variants are built in parallel, but hooks may change the
+# working directory or share module state, so only one
+# chain of main hooks runs at a time
+HOOK_LOCK = threading.Lock()
+
 
 def run_prebuild_hooks(ctx: BuildContext) -> None:
     if len(ctx.api.actions_to_execute):
         cwd = Path(ctx.config_path.parent, ctx.config.addon_folder).expanduser()
         for k in ctx.api.actions_to_execute:
-            build_action_prebuild(
-                ctx, k, console, BabContext(cwd, ctx.config.build_extension, ctx.config)
-            )
+            with trace.span(f"pre_build {k}", "hook", action=k):
+                build_action_prebuild(
+                    ctx,
+                    k,
+                    console,
+                    BabContext(cwd, ctx.config.build_extension, ctx.config),
+                )
+
+
+def has_hook(ctx: BuildContext, hook: str) -> bool:
+    """Check if any action that will be executed has the given hook"""
+    return any(
+        hasattr(ctx.api.action_mods[k], hook)
+        for k in ctx.api.actions_to_execute
+        if k in ctx.api.action_mods
+    )
+
+
+def has_main_hooks(ctx: BuildContext) -> bool:
+    """Check if any action that will be executed has a main hook"""
+    return has_hook(ctx, MAIN)
 
 
 def run_main_hooks(ctx: BuildContext, stage_one: Path, addon_folder: Path) -> None:
     if len(ctx.api.actions_to_execute):
         cwd = stage_one.joinpath(addon_folder.name).expanduser()
-        for k in ctx.api.actions_to_execute:
-            build_action_main(
-                ctx, k, console, BabContext(cwd, ctx.config.build_extension, ctx.config)
-            )
+        with HOOK_LOCK:
+            for k in ctx.api.actions_to_execute:
+                with trace.span(f"main {k}", "hook", action=k):
+                    build_action_main(
+                        ctx,
+                        k,
+                        console,
+                        BabContext(cwd, ctx.config.build_extension, ctx.config),
+                    )
 
 
-def run_preinstall_hooks(ctx: BuildContext, zip_path: Path) -> None:
+def run_preinstall_hooks(ctx: BuildContext, zip_path: Path, version: str = "") -> None:
     if len(ctx.api.actions_to_execute):
         cwd = zip_path.expanduser().parent
         for k in ctx.api.actions_to_execute:
-            build_action_preinstall(
-                ctx, k, console, BabContext(cwd, ctx.config.build_extension, ctx.config)
-            )
+            with trace.span(f"pre_install {k}", "hook", action=k, version=version):
+                build_action_preinstall(
+                    ctx,
+                    k,
+                    console,
+                    BabContext(cwd, ctx.config.build_extension, ctx.config),
+                )
 
 
 def run_postinstall_hooks(ctx: BuildContext, v_path: Path) -> None:
     if len(ctx.api.actions_to_execute):
         for k in ctx.api.actions_to_execute:
-            build_action_postinstall(
-                ctx,
-                k,
-                console,
-                BabContext(v_path, ctx.config.build_extension, ctx.config),
-            )
+            with trace.span(f"post_install {k}", "hook", action=k, version=str(v_path)):
+                build_action_postinstall(
+                    ctx,
+                    k,
+                    console,
+                    BabContext(v_path, ctx.config.build_extension, ctx.config),
+                )
 
 
 def run_cleanup_hooks(ctx: BuildContext) -> None:
     if len(ctx.api.actions_to_execute):
         cwd = Path(ctx.config_path.parent, ctx.config.addon_folder).expanduser()
         for k in ctx.api.actions_to_execute:
-            build_action_cleanup(
-                ctx, k, console, BabContext(cwd, ctx.config.build_extension, ctx.config)
-            )
+            with trace.span(f"clean_up {k}", "hook", action=k):
+                build_action_cleanup(
+                    ctx,
+                    k,
+                    console,
+                    BabContext(cwd, ctx.config.build_extension, ctx.config),
+                )
@@ -1,12 +1,121 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
 import shutil
-from decimal import Decimal
+import stat
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union, cast
 
-from bpy_addon_build.build_context import hooks
-from bpy_addon_build.build_context.core import INSTALL_PATHS, BuildContext, console
+from attrs import define
+
+from bpy_addon_build import trace
+from bpy_addon_build.build_context import fileio, hooks, receipt, stage
+from bpy_addon_build.build_context.core import (
+    INSTALL_PATHS,
+    BuildContext,
+    console,
+    output_dir,
+)
+from bpy_addon_build.build_context.hook_definitions import POST_INSTALL, PRE_INSTALL
+from bpy_addon_build.util import print_warning
+
+# Folders next to installed addons that atomic installs
+# extract to, and keep the previous install in. Blender
+# skips folders starting with a dot when looking for addons
+STAGING_FOLDER = ".bab-staging"
+PREVIOUS_FOLDER = ".bab-previous"
+
+# Folder in build/ with the contents of the last
+# archive, which link and hardlink installs point to
+LINKED_FOLDER = "linked"
+
+# Folders Blender writes to in installed addons, which
+# sync installs leave alone so compiled modules stay valid
+KEPT_FOLDERS = receipt.UNTRACKED_FOLDERS
+
+
+# Folders of Blender versions in each of INSTALL_PATHS, by
+# the expanded path. A folder is only listed again when its
+# modification time changes, which happens when a version is
+# added or removed, so long running processes like the daemon
+# and watch mode still find new versions
+VERSION_INDEX: dict[str, tuple[int, dict[str, Path]]] = {}
+
+# Folders changed more recently than this are listed again
+RACY_TIME_NS = 2 * 10**9
+
+
+def version_key(version: Union[float, Decimal, str]) -> Optional[str]:
+    """Normalize a version, so that versions like 2.8 and 2.80,
+    or 3.1 and 3.10 from a range, match the same folder
+
+    version: Version to normalize, or the name of a folder
+
+    Returns:
+        - Version with two decimal places
+        - None if version isn't a version
+    """
+    try:
+        value = Decimal(str(version))
+    except InvalidOperation:
+        return None
+    if not value.is_finite() or value < 0:
+        return None
+    return format(value, ".2f")
+
+
+def _list_versions(root: str) -> dict[str, Path]:
+    try:
+        mtime = os.stat(root).st_mtime_ns
+    except OSError:
+        VERSION_INDEX.pop(root, None)
+        return {}
+    cached = VERSION_INDEX.get(root)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    found: dict[str, Path] = {}
+    try:
+        with os.scandir(root) as it:
+            names = sorted(entry.name for entry in it if entry.is_dir())
+    except OSError:
+        names = []
+    for name in names:
+        key = version_key(name)
+        if key is not None and key not in found:
+            found[key] = Path(root, name)
+    # Times can be coarser than a nanosecond, so a folder that just
+    # changed may change again without a new modification time
+    if time.time_ns() - mtime > RACY_TIME_NS:
+        VERSION_INDEX[root] = (mtime, found)
+    return found
+
+
+def version_index() -> list[dict[str, Path]]:
+    """
+    Get the Blender versions installed on this system
+
+    Each of INSTALL_PATHS is listed once, instead of
+    checking every version that may be installed
+
+    Returns:
+        For each of INSTALL_PATHS, normalized versions
+        from version_key mapped to their folders
+    """
+    return [_list_versions(os.path.expanduser(p)) for p in INSTALL_PATHS]
+
+
+def installed_versions() -> list[Decimal]:
+    """Get every Blender version installed on this system, in order"""
+    keys = {key for found in version_index() for key in found}
+    return sorted(Decimal(key) for key in keys)
 
 
 def get_paths(
@@ -17,24 +126,18 @@ def get_paths(
     Returns:
         - List[Path]: List of paths that exist
     """
+    index = version_index()
     paths: list[Path] = []
     for v in versions:
-        for p in INSTALL_PATHS:
-            path = Path(p, str(v)).expanduser()
-
-            # TODO: Figure out a way to clean up this logic
-            if not path.exists():
-                # For cases like 2.8, 2.9, etc, check with this method
-                path = Path(p, str(format(v, ".2f"))).expanduser()
-                if not path.exists():
-                    # For versions made by ranges
-                    path = Path(p, str(format(v, ".1f"))).expanduser()
-                    if not path.exists():
-                        continue
-            if is_extension and v >= +Decimal(4.2):
+        key = version_key(v)
+        for found in index:
+            if key is None or key not in found:
+                continue
+            path = found[key]
+            if is_extension and v >= Decimal("4.2"):
                 path = Path(path, "extensions/user_default")
                 paths.append(path)
-            elif is_extension and v < +Decimal(4.2):
+            elif is_extension and v < Decimal("4.2"):
                 # Don't install in earlier versions
                 pass
             else:
@@ -43,35 +146,483 @@ def get_paths(
     return paths
 
 
-def install(ctx: BuildContext, build_path: Path) -> None:
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@define  # type: ignore
+class SyncStats:
+    """Statistics of a sync install
+
+    Attributes
+    ----------
+    written: int
+        Number of files written
+
+    removed: int
+        Number of files and folders removed
+
+    unchanged: int
+        Number of files left as they were
+
+    bytes: int
+        Number of bytes written
     """
-    Installs the addon to the specified Blender
-    versions
+
+    written: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    bytes: int = 0
+
+
+def sync_state_file(ctx: BuildContext, path: Path) -> Path:
+    """Get the path of the file storing the CRCs
+    of the files a sync install left in path"""
+    digest = hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:16]
+    return output_dir(ctx).joinpath(stage.STATE_FOLDER, f"install-{digest}.json")
+
+
+def _load_known(path: Path) -> dict[str, list[int]]:
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r") as f:
+            return cast("dict[str, list[int]]", json.load(f))
+    except ValueError:
+        return {}
+
+
+def _save_known(path: Path, known: dict[str, list[int]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(known, f)
+
+
+def _remove(path: Path) -> None:
+    if path.is_symlink() or not path.is_dir():
+        path.unlink()
+    else:
+        shutil.rmtree(path)
+
+
+def sync_zip(
+    zip_path: Path, dest: Path, known: dict[str, list[int]], workers: int = 1
+) -> SyncStats:
+    """
+    Make a folder match an archive, only writing files that changed
+
+    A file is unchanged if it has the size and CRC-32 its member
+    has in the central directory. The CRCs of files on disk are
+    kept in known, so files that weren't touched since the last
+    sync aren't read again. Files and folders in the folders of
+    the archive that the archive doesn't have are removed, besides
+    __pycache__ folders. Nothing outside of the top level folders
+    of the archive is touched.
+
+    zip_path: Archive to install
+    dest: Folder to install to
+    known: Size, modification time, and CRC-32 of files in dest,
+        by path in the archive, which is updated
+    workers: Number of threads used to write files
+
+    Returns:
+        SyncStats of the install
+    """
+    stats = SyncStats()
+    files: dict[str, zipfile.ZipInfo] = {}
+    dirs: set[str] = set()
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            name = info.filename.rstrip("/")
+            if not len(name) or not fileio.is_safe_member(info.filename):
+                continue
+            if info.is_dir():
+                dirs.add(name)
+            else:
+                files[name] = info
+    for name in files:
+        parts = name.split("/")
+        dirs.update("/".join(parts[:i]) for i in range(1, len(parts)))
+
+    # Remove what isn't in the archive anymore
+    for root in sorted(d for d in dirs if "/" not in d):
+        root_path = dest.joinpath(root)
+        if root_path.is_symlink() or not root_path.is_dir():
+            continue
+        for dirpath, dirnames, filenames in os.walk(root_path):
+            rel_dir = Path(dirpath).relative_to(dest).as_posix()
+            kept: list[str] = []
+            for name in dirnames:
+                if name in KEPT_FOLDERS:
+                    continue
+                if f"{rel_dir}/{name}" in dirs:
+                    kept.append(name)
+                else:
+                    _remove(Path(dirpath, name))
+                    stats.removed += 1
+            dirnames[:] = kept
+            for name in filenames:
+                if f"{rel_dir}/{name}" not in files:
+                    os.unlink(os.path.join(dirpath, name))
+                    stats.removed += 1
+    for name in list(known):
+        if name not in files:
+            del known[name]
+
+    for name in sorted(dirs):
+        path = dest.joinpath(*name.split("/"))
+        if path.is_symlink() or (path.exists() and not path.is_dir()):
+            path.unlink()
+        path.mkdir(parents=True, exist_ok=True)
+
+    to_write: list[tuple[zipfile.ZipInfo, Path]] = []
+    for name, info in files.items():
+        target = dest.joinpath(*name.split("/"))
+        try:
+            st = os.lstat(target)
+        except FileNotFoundError:
+            to_write.append((info, target))
+            continue
+
+        if stat.S_ISREG(st.st_mode) and st.st_size == info.file_size:
+            entry = known.get(name)
+            if entry is not None and entry[:2] == [st.st_size, st.st_mtime_ns]:
+                crc = entry[2]
+            else:
+                crc = fileio.crc32_file(target)[0]
+            if crc == info.CRC:
+                known[name] = [st.st_size, st.st_mtime_ns, crc]
+                stats.unchanged += 1
+                continue
+
+        # Replace the file instead of writing to it,
+        # in case it's a hardlink to another file
+        _remove(target)
+        to_write.append((info, target))
+
+    stats.bytes = fileio.extract_members(zip_path, to_write, workers)
+    stats.written = len(to_write)
+    for info, target in to_write:
+        st = os.stat(target)
+        known[info.filename] = [st.st_size, st.st_mtime_ns, info.CRC]
+    return stats
+
+
+def install_targets(ctx: BuildContext) -> list[Path]:
+    """
+    Get the folders a build is installed to
 
     ctx: BuildContext
-    build_path: Path to the built addon
 
     Returns:
-        None
+        Folders that exist, in the order of the versions
     """
     if ctx.config.install_versions is None:
-        return
+        return []
     versions = (
         ctx.cli.versions if len(ctx.cli.versions) else ctx.config.install_versions
     )
+    if ctx.cli.all_installed is not None:
+        floor = (
+            Decimal(str(ctx.cli.all_installed))
+            if ctx.cli.all_installed > 0
+            else min(ctx.config.install_versions, default=Decimal(0))
+        )
+        versions = [v for v in installed_versions() if v >= floor]
 
     # For some weird reason, Mypy is complaining about
     # passing some argument of type object, but the versions
     # argument is correct...
-    for path in get_paths(versions, ctx.config.build_extension):  # type: ignore[arg-type]
+    paths = get_paths(versions, ctx.config.build_extension)  # type: ignore[arg-type]
+
+    # Overlapping versions, like 3.5+ and 3.0..3.5, find the
+    # same folder twice, which must only be installed to once
+    targets: list[Path] = []
+    for path in paths:
+        if path not in targets:
+            targets.append(path)
+    return targets
+
+
+def linked_folder(ctx: BuildContext) -> Path:
+    """Get the folder that link and hardlink installs point
+    to, which has the contents of the archive of the last build"""
+    return output_dir(ctx).resolve().joinpath(LINKED_FOLDER)
+
+
+def link_install(source: Path, addon_path: Path) -> bool:
+    """
+    Point an install at a folder with a symlink
+
+    An existing install is replaced in a single step
+    where possible, the same way swap_in does.
+
+    source: Folder the symlink points to
+    addon_path: Folder of the install
+
+    Returns:
+        - True if addon_path is a symlink to source
+        - False if symlinks can't be created, like on Windows
+          without developer mode, in which case nothing changed
+    """
+    if addon_path.is_symlink() and os.readlink(addon_path) == str(source):
+        return True
+    addon_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = addon_path.with_name(f".{addon_path.name}.bab-link")
+    if os.path.lexists(tmp):
+        _remove(tmp)
+    try:
+        os.symlink(source, tmp, target_is_directory=True)
+    except OSError:
+        return False
+
+    if not os.path.lexists(addon_path):
+        os.rename(tmp, addon_path)
+    elif addon_path.is_symlink() or not addon_path.is_dir():
+        os.replace(tmp, addon_path)
+    elif fileio.exchange(tmp, addon_path):
+        _remove(tmp)
+    else:
+        shutil.rmtree(addon_path)
+        os.rename(tmp, addon_path)
+    return True
+
+
+def install(ctx: BuildContext, build_path: Path) -> None:
+    """
+    Installs the addon to the specified Blender
+    versions
+
+    Targets are installed at the same time, with up to
+    --jobs threads that are split between removing old
+    installs and extracting members of the archive. With
+    --install-mode sync, old installs are updated with
+    sync_zip instead of being removed, and with atomic,
+    new installs are swapped in with swap_in. With link
+    and hardlink, the archive is only synced to
+    build/linked, and every install is a symlink to it or
+    made of hardlinks to its files. Every target runs its
+    pre_install hooks, is installed, and runs its post_install
+    hooks before the next target's hooks run, so hooks that
+    back up and restore a target always run in pairs. When
+    there are pre_install or post_install hooks, targets are
+    installed one at a time, in order, so output is the same
+    every time, and only the members of each archive are
+    extracted in parallel.
+
+    ctx: BuildContext
+    build_path: Path to the built addon
+
+    Returns:
+        None
+    """
+    targets = install_targets(ctx)
+    if not len(targets):
+        return
+
+    jobs = ctx.cli.jobs if ctx.cli.jobs is not None else stage.default_workers()
+    one_at_a_time = hooks.has_hook(ctx, PRE_INSTALL) or hooks.has_hook(
+        ctx, POST_INSTALL
+    )
+    concurrent = 1 if one_at_a_time else min(len(targets), jobs)
+    workers = max(1, jobs // concurrent)
+
+    # Every target links to the same folder,
+    # which is only updated once
+    linked = linked_folder(ctx)
+    if ctx.cli.install_mode in ["link", "hardlink"]:
+        _sync(ctx, build_path, linked, jobs)
+
+    name = ctx.config.build_name
+    artifact = receipt.read_artifact(build_path, name)
+
+    # Receipts store the SHA-256 of every file, which
+    # is only read from the archive once, and only if
+    # a target doesn't match its receipt
+    digests: list[dict[str, str]] = []
+    digests_lock = threading.Lock()
+
+    def _digests() -> dict[str, str]:
+        with digests_lock:
+            if not len(digests):
+                digests.append(receipt.member_digests(build_path, name))
+            return digests[0]
+
+    def _unpack(path: Path) -> None:
+        with trace.span("install", "install", version=str(path)) as install_span:
+            if receipt.matches(path, name, artifact, ctx.cli.install_mode):
+                install_span.set(skipped=True)
+                if ctx.cli.debug_mode:
+                    print("Skipped", path, "as its receipt matches")
+                return
+            _write(path)
+            receipt.write(path, name, artifact, ctx.cli.install_mode, _digests())
+
+    def _write(path: Path) -> None:
         addon_path = path.joinpath(Path(ctx.config.build_name))
+        if ctx.cli.install_mode == "link":
+            with trace.span("link", "install", version=str(path)):
+                if link_install(linked.joinpath(addon_path.name), addon_path):
+                    return
+            print_warning(
+                f"Could not create a symlink in {path}, syncing instead",
+                console,
+            )
+        if ctx.cli.install_mode == "hardlink":
+            _hardlink(linked.joinpath(addon_path.name), addon_path)
+            return
+        if ctx.cli.install_mode in ["sync", "link"]:
+            _sync(ctx, build_path, path, workers)
+            return
+        if ctx.cli.install_mode == "atomic":
+            _atomic(ctx, build_path, path, workers)
+            return
 
         # Remove previous install
-        if addon_path.exists():
-            shutil.rmtree(addon_path)
+        with trace.span("remove previous", "install"):
+            if os.path.lexists(addon_path):
+                _remove(addon_path)
+
+        with trace.span("unpack", "install", version=str(path)) as unpack_span:
+            files, size = fileio.extract_zip(build_path, path, workers)
+            unpack_span.set(files=files, bytes=size)
 
-        hooks.run_preinstall_hooks(ctx, build_path)
-        shutil.unpack_archive(build_path, path)
+    def _install_target(path: Path) -> None:
+        hooks.run_preinstall_hooks(ctx, build_path, str(path))
+        _unpack(path)
         if not ctx.cli.supress_messages:
             console.print(f"Installed to {str(path)}", style="green")
         hooks.run_postinstall_hooks(ctx, path)
+
+    if concurrent > 1:
+        with ThreadPoolExecutor(concurrent) as executor:
+            list(executor.map(_install_target, targets))
+    else:
+        for path in targets:
+            _install_target(path)
+
+
+def _sync(ctx: BuildContext, build_path: Path, path: Path, workers: int) -> None:
+    with trace.span("sync", "install", version=str(path)) as sync_span:
+        state = sync_state_file(ctx, path)
+        known = _load_known(state)
+        stats = sync_zip(build_path, path, known, workers)
+        _save_known(state, known)
+        sync_span.set(
+            written=stats.written,
+            removed=stats.removed,
+            unchanged=stats.unchanged,
+            bytes=stats.bytes,
+        )
+    if ctx.cli.debug_mode:
+        print(
+            "Wrote",
+            stats.written,
+            "files, removed",
+            stats.removed,
+            "unchanged",
+            stats.unchanged,
+        )
+
+
+def _hardlink(source: Path, addon_path: Path) -> None:
+    with trace.span("remove previous", "install"):
+        if os.path.lexists(addon_path):
+            _remove(addon_path)
+    with trace.span("link", "install", version=str(addon_path.parent)) as link_span:
+        linked, copied = fileio.link_tree(source, addon_path)
+        link_span.set(linked=linked, copied=copied)
+
+
+def swap_in(new: Path, addon_path: Path, previous: Path) -> bool:
+    """
+    Replace an install with a new one, keeping the old one
+
+    Where the filesystem supports it, both are swapped in
+    a single step, so Blender always sees a complete addon.
+    Otherwise, like on macOS, Windows, or NFS, the addon is
+    missing for the time between two renames, instead of for
+    the whole install, so the swap isn't atomic.
+
+    new: Folder with the new install, next to addon_path
+    addon_path: Folder of the install
+    previous: Where to move the old install to, which is replaced
+
+    Returns:
+        - True if there was no moment without an install
+        - False if the install was missing between two renames
+    """
+    if os.path.lexists(previous):
+        _remove(previous)
+    previous.parent.mkdir(parents=True, exist_ok=True)
+    if not os.path.lexists(addon_path):
+        os.rename(new, addon_path)
+    elif fileio.exchange(new, addon_path):
+        os.rename(new, previous)
+    else:
+        os.rename(addon_path, previous)
+        os.rename(new, addon_path)
+        return False
+    return True
+
+
+def _atomic(ctx: BuildContext, build_path: Path, path: Path, workers: int) -> None:
+    name = ctx.config.build_name
+    staging = path.joinpath(STAGING_FOLDER)
+    new = staging.joinpath(name)
+    if os.path.lexists(new):
+        _remove(new)
+    with trace.span("unpack", "install", version=str(path)) as unpack_span:
+        files, size = fileio.extract_zip(build_path, staging, workers)
+        unpack_span.set(files=files, bytes=size)
+    with trace.span("swap", "install", version=str(path)):
+        atomic = swap_in(new, path.joinpath(name), path.joinpath(PREVIOUS_FOLDER, name))
+    if not atomic:
+        print_warning(
+            f"Could not swap the install in {path} in a single step, "
+            + "it was missing for a moment",
+            console,
+        )
+    try:
+        staging.rmdir()
+    except OSError:
+        pass
+
+
+def rollback(ctx: BuildContext) -> list[Path]:
+    """
+    Swap the installs of a build with the ones they
+    replaced in the last atomic install
+
+    The current installs become the previous ones,
+    so rolling back again undoes the rollback.
+
+    ctx: BuildContext
+
+    Returns:
+        Folders that were rolled back
+    """
+    name = ctx.config.build_name
+    rolled_back: list[Path] = []
+    for path in install_targets(ctx):
+        addon_path = path.joinpath(name)
+        previous = path.joinpath(PREVIOUS_FOLDER, name)
+        if not os.path.lexists(previous):
+            continue
+        if not os.path.lexists(addon_path):
+            os.rename(previous, addon_path)
+        elif not fileio.exchange(previous, addon_path):
+            tmp = path.joinpath(STAGING_FOLDER, name)
+            if os.path.lexists(tmp):
+                _remove(tmp)
+            tmp.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(addon_path, tmp)
+            os.rename(previous, addon_path)
+            os.rename(tmp, previous)
+            tmp.parent.rmdir()
+
+        # The CRCs of sync installs and the
+        # receipt don't match anymore
+        stage.forget(sync_state_file(ctx, path))
+        receipt.forget(path, name)
+        rolled_back.append(path)
+    return rolled_back
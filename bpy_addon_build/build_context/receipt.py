@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import zipfile
+from pathlib import Path
+from typing import Optional, Union, cast
+
+from attrs import frozen
+
+from bpy_addon_build.build_context import fileio
+
+# Folder next to installed addons with a receipt for each
+# of them. Blender skips folders starting with a dot
+RECEIPT_FOLDER = ".bab-receipts"
+
+# Folders Blender writes to in installed addons,
+# which aren't checked against receipts
+UNTRACKED_FOLDERS = {"__pycache__"}
+
+# Bump this when the layout of receipts changes
+RECEIPT_VERSION = 2
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class Artifact:
+    """
+    Files of a built archive, read from its central directory
+
+    Attributes
+    ----------
+    fingerprint: str
+        Hash of the name, size, and CRC-32 of every member,
+        which only changes when the contents do
+
+    files: dict[str, list[int]]
+        Relative paths in the addon, mapped to
+        the size and CRC-32 of the file
+    """
+
+    fingerprint: str
+    files: dict[str, list[int]]
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class Receipt:
+    """
+    What an install wrote, kept next to the install
+
+    Attributes
+    ----------
+    fingerprint: str
+        Fingerprint of the Artifact that was installed
+
+    mode: str
+        Install mode that was used
+
+    files: dict[str, list[int]]
+        Relative paths in the addon, mapped to the size,
+        modification time, and CRC-32 of the installed file
+
+    digests: dict[str, str]
+        Relative paths in the addon, mapped to the
+        SHA-256 of the installed file
+    """
+
+    fingerprint: str
+    mode: str
+    files: dict[str, list[int]]
+    digests: dict[str, str]
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class Drift:
+    """
+    Files of an install that don't match its receipt
+
+    Attributes
+    ----------
+    changed: list[str]
+        Relative paths of files with other contents
+
+    missing: list[str]
+        Relative paths of files that were removed
+
+    added: list[str]
+        Relative paths of files that weren't installed
+    """
+
+    changed: list[str]
+    missing: list[str]
+    added: list[str]
+
+    def clean(self) -> bool:
+        return not len(self.changed) and not len(self.missing) and not len(self.added)
+
+
+def read_artifact(zip_path: Path, build_name: str) -> Artifact:
+    """
+    Get the files of an archive without extracting it
+
+    zip_path: Path to the archive
+    build_name: Folder of the addon in the archive
+
+    Returns:
+        Artifact
+    """
+    prefix = build_name + "/"
+    hasher = hashlib.sha256()
+    files: dict[str, list[int]] = {}
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in sorted(zf.infolist(), key=_member_name):
+            if info.is_dir() or not fileio.is_safe_member(info.filename):
+                continue
+            hasher.update(f"{info.filename}:{info.file_size}:{info.CRC}\n".encode())
+            if info.filename.startswith(prefix):
+                files[info.filename[len(prefix) :]] = [info.file_size, info.CRC]
+    return Artifact(hasher.hexdigest(), files)
+
+
+def _member_name(info: zipfile.ZipInfo) -> str:
+    return info.filename
+
+
+def member_digests(zip_path: Path, build_name: str) -> dict[str, str]:
+    """
+    Get the SHA-256 of every file of an archive
+
+    Members are decompressed in chunks, so this
+    reads the whole archive once
+
+    zip_path: Path to the archive
+    build_name: Folder of the addon in the archive
+
+    Returns:
+        Relative paths in the addon, mapped to
+        the SHA-256 of their contents
+    """
+    prefix = build_name + "/"
+    digests: dict[str, str] = {}
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not info.filename.startswith(prefix):
+                continue
+            if not fileio.is_safe_member(info.filename):
+                continue
+            hasher = hashlib.sha256()
+            with zf.open(info) as f:
+                while True:
+                    chunk = f.read(fileio.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+            digests[info.filename[len(prefix) :]] = hasher.hexdigest()
+    return digests
+
+
+def receipt_file(path: Path, build_name: str) -> Path:
+    """Get the path of the receipt of an install
+
+    path: Folder the addon is installed in
+    build_name: Name of the addon
+    """
+    return path.joinpath(RECEIPT_FOLDER, build_name + ".json")
+
+
+def load(path: Path, build_name: str) -> Optional[Receipt]:
+    """
+    Read the receipt of an install
+
+    path: Folder the addon is installed in
+    build_name: Name of the addon
+
+    Returns:
+        - Receipt if there's a valid one
+        - None otherwise
+    """
+    file = receipt_file(path, build_name)
+    if not file.exists():
+        return None
+    try:
+        with open(file, "r") as f:
+            data = cast(
+                "dict[str, Union[int, str, dict[str, list[int]], dict[str, str]]]",
+                json.load(f),
+            )
+        if data["version"] != RECEIPT_VERSION:
+            return None
+        return Receipt(
+            cast(str, data["fingerprint"]),
+            cast(str, data["mode"]),
+            cast("dict[str, list[int]]", data["files"]),
+            cast("dict[str, str]", data["digests"]),
+        )
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def write(
+    path: Path,
+    build_name: str,
+    artifact: Artifact,
+    mode: str,
+    digests: dict[str, str],
+) -> None:
+    """
+    Write the receipt of an install that was just made
+
+    Only files of the archive are listed, with the
+    size and modification time they have now
+
+    path: Folder the addon is installed in
+    build_name: Name of the addon
+    artifact: Archive that was installed
+    mode: Install mode that was used
+    digests: SHA-256 of the files of the archive,
+        from member_digests
+
+    Returns:
+        None
+    """
+    addon_path = path.joinpath(build_name)
+    files: dict[str, list[int]] = {}
+    for rel, (size, crc) in artifact.files.items():
+        try:
+            st = os.stat(addon_path.joinpath(*rel.split("/")))
+        except FileNotFoundError:
+            continue
+        files[rel] = [st.st_size, st.st_mtime_ns, crc]
+
+    data: dict[str, Union[int, str, dict[str, list[int]], dict[str, str]]] = {
+        "version": RECEIPT_VERSION,
+        "fingerprint": artifact.fingerprint,
+        "mode": mode,
+        "files": files,
+        "digests": {rel: digests[rel] for rel in files if rel in digests},
+    }
+    file = receipt_file(path, build_name)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = file.with_name(file.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, file)
+
+
+def forget(path: Path, build_name: str) -> None:
+    """Remove the receipt of an install, if it has one"""
+    file = receipt_file(path, build_name)
+    if file.exists():
+        file.unlink()
+    try:
+        file.parent.rmdir()
+    except OSError:
+        pass
+
+
+def check(addon_path: Path, receipt: Receipt) -> Drift:
+    """
+    Compare an install with its receipt
+
+    Files are compared by their size and modification
+    time, and only read to compare their SHA-256 if the
+    size is the same but the time isn't. The install is
+    walked once to find files that weren't installed,
+    besides the ones in UNTRACKED_FOLDERS
+
+    addon_path: Folder of the install
+    receipt: Receipt of the install
+
+    Returns:
+        Drift
+    """
+    changed: list[str] = []
+    missing: list[str] = []
+    added: list[str] = []
+    for dirpath, dirnames, filenames in os.walk(addon_path):
+        dirnames[:] = [d for d in dirnames if d not in UNTRACKED_FOLDERS]
+        rel_dir = Path(dirpath).relative_to(addon_path).as_posix()
+        for name in filenames:
+            rel = name if rel_dir == "." else f"{rel_dir}/{name}"
+            if rel not in receipt.files:
+                added.append(rel)
+
+    for rel, (size, mtime_ns, _) in receipt.files.items():
+        path = addon_path.joinpath(*rel.split("/"))
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            missing.append(rel)
+            continue
+        if st.st_size != size:
+            changed.append(rel)
+        elif st.st_mtime_ns != mtime_ns:
+            if fileio.hash_file(path) != receipt.digests.get(rel):
+                changed.append(rel)
+    return Drift(sorted(changed), sorted(missing), sorted(added))
+
+
+def matches(path: Path, build_name: str, artifact: Artifact, mode: str) -> bool:
+    """
+    Check if an install is already the given archive
+
+    path: Folder the addon is installed in
+    build_name: Name of the addon
+    artifact: Archive to install
+    mode: Install mode to use
+
+    Returns:
+        True if the install has a receipt for the same archive
+        and mode, and no file was changed, removed, or added since
+    """
+    installed = load(path, build_name)
+    return (
+        installed is not None
+        and installed.fingerprint == artifact.fingerprint
+        and installed.mode == mode
+        and len(installed.files) == len(artifact.files)
+        and check(path.joinpath(build_name), installed).clean()
+    )
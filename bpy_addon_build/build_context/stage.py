@@ -0,0 +1,597 @@
+from __future__ import annotations
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, cast
+
+from attrs import define, field, frozen
+
+from bpy_addon_build.build_context import fileio
+from lib_bpybuild_ext.ignore import IgnoreMatcher
+
+# Folder inside of build/ used to keep
+# state between builds
+STATE_FOLDER = ".bab"
+
+# Default folder for tmpfs stages, which
+# is backed by memory on most Linux systems
+SHM_FOLDER = Path("/dev/shm")
+
+# ioctl from linux/fs.h that makes a file share
+# the extents of another, used for reflinks
+FICLONE = 0x40049409
+
+# Errors raised when a filesystem can't link or
+# clone a file, in which case the file is copied
+LINK_ERRORS = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EMLINK,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.ENOSYS,
+}
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class FileState:
+    """Stat information used to check if a file changed
+
+    Attributes
+    ----------
+    size: int
+        Size of the file in bytes
+
+    mtime_ns: int
+        Modification time in nanoseconds
+
+    mode: int
+        Permission bits of the file
+    """
+
+    size: int
+    mtime_ns: int
+    mode: int
+
+    @classmethod
+    def from_stat(cls, st: os.stat_result) -> FileState:
+        return cls(st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode))
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class TreeScan:
+    """Result of walking a folder with ignore filters applied
+
+    Attributes
+    ----------
+    files: dict[str, FileState]
+        Relative POSIX paths of all files, mapped to their state
+
+    dirs: list[str]
+        Relative POSIX paths of all folders, parents first
+    """
+
+    files: dict[str, FileState]
+    dirs: list[str]
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@define  # type: ignore
+class CopyStats:
+    """Statistics of a sync, mostly for debugging
+
+    Attributes
+    ----------
+    files: int
+        Number of files copied
+
+    bytes: int
+        Number of bytes copied
+
+    removed: int
+        Number of files and folders removed from the destination
+
+    staged: dict[str, tuple[int, int, int, int]]
+        Stat information of every file in the destination after
+        the sync, used by find_touched
+
+    linked: dict[str, int]
+        Files in the destination that are hardlinks to the
+        source, mapped to their permission bits
+    """
+
+    files: int = 0
+    bytes: int = 0
+    removed: int = 0
+    staged: dict[str, tuple[int, int, int, int]] = field(factory=dict)
+    linked: dict[str, int] = field(factory=dict)
+
+
+def _join(rel_dir: str, name: str) -> str:
+    return name if rel_dir == "" else f"{rel_dir}/{name}"
+
+
+def _rel(root: Path, path: str) -> str:
+    rel = os.path.relpath(path, root)
+    return "" if rel == "." else Path(rel).as_posix()
+
+
+# The inode and ctime allow us to tell if a main hook
+# touched a file, even if the hook restored the size
+# and modification time afterwards
+def staged_state(st: os.stat_result) -> tuple[int, int, int, int]:
+    return (st.st_ino, st.st_ctime_ns, st.st_mtime_ns, st.st_size)
+
+
+def scan_tree(root: Path, ignore: Optional[IgnoreMatcher] = None) -> TreeScan:
+    """Walk a folder and record the state of every file.
+
+    Symlinks are followed, and ignored folders are never
+    entered, which matches what shutil.copytree does.
+
+    root: Folder to walk
+    ignore: Patterns of paths to ignore, relative to root
+
+    Returns:
+        TreeScan of the folder
+    """
+    files: dict[str, FileState] = {}
+    dirs: list[str] = []
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        rel_dir = _rel(root, dirpath)
+        if ignore is not None:
+            filenames = ignore.prune(rel_dir, dirnames, filenames)
+
+        # Sort in place so os.walk visits folders in
+        # a stable order, keeping parents before children
+        dirnames.sort()
+        for name in dirnames:
+            dirs.append(_join(rel_dir, name))
+        for name in sorted(filenames):
+            st = os.stat(os.path.join(dirpath, name))
+            files[_join(rel_dir, name)] = FileState.from_stat(st)
+    return TreeScan(files, dirs)
+
+
+def scan_shared(root: Path, ignores: list[IgnoreMatcher]) -> TreeScan:
+    """Walk a folder once for several builds with different ignore filters.
+
+    Only paths ignored by every build are skipped, so the result
+    contains everything any of the builds needs. Use filter_scan
+    to get the scan of a single build.
+
+    root: Folder to walk
+    ignores: Patterns of every build, relative to root
+
+    Returns:
+        TreeScan of the folder
+    """
+    if len(ignores) == 1:
+        return scan_tree(root, ignores[0])
+
+    files: dict[str, FileState] = {}
+    dirs: list[str] = []
+
+    # Indices of the builds that ignore each folder,
+    # as ignored folders exclude everything in them
+    excluded: dict[str, frozenset[int]] = {"": frozenset()}
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        rel_dir = _rel(root, dirpath)
+        parent = excluded[rel_dir]
+
+        def _excluded_by(rel: str, is_dir: bool) -> frozenset[int]:
+            return parent | {
+                i
+                for i, ignore in enumerate(ignores)
+                if i not in parent and ignore.match(rel, is_dir)
+            }
+
+        kept: list[str] = []
+        for name in dirnames:
+            rel = _join(rel_dir, name)
+            excluded[rel] = _excluded_by(rel, True)
+            if len(excluded[rel]) < len(ignores):
+                kept.append(name)
+        dirnames[:] = sorted(kept)
+        dirs.extend(_join(rel_dir, name) for name in dirnames)
+
+        for name in sorted(filenames):
+            rel = _join(rel_dir, name)
+            if len(_excluded_by(rel, False)) < len(ignores):
+                st = os.stat(os.path.join(dirpath, name))
+                files[rel] = FileState.from_stat(st)
+    return TreeScan(files, dirs)
+
+
+def filter_scan(scan: TreeScan, ignore: IgnoreMatcher) -> TreeScan:
+    """Apply ignore filters to a scan from scan_shared.
+
+    scan: Scan to filter
+    ignore: Patterns of paths to ignore
+
+    Returns:
+        TreeScan with the same contents as scan_tree with ignore
+    """
+    if not ignore:
+        return scan
+
+    # Folders come before their contents, so a
+    # folder is always checked before its children
+    removed: set[str] = set()
+    dirs: list[str] = []
+    for rel in scan.dirs:
+        parent = rel.rpartition("/")[0]
+        if parent in removed or ignore.match(rel, True):
+            removed.add(rel)
+        else:
+            dirs.append(rel)
+    files = {
+        rel: state
+        for rel, state in scan.files.items()
+        if rel.rpartition("/")[0] not in removed and not ignore.match(rel)
+    }
+    return TreeScan(files, dirs)
+
+
+def _remove(path: str) -> None:
+    if os.path.islink(path) or not os.path.isdir(path):
+        os.unlink(path)
+    else:
+        shutil.rmtree(path)
+
+
+def scratch_root(root: Optional[Path] = None) -> Path:
+    """Get the folder tmpfs stages are kept in.
+
+    root: Folder passed with --scratch-root, if any
+
+    Returns:
+        root if it was passed, otherwise /dev/shm if
+        it exists, otherwise the temporary folder
+    """
+    if root is not None:
+        return root
+    if SHM_FOLDER.is_dir() and os.access(SHM_FOLDER, os.W_OK):
+        return SHM_FOLDER
+    return Path(tempfile.gettempdir())
+
+
+def scratch_stage(root: Path, build_dir: Path, stage_dir: Path) -> Path:
+    """Get the path of a stage folder in a scratch root.
+
+    Every build folder gets its own folder in
+    root, so projects never share a stage.
+
+    root: Scratch root
+    build_dir: Build folder the stage belongs to
+    stage_dir: Path of the stage folder on disk
+
+    Returns:
+        Path of the stage folder in root
+    """
+    digest = hashlib.sha256(str(build_dir.resolve()).encode()).hexdigest()[:16]
+    return root.joinpath("bpy-build", digest, "tmpfs-" + stage_dir.name)
+
+
+def fits_in_scratch(root: Path, scan: TreeScan, limit: int) -> bool:
+    """Check if the files of a scan fit in a scratch root.
+
+    Main hooks can add files to the stage, so the
+    files must fit in half of the free space as well.
+
+    root: Scratch root
+    scan: Files that will be copied to the stage
+    limit: Maximum size of the files in bytes, where
+        0 means the stage is always kept on disk
+
+    Returns:
+        True if the stage can be kept in root
+    """
+    size = sum(state.size for state in scan.files.values())
+    if limit == 0 or size > limit:
+        return False
+    try:
+        root.mkdir(parents=True, exist_ok=True)
+        return size <= shutil.disk_usage(root).free // 2
+    except OSError:
+        return False
+
+
+def default_workers() -> int:
+    """Get the default number of workers for I/O bound work.
+
+    This is the same default ThreadPoolExecutor uses.
+    """
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def reflink(src: str, dst: str) -> bool:
+    """Clone a file, sharing its data until either copy is written.
+
+    This is only supported on Linux, with filesystems
+    like Btrfs and XFS. File metadata is not copied.
+
+    src: File to clone
+    dst: Path of the clone, which must not exist
+
+    Returns:
+        - True if the file was cloned
+        - False if cloning isn't supported, in which case dst doesn't exist
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    with open(src, "rb") as fsrc:
+        fdst = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            fcntl.ioctl(fdst, FICLONE, fsrc.fileno())
+        except OSError as e:
+            os.close(fdst)
+            os.unlink(dst)
+            if e.errno in LINK_ERRORS:
+                return False
+            raise
+        os.close(fdst)
+    return True
+
+
+def _place_file(src: str, dst: str, mode: str) -> bool:
+    """Put a copy of src at dst, using the given stage mode.
+
+    Falls back to a regular copy if the filesystem
+    can't hardlink or reflink the file.
+
+    Returns:
+        True if dst is a hardlink to src
+    """
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return True
+        except OSError as e:
+            if e.errno not in LINK_ERRORS:
+                raise
+    elif mode == "reflink" and reflink(src, dst):
+        shutil.copystat(src, dst)
+        return False
+    fileio.copy_file_with_stat(src, dst)
+    return False
+
+
+def sync_tree(
+    src: Path,
+    scan: TreeScan,
+    dst: Path,
+    force: set[str],
+    workers: int = 1,
+    mode: str = "copy",
+) -> CopyStats:
+    """Make dst identical to what copying scan from src would produce.
+
+    Files are only copied when they're missing, when their
+    size, modification time, or permissions differ from the
+    source, or when they're in force. Anything in dst that's
+    not in scan is removed.
+
+    src: Source folder that was scanned
+    scan: Scan of the source folder
+    dst: Destination folder
+    force: Relative paths that must be copied regardless of state
+    workers: Number of threads used to copy files
+    mode: How files are placed in dst, either copy, hardlink, or reflink
+
+    Returns:
+        CopyStats of the sync
+    """
+    stats = CopyStats()
+
+    # If the destination is new, there's nothing
+    # to compare against, which saves a stat per file
+    fresh = not dst.exists()
+    if not fresh:
+        with os.scandir(dst) as it:
+            fresh = next(it, None) is None
+    dst.mkdir(parents=True, exist_ok=True)
+    wanted_dirs = set(scan.dirs)
+
+    # Remove anything a fresh copy wouldn't have
+    for dirpath, dirnames, filenames in os.walk(dst):
+        rel_dir = _rel(dst, dirpath)
+        for name in list(dirnames):
+            full = os.path.join(dirpath, name)
+            if _join(rel_dir, name) not in wanted_dirs or os.path.islink(full):
+                _remove(full)
+                dirnames.remove(name)
+                stats.removed += 1
+        for name in filenames:
+            if _join(rel_dir, name) not in scan.files:
+                os.unlink(os.path.join(dirpath, name))
+                stats.removed += 1
+
+    # scan.dirs has parents before children,
+    # so we don't need parents=True here
+    for rel in scan.dirs:
+        dst.joinpath(rel).mkdir(exist_ok=True)
+
+    src_str = str(src)
+    dst_str = str(dst)
+
+    def _sync_file(
+        rel: str, state: FileState
+    ) -> tuple[bool, tuple[int, int, int, int], bool]:
+        # Plain strings are used here as pathlib adds
+        # noticeable overhead with tens of thousands of files
+        source = os.path.join(src_str, rel)
+        target = os.path.join(dst_str, rel)
+        st: Optional[os.stat_result] = None
+        if not fresh:
+            try:
+                st = os.lstat(target)
+            except FileNotFoundError:
+                pass
+        if (
+            st is not None
+            and rel not in force
+            and stat.S_ISREG(st.st_mode)
+            and FileState.from_stat(st) == state
+        ):
+            # A hardlink has the same state as the source, so we
+            # still need to know if it's one, and other modes must
+            # replace it, as the file may be written to
+            linked = st.st_nlink > 1 and os.path.samestat(st, os.stat(source))
+            if mode == "hardlink" or not linked:
+                return False, staged_state(st), linked
+
+        # Unlink first, as the old file may be
+        # read only or share an inode with something
+        if st is not None:
+            os.unlink(target)
+        linked = _place_file(source, target, mode)
+        return True, staged_state(os.lstat(target)), linked
+
+    # Copying is mostly waiting on I/O, which releases
+    # the GIL, so threads are enough to keep the disk busy
+    items = list(scan.files.items())
+    if workers > 1 and len(items) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda item: _sync_file(*item), items))
+    else:
+        results = [_sync_file(rel, state) for rel, state in items]
+
+    for (rel, state), (copied, staged, linked) in zip(items, results):
+        stats.staged[rel] = staged
+        if linked:
+            stats.linked[rel] = state.mode
+        if copied:
+            stats.files += 1
+            stats.bytes += state.size
+
+    # Copy folder metadata last, children first, as
+    # copying files changes the modification time
+    for rel in reversed(scan.dirs):
+        shutil.copystat(src.joinpath(rel), dst.joinpath(rel))
+    shutil.copystat(src, dst)
+    return stats
+
+
+def find_touched(dst: Path, staged: dict[str, tuple[int, int, int, int]]) -> set[str]:
+    """Find files in dst that were changed or created after a sync.
+
+    dst: Destination folder of the sync
+    staged: CopyStats.staged from the sync
+
+    Returns:
+        Relative paths of all touched files
+    """
+    touched: set[str] = set()
+    for dirpath, _, filenames in os.walk(dst):
+        rel_dir = _rel(dst, dirpath)
+        for name in filenames:
+            rel = _join(rel_dir, name)
+            st = os.lstat(os.path.join(dirpath, name))
+            if staged.get(rel) != staged_state(st):
+                touched.add(rel)
+    return touched
+
+
+def state_file(build_dir: Path, stage_dir: Path) -> Path:
+    """Get the path of the file storing the state of a stage folder"""
+    return build_dir.joinpath(STATE_FOLDER, stage_dir.name + ".json")
+
+
+def load_touched(path: Path) -> Optional[set[str]]:
+    """Load the files touched by main hooks in the last build.
+
+    Returns:
+        - Set of relative paths if the state exists
+        - None if the stage can't be trusted and must be recreated
+    """
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r") as f:
+            data = cast("dict[str, list[str]]", json.load(f))
+        return set(data["touched"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def save_touched(path: Path, touched: set[str]) -> None:
+    """Save the files touched by main hooks for the next build"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data: dict[str, list[str]] = {"touched": sorted(touched)}
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def sources_file(zip_path: Path) -> Path:
+    """Get the path of the file storing the scan an archive was built from"""
+    return zip_path.parent.joinpath(STATE_FOLDER, zip_path.name + ".sources.json")
+
+
+def save_scan(path: Path, scan: TreeScan) -> None:
+    """Save a scan, so later runs can tell what changed since"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data: dict[str, object] = {
+        "files": {
+            rel: [state.size, state.mtime_ns, state.mode]
+            for rel, state in scan.files.items()
+        },
+        "dirs": scan.dirs,
+    }
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def load_scan(path: Path) -> Optional[TreeScan]:
+    """Load a scan saved by save_scan.
+
+    Returns:
+        - TreeScan if the scan exists
+        - None otherwise
+    """
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r") as f:
+            data = cast("dict[str, dict[str, list[int]]]", json.load(f))
+        files = {rel: FileState(*state) for rel, state in data["files"].items()}
+        return TreeScan(files, cast("list[str]", data["dirs"]))
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def forget(path: Path) -> None:
+    """Remove the state of a stage folder, forcing a full copy next build"""
+    if path.exists():
+        path.unlink()
+
+
+def clear_extra(stage_dir: Path, keep: str) -> None:
+    """Remove everything in a stage folder besides keep.
+
+    This prevents leftovers, like a folder from an old
+    build_name, from ending up in the final archive.
+    """
+    with os.scandir(stage_dir) as it:
+        extra = [entry.path for entry in it if entry.name != keep]
+    for path in extra:
+        _remove(path)
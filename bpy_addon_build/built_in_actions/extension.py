@@ -34,6 +34,7 @@ from pathlib import Path
 
 from bpy_addon_build.api import BabContext
 from lib_bpybuild_ext import BLENDER_MANIFEST, compat, get_manifest_data, verify
+from lib_bpybuild_ext.ignore import IgnoreMatcher
 
 
 def main(ctx: BabContext) -> None:
@@ -42,4 +43,11 @@ def main(ctx: BabContext) -> None:
     manifest_path = Path(ctx.current_path, BLENDER_MANIFEST)
     manifest_data = get_manifest_data(manifest_path)
     verify.verify_manifest(manifest_data, manifest_path)
-    compat.check_for_compat_issues(ctx.current_path, ctx.builtin_config.addon_folder)
+    excludes = (
+        manifest_data.build.get("paths_exclude_pattern", [])
+        if manifest_data.build is not None
+        else []
+    )
+    compat.check_for_compat_issues(
+        ctx.current_path, ctx.builtin_config.addon_folder, IgnoreMatcher(excludes)
+    )
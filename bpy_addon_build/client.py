@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional, cast
+
+# This module must only import from the standard library, as
+# it's imported before anything else when forwarding a build
+
+
+def socket_path() -> Path:
+    """Get the path of the daemon's socket, which is unique per user"""
+    folder = os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return Path(folder, f"bpy-build-{uid}.sock")
+
+
+def forward(argv: list[str], path: Optional[Path] = None) -> Optional[int]:
+    """
+    Forward a build to the daemon, and print its output as it comes in
+
+    argv: Arguments without the program name
+    path: Path of the socket, by default socket_path()
+
+    Returns:
+        - Exit code of the build
+        - None if no daemon is running, in which case
+          the caller should build by itself
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path if path is not None else socket_path()))
+    except OSError:
+        sock.close()
+        return None
+
+    with sock, sock.makefile("rb") as reader:
+        # The build uses this environment, like HOME to find
+        # Blender, instead of the one the daemon started with
+        request: dict[str, object] = {
+            "argv": argv,
+            "cwd": os.getcwd(),
+            "env": dict(os.environ),
+        }
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        for line in reader:
+            message = cast("dict[str, str]", json.loads(line))
+            if "out" in message:
+                sys.stdout.write(message["out"])
+                sys.stdout.flush()
+            elif "err" in message:
+                sys.stderr.write(message["err"])
+                sys.stderr.flush()
+            elif "exit" in message:
+                return int(message["exit"])
+
+    # The daemon stopped in the middle of the build
+    print("Lost connection to the daemon", file=sys.stderr)
+    return 1
@@ -24,6 +24,20 @@ SCRIPT: Literal["script"] = "script"
 IGNORE_FILTERS: Literal["ignore_filters"] = "ignore_filters"
 DEPENDS_ON: Literal["depends_on"] = "depends_on"
 
+# Compression
+COMPRESSION: Literal["compression"] = "compression"
+METHOD: Literal["method"] = "method"
+LEVEL: Literal["level"] = "level"
+
+# Supported compression methods, mapped
+# to the valid range of levels, if any
+COMPRESSION_METHODS: dict[str, Optional[tuple[int, int]]] = {
+    "store": None,
+    "deflate": (0, 9),
+    "bzip2": (1, 9),
+    "lzma": None,
+}
+
 # Extension Settings
 EXTENSION_SETTINGS: Literal["extension_settings"] = "extension_settings"
 BUILD_LEGACY: Literal["build_legacy"] = "build_legacy"
@@ -53,6 +67,13 @@ class ExtensionSettingsDict(TypedDict):
     remove_bl_info: NotRequired[bool]
 
 
+class CompressionRuleDict(TypedDict):
+    """TypeDict version of CompressionRule"""
+
+    method: str
+    level: NotRequired[int]
+
+
 class ConfigDict(TypedDict):
     """TypeDict version of Config"""
 
@@ -62,6 +83,7 @@ class ConfigDict(TypedDict):
     extension_settings: NotRequired[ExtensionSettingsDict]
     install_versions: NotRequired[list[Union[float, str]]]
     build_actions: NotRequired[dict[str, Optional[BuildActionDict]]]
+    compression: NotRequired[dict[str, Union[str, CompressionRuleDict]]]
 
 
 # Must be ignored to pass Mypy as this has
@@ -86,6 +108,31 @@ class BuildAction:
     depends_on: Optional[list[str]] = None
 
 
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class CompressionRule:
+    """Class that represents how to compress matching files
+
+    Attributes
+    ----------
+    pattern: str
+        Pattern of the files this rule applies to, with
+        the same rules as ignore_filters
+
+    method: str
+        One of store, deflate, bzip2, or lzma
+
+    level: Optional[int]
+        Compression level, if the method supports it
+    """
+
+    pattern: str
+    method: str
+    level: Optional[int] = None
+
+
 BUILT_IN_ACTIONS_FOLDER = Path(__file__).parent.joinpath("built_in_actions")
 BUILT_IN_ACTS = {
     "extension": BuildAction(str(BUILT_IN_ACTIONS_FOLDER.joinpath("extension.py")))
@@ -145,6 +192,14 @@ class Config:
 
     actions: Optional[Dict[str, BuildAction]]
         All actions that can occur during the build
+
+    additional_actions: list[str]
+        Actions that are always executed, like the
+        built-in extension action
+
+    compression: Optional[List[CompressionRule]]
+        How to compress files in the final build, in
+        order. The last matching rule is used
     """
 
     addon_folder: str
@@ -154,6 +209,7 @@ class Config:
     install_versions: Optional[List[Decimal]] = None
     build_actions: Optional[Dict[str, BuildAction]] = None
     additional_actions: list[str] = field(default_factory=list)
+    compression: Optional[List[CompressionRule]] = None
 
 
 def build_config(data: ConfigDict) -> Config:
@@ -176,6 +232,7 @@ def build_config(data: ConfigDict) -> Config:
     additional_actions: list[str] = []
     parsed_extension_settings: Optional[ExtensionSettings] = None
     install_versions: list[Decimal] = []
+    compression: list[CompressionRule] = []
 
     # Set the precision for Decimal to
     # 3, which corresponds to X.XX
@@ -308,6 +365,47 @@ def build_config(data: ConfigDict) -> Config:
                 print_error(f"{act} must have something defined!", console)
                 exit_fail()
 
+        if COMPRESSION in data:
+            for pattern, rule_data in data[COMPRESSION].items():
+                if isinstance(rule_data, str):
+                    rule = CompressionRule(pattern, rule_data)
+                elif isinstance(rule_data, dict) and METHOD in rule_data:
+                    rule = CompressionRule(
+                        pattern,
+                        rule_data[METHOD],
+                        rule_data[LEVEL] if LEVEL in rule_data else None,
+                    )
+                else:
+                    print_error(
+                        f"compression::{pattern} must define a method!", console
+                    )
+                    exit_fail()
+
+                if rule.method not in COMPRESSION_METHODS:
+                    print_error(
+                        f"compression::{pattern} uses unknown method {rule.method}!",
+                        console,
+                    )
+                    exit_fail()
+                levels = COMPRESSION_METHODS[rule.method]
+                if rule.level is not None and levels is None:
+                    print_error(
+                        f"compression::{pattern} sets a level, but {rule.method} does not support levels!",
+                        console,
+                    )
+                    exit_fail()
+                elif (
+                    rule.level is not None
+                    and levels is not None
+                    and not levels[0] <= rule.level <= levels[1]
+                ):
+                    print_error(
+                        f"compression::{pattern} level must be between {levels[0]} and {levels[1]}!",
+                        console,
+                    )
+                    exit_fail()
+                compression.append(rule)
+
     except Exception as e:
         console.print(e)
         console.print(traceback.format_exc())
@@ -324,6 +422,7 @@ def build_config(data: ConfigDict) -> Config:
         else None,
         build_actions=parsed_build_acts if len(parsed_build_acts) else None,
         additional_actions=additional_actions,
+        compression=compression if len(compression) else None,
     )
 
 
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import traceback
+from pathlib import Path
+from types import FrameType
+from typing import Optional, cast
+
+from rich.console import Console
+
+from bpy_addon_build.client import socket_path
+from bpy_addon_build.runner import run_cli
+from bpy_addon_build.session import ContextCache
+from bpy_addon_build.util import print_error
+
+console = Console()
+
+# Commands that can't be forwarded, since they never finish
+BLOCKING_ARGS = {"daemon", "-w", "--watch"}
+
+
+class StreamWriter(io.TextIOBase):
+    """Text stream that sends everything written to it to a client
+
+    Attributes
+    ----------
+    conn: socket.socket
+        Connection to the client
+
+    kind: str
+        Either out or err, depending on the stream this replaces
+    """
+
+    def __init__(self, conn: socket.socket, kind: str) -> None:
+        super().__init__()
+        self.conn = conn
+        self.kind = kind
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        if len(s):
+            send(self.conn, {self.kind: s})
+        return len(s)
+
+
+def send(conn: socket.socket, message: dict[str, object]) -> None:
+    """Send a message to a client, ignoring clients that went away"""
+    try:
+        conn.sendall(json.dumps(message).encode() + b"\n")
+    except OSError:
+        pass
+
+
+def exit_code(code: object) -> int:
+    """Convert the code of a SystemExit into an exit code, like Python does"""
+    if code is None:
+        return 0
+    elif isinstance(code, int):
+        return code
+    print(code)
+    return 1
+
+
+def set_environ(env: dict[str, str]) -> None:
+    """Replace the environment of this process"""
+    os.environ.clear()
+    os.environ.update(env)
+
+
+def handle(conn: socket.socket, cache: ContextCache) -> None:
+    """
+    Run the build requested by a client, sending its output back
+
+    Builds are run one at a time in this process, so
+    that the interpreter, imports, parsed config, and
+    action modules stay warm between builds. Each build
+    runs in the working directory and environment of the
+    client, so it installs to the same folders and makes
+    the same archive as running it directly. Anything
+    that exits the build, like a failing action, only
+    ends that request.
+
+    conn: Connection to the client
+    cache: Contexts kept between builds
+
+    Returns:
+        None
+    """
+    with conn.makefile("rb") as reader:
+        line = reader.readline()
+    try:
+        request = cast("dict[str, object]", json.loads(line))
+        argv = cast("list[str]", request["argv"])
+        cwd = cast(str, request["cwd"])
+        env = cast("dict[str, str]", request["env"])
+    except (ValueError, KeyError, TypeError):
+        send(conn, {"err": "Invalid request\n", "exit": 1})
+        return
+
+    code = 0
+    old_cwd = os.getcwd()
+    old_env = dict(os.environ)
+    out = StreamWriter(conn, "out")
+    err = StreamWriter(conn, "err")
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            os.chdir(cwd)
+            set_environ(env)
+            if len(BLOCKING_ARGS & set(argv)):
+                print_error("This command can't be run by the daemon", console)
+                code = 1
+            else:
+                run_cli(argv, cache)
+        except SystemExit as e:
+            code = exit_code(e.code)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os.chdir(old_cwd)
+            set_environ(old_env)
+    send(conn, {"exit": code})
+
+
+def _stop(signum: int, frame: Optional[FrameType]) -> None:
+    raise KeyboardInterrupt
+
+
+def serve(path: Optional[Path] = None) -> None:
+    """
+    Listen for builds from clients until interrupted
+
+    path: Path of the socket, by default client.socket_path()
+
+    Returns:
+        None
+    """
+    if path is None:
+        path = socket_path()
+    if path.exists():
+        # Only remove the socket if no daemon is using it
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+            print_error(f"A daemon is already listening on {path}", console)
+            return
+        except OSError:
+            path.unlink()
+        finally:
+            probe.close()
+
+    # Stop cleanly when terminated, like on Ctrl+C
+    signal.signal(signal.SIGTERM, _stop)
+
+    cache = ContextCache()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # The socket is created with the umask, so it's only ever
+    # reachable by this user, instead of for a moment before a chmod
+    umask = os.umask(0o177)
+    try:
+        server.bind(str(path))
+    finally:
+        os.umask(umask)
+    server.listen()
+    console.print(f"Listening on {path}", style="green")
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                handle(conn, cache)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        path.unlink()
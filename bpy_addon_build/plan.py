@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import os
+import time
+import zipfile
+from pathlib import Path
+from typing import Optional
+
+from attrs import frozen
+from rich.console import Console
+
+from bpy_addon_build.build_context import (
+    artifacts,
+    fileio,
+    fingerprint,
+    receipt,
+    stage,
+)
+from bpy_addon_build.build_context.build import combine_with_build
+from bpy_addon_build.build_context.core import (
+    BuildContext,
+    ignore_matcher,
+    output_dir,
+)
+from bpy_addon_build.build_context.hook_definitions import (
+    CLEAN_UP,
+    MAIN,
+    POST_INSTALL,
+    PRE_BUILD,
+    PRE_INSTALL,
+)
+from bpy_addon_build.build_context.install import install_targets
+from bpy_addon_build.session import installs
+
+console = Console()
+
+# Hooks in the order they run
+HOOKS = [PRE_BUILD, MAIN, PRE_INSTALL, POST_INSTALL, CLEAN_UP]
+
+# Number of files listed for each kind of
+# change, unless debug mode is enabled
+LISTED_FILES = 20
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class Changes:
+    """
+    Files a build or install would change
+
+    Attributes
+    ----------
+    added: list[str]
+        Relative paths of new files
+
+    changed: list[str]
+        Relative paths of files with new contents
+
+    removed: list[str]
+        Relative paths of files that would be removed
+    """
+
+    added: list[str]
+    changed: list[str]
+    removed: list[str]
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.added)} added, {len(self.changed)} changed, "
+            + f"{len(self.removed)} removed"
+        )
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class Signature:
+    """Size and CRC-32 a file should have after a build
+
+    Attributes
+    ----------
+    size: int
+        Size of the file in bytes
+
+    crc: Optional[int]
+        CRC-32 of the file, if it's the same as in the last
+        archive, or None if its contents will be new
+    """
+
+    size: int
+    crc: Optional[int]
+
+
+def diff_scans(old: Optional[stage.TreeScan], new: stage.TreeScan) -> Changes:
+    """
+    Compare the scan of the last build with the current one
+
+    old: Scan the last build used, if there was one
+    new: Current scan
+
+    Returns:
+        Changes between the scans
+    """
+    if old is None:
+        return Changes(sorted(new.files), [], [])
+    return Changes(
+        sorted(rel for rel in new.files if rel not in old.files),
+        sorted(
+            rel
+            for rel, state in new.files.items()
+            if rel in old.files and old.files[rel] != state
+        ),
+        sorted(rel for rel in old.files if rel not in new.files),
+    )
+
+
+def expected_files(
+    ctx: BuildContext,
+    zip_path: Path,
+    old: Optional[stage.TreeScan],
+    new: stage.TreeScan,
+) -> dict[str, Signature]:
+    """
+    Get the files the next archive will contain
+
+    Files that didn't change since the last build keep
+    the size and CRC-32 they have in its archive, as main
+    hooks may have changed them. Files main hooks added to
+    the last archive are expected to be added again.
+
+    ctx: Build context
+    zip_path: Path of the archive
+    old: Scan the last build used, if there was one
+    new: Current scan
+
+    Returns:
+        Relative paths in the addon, mapped to their Signature
+    """
+    members: dict[str, Signature] = {}
+    if old is not None and zip_path.exists():
+        prefix = ctx.config.build_name + "/"
+        try:
+            with zipfile.ZipFile(zip_path) as zf:
+                for info in zf.infolist():
+                    if info.filename.startswith(prefix) and not info.is_dir():
+                        rel = info.filename[len(prefix) :]
+                        members[rel] = Signature(info.file_size, info.CRC)
+        except zipfile.BadZipFile:
+            members = {}
+
+    files: dict[str, Signature] = {}
+    for rel, sig in members.items():
+        if old is not None and rel not in old.files:
+            files[rel] = sig
+    for rel, state in new.files.items():
+        unchanged = old is not None and old.files.get(rel) == state
+        if unchanged and rel in members:
+            files[rel] = members[rel]
+        else:
+            files[rel] = Signature(state.size, None)
+    return files
+
+
+def diff_install(
+    target: Path, expected: dict[str, Signature], installed: Optional[receipt.Receipt]
+) -> Changes:
+    """
+    Compare an installed addon with the files the next build installs
+
+    Installed files are compared by the CRC-32 in their receipt,
+    unless receipt.check finds they changed since. Without a
+    receipt, files of the same size are read to get their CRC-32.
+    Like installs, files in receipt.UNTRACKED_FOLDERS are skipped.
+
+    target: Folder the addon is installed in
+    expected: Files of the next build, from expected_files
+    installed: Receipt of the install, if it has one
+
+    Returns:
+        Changes an install would make
+    """
+    sizes: dict[str, int] = {}
+    for dirpath, dirnames, filenames in os.walk(target):
+        dirnames[:] = [d for d in dirnames if d not in receipt.UNTRACKED_FOLDERS]
+        rel_dir = Path(dirpath).relative_to(target).as_posix()
+        for name in filenames:
+            rel = name if rel_dir == "." else f"{rel_dir}/{name}"
+            sizes[rel] = os.lstat(os.path.join(dirpath, name)).st_size
+
+    drifted = (
+        set() if installed is None else set(receipt.check(target, installed).changed)
+    )
+
+    def _crc(rel: str) -> Optional[int]:
+        if installed is None:
+            return fileio.crc32_file(target.joinpath(*rel.split("/")))[0]
+        if rel in installed.files and rel not in drifted:
+            return installed.files[rel][2]
+        return None
+
+    return Changes(
+        sorted(rel for rel in expected if rel not in sizes),
+        sorted(
+            rel
+            for rel, sig in expected.items()
+            if rel in sizes
+            and (sizes[rel] != sig.size or sig.crc is None or _crc(rel) != sig.crc)
+        ),
+        sorted(rel for rel in sizes if rel not in expected),
+    )
+
+
+def reused_artifact(
+    ctx: BuildContext, zip_path: Path, changes: Changes, status: Optional[str]
+) -> Optional[receipt.Artifact]:
+    """
+    Get the archive the next build installs, if it's the last one
+
+    ctx: Build context
+    zip_path: Path of the archive
+    changes: Changes to the build, from diff_scans
+    status: Whether the last archive is reused or restored
+
+    Returns:
+        - Artifact of the last archive, if the next one is the same
+        - None if the archive changes, or there is none
+    """
+    unchanged = not len(changes.added + changes.changed + changes.removed)
+    if not zip_path.exists() or (status is None and not unchanged):
+        return None
+    try:
+        return receipt.read_artifact(zip_path, ctx.config.build_name)
+    except zipfile.BadZipFile:
+        return None
+
+
+def hooks_to_run(ctx: BuildContext, install: bool) -> list[str]:
+    """
+    Get the hooks a build would run, in order
+
+    ctx: Build context
+    install: Whether the build would be installed
+
+    Returns:
+        Hooks, as "hook (action)"
+    """
+    names: list[str] = []
+    for hook in HOOKS:
+        if not install and hook in [PRE_INSTALL, POST_INSTALL]:
+            continue
+        for k in ctx.api.actions_to_execute:
+            if k in ctx.api.action_mods and hasattr(ctx.api.action_mods[k], hook):
+                names.append(f"{hook} ({k})")
+    return names
+
+
+def _print_files(changes: Changes, debug: bool) -> None:
+    for mark, style, files in [
+        ("+", "green", changes.added),
+        ("~", "yellow", changes.changed),
+        ("-", "red", changes.removed),
+    ]:
+        shown = files if debug else files[:LISTED_FILES]
+        for rel in shown:
+            console.print(f"    [{style}]{mark} {rel}[/{style}]", highlight=False)
+        if len(files) > len(shown):
+            console.print(f"    ... and {len(files) - len(shown)} more", style=style)
+
+
+def print_plan(contexts: list[BuildContext]) -> None:
+    """
+    Print what building and installing would change,
+    without copying, compressing, or running hooks
+
+    Files are compared by the size and modification time
+    recorded in build/.bab by the last build, and installs
+    by their receipts, so nothing is read besides the
+    central directory of the last archive, unless an
+    install has no receipt. With --skip-unchanged or
+    --cache, the fingerprint is also computed, using
+    cached hashes.
+
+    contexts: Build contexts from create_contexts
+
+    Returns:
+        None
+    """
+    start = time.perf_counter()
+    for ctx in contexts:
+        build = output_dir(ctx)
+        zip_path = Path(str(combine_with_build(ctx, build)) + ".zip")
+        addon_folder = ctx.config_path.parent.joinpath(ctx.config.addon_folder)
+        scan = stage.scan_tree(addon_folder, ignore_matcher(ctx))
+        old = stage.load_scan(stage.sources_file(zip_path))
+        install = installs(ctx) and ctx.config.install_versions is not None
+
+        console.print(f"[bold]{ctx.config.build_name}[/bold] -> {zip_path}")
+        console.print(f"  Actions: {', '.join(ctx.api.actions_to_execute)}")
+        hooks = hooks_to_run(ctx, install)
+        console.print(f"  Hooks: {', '.join(hooks) if len(hooks) else 'none'}")
+
+        status = None
+        if ctx.cli.skip_unchanged or ctx.cli.cache:
+            key = fingerprint.compute(ctx, scan=scan)
+            if ctx.cli.skip_unchanged and fingerprint.matches_last(zip_path, key):
+                status = "up to date, the last archive is reused"
+            elif ctx.cli.cache and artifacts.contains(key):
+                status = "restored from the artifact cache"
+
+        changes = diff_scans(old, scan)
+        if status is not None:
+            console.print(f"  Build: {status}")
+        elif old is None:
+            console.print(f"  Build: no earlier build, {changes.summary()}")
+        else:
+            console.print(f"  Build: {changes.summary()}")
+        if status is None:
+            _print_files(changes, ctx.cli.debug_mode)
+
+        if not install:
+            continue
+        name = ctx.config.build_name
+        mode = ctx.cli.install_mode
+        expected = expected_files(ctx, zip_path, old, scan)
+        artifact = reused_artifact(ctx, zip_path, changes, status)
+        for path in install_targets(ctx):
+            target = path.joinpath(name)
+            if artifact is not None and receipt.matches(path, name, artifact, mode):
+                console.print(f"  Install {target}: matches its receipt, skipped")
+                continue
+            install_changes = diff_install(target, expected, receipt.load(path, name))
+            console.print(f"  Install {target} ({mode}): {install_changes.summary()}")
+            _print_files(install_changes, ctx.cli.debug_mode)
+
+    elapsed = (time.perf_counter() - start) * 1000
+    console.print(f"Planned {len(contexts)} builds in {elapsed:.1f} ms")
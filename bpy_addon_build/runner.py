@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import time
+from decimal import getcontext
+from typing import Optional
+
+from rich.console import Console
+from rich.table import Table
+
+from bpy_addon_build import args, trace
+from bpy_addon_build.build_context import artifacts, fingerprint, install, receipt
+from bpy_addon_build.build_context.core import BuildContext
+from bpy_addon_build.session import ContextCache, installs, load_contexts, run
+from bpy_addon_build.util import exit_fail, print_error
+
+
+def run_cli(
+    argv: Optional[list[str]] = None, cache: Optional[ContextCache] = None
+) -> None:
+    """
+    Run BpyBuild with the given arguments
+
+    argv: Arguments without the program name, by default sys.argv
+    cache: Contexts of earlier runs that can be reused,
+        used by the daemon
+
+    Returns:
+        None
+    """
+    # Set the precision for Decimal to
+    # 3, which corresponds to X.XX
+    getcontext().prec = 3
+
+    cli = args.parse_args(argv)
+    console = Console()
+
+    if cli.debug_mode:
+        console.print(cli)
+
+    if cli.command == "daemon":
+        from bpy_addon_build import daemon
+
+        daemon.serve()
+        return
+
+    if cli.command == "cache":
+        run_cache_command(cli)
+        return
+
+    if not cli.path.exists():
+        print(f"Could not find {str(cli.path)}")
+
+    if cli.trace is None:
+        run_command(cli, cache)
+        return
+
+    # Save the trace even if the build fails
+    trace.start()
+    try:
+        run_command(cli, cache)
+    finally:
+        trace.finish(cli.trace)
+        if not cli.supress_messages:
+            print(f"Saved trace to {cli.trace}")
+
+
+def run_command(cli: args.Args, cache: Optional[ContextCache]) -> None:
+    """
+    Run the command passed in the CLI, other than daemon
+
+    cli: Parsed arguments
+    cache: Contexts of earlier runs that can be reused
+
+    Returns:
+        None
+    """
+    if cli.command == "workspace":
+        from bpy_addon_build.workspace import run_workspace
+
+        run_workspace(cli)
+        return
+
+    contexts = cache.get(cli) if cache is not None else load_contexts(cli)
+    if contexts is None:
+        return
+
+    if cli.command == "fingerprint":
+        for ctx in contexts:
+            name = ctx.config.build_name
+            if ctx.profile is not None:
+                name = f"{ctx.profile}/{name}"
+            print(name, fingerprint.compute(ctx))
+        return
+
+    if cli.command == "rollback":
+        run_rollback(contexts)
+        return
+
+    if cli.command == "verify":
+        run_verify(contexts)
+        return
+
+    if cli.plan:
+        from bpy_addon_build.plan import print_plan
+
+        print_plan(contexts)
+        return
+
+    if cli.watch:
+        from bpy_addon_build.watch import watch
+
+        watch(cli, contexts)
+        return
+
+    run(contexts)
+
+
+def run_rollback(contexts: list[BuildContext]) -> None:
+    """
+    Restore the installs replaced by the last atomic
+    install of every build that's installed
+
+    contexts: Build contexts
+
+    Returns:
+        None
+    """
+    console = Console()
+    rolled_back = 0
+    for ctx in contexts:
+        if not installs(ctx):
+            continue
+        for path in install.rollback(ctx):
+            console.print(
+                f"Rolled back {ctx.config.build_name} in {path}", style="green"
+            )
+            rolled_back += 1
+    if not rolled_back:
+        print_error("No previous installs to roll back to", console)
+        exit_fail()
+
+
+def run_verify(contexts: list[BuildContext]) -> None:
+    """
+    Check every install of every build that's
+    installed against its receipt
+
+    contexts: Build contexts
+
+    Returns:
+        None
+    """
+    console = Console()
+    start = time.perf_counter()
+    checked = 0
+    failed = 0
+    for ctx in contexts:
+        if not installs(ctx):
+            continue
+        name = ctx.config.build_name
+        for path in install.install_targets(ctx):
+            checked += 1
+            installed = receipt.load(path, name)
+            if installed is None:
+                print_error(f"{name} in {path}: no receipt", console)
+                failed += 1
+                continue
+            drift = receipt.check(path.joinpath(name), installed)
+            if drift.clean():
+                console.print(f"{name} in {path}: ok", style="green")
+                continue
+            failed += 1
+            print_error(
+                f"{name} in {path}: {len(drift.changed)} changed, "
+                + f"{len(drift.missing)} missing, {len(drift.added)} added",
+                console,
+            )
+            for rel in drift.changed:
+                console.print(f"    [yellow]~ {rel}[/yellow]", highlight=False)
+            for rel in drift.missing:
+                console.print(f"    [red]- {rel}[/red]", highlight=False)
+            for rel in drift.added:
+                console.print(f"    [green]+ {rel}[/green]", highlight=False)
+
+    elapsed = (time.perf_counter() - start) * 1000
+    console.print(f"Verified {checked} installs in {elapsed:.1f} ms")
+    if failed:
+        exit_fail()
+
+
+def run_cache_command(cli: args.Args) -> None:
+    """
+    Print the entries of the artifact cache,
+    or remove the least recently used ones
+
+    cli: Parsed arguments
+
+    Returns:
+        None
+    """
+    console = Console()
+    if cli.cache_command == "gc":
+        removed = artifacts.gc(cli.cache_size)
+        console.print(f"Removed {len(removed)} archives from {artifacts.cache_dir()}")
+        return
+
+    entries = artifacts.entries()
+    table = Table(title=str(artifacts.cache_dir()))
+    table.add_column("Build")
+    table.add_column("Key")
+    table.add_column("Size", justify="right")
+    table.add_column("Last used")
+    for entry in reversed(entries):
+        table.add_row(
+            artifacts.build_name(entry),
+            entry.path.name[:16],
+            f"{entry.size / 1024 / 1024:.1f} MiB",
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.last_used)),
+        )
+    console.print(table)
+    total = sum(e.size for e in entries) / 1024 / 1024
+    console.print(f"{len(entries)} archives, {total:.1f} of {cli.cache_size} MiB used")
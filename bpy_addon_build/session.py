@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import copy
+from pathlib import Path
+from typing import Optional
+
+import attrs
+import yaml
+from rich.console import Console
+
+from bpy_addon_build import trace
+from bpy_addon_build.api import Api
+from bpy_addon_build.args import Args
+from bpy_addon_build.build_context import hooks, receipt
+from bpy_addon_build.build_context.build import build_all
+from bpy_addon_build.build_context.core import BuildContext
+from bpy_addon_build.build_context.hook_definitions import CLEAN_UP, PRE_BUILD
+from bpy_addon_build.build_context.install import install
+from bpy_addon_build.config import Config, ConfigDict, build_config
+from bpy_addon_build.util import exit_fail, print_error
+
+console = Console()
+
+
+def load_config(cli: Args) -> Config:
+    """
+    Read and parse the config passed in the CLI
+
+    cli: Parsed arguments
+
+    Returns:
+        Config
+    """
+    with trace.span("parse config"), open(cli.path, "r") as f:
+        data: ConfigDict = yaml.safe_load(f)
+        return build_config(data)
+
+
+def create_contexts(cli: Args, config: Config) -> list[BuildContext]:
+    """
+    Create the contexts of all builds for a config,
+    importing the modules of all actions that are used
+
+    Every profile gets its own contexts, which
+    use the profile's action on top of the others
+
+    cli: Parsed arguments
+    config: Parsed config
+
+    Returns:
+        List of build contexts, in the order they're built
+    """
+    contexts: list[BuildContext] = []
+    profiles: list[Optional[str]] = [*cli.profiles] if len(cli.profiles) else [None]
+    for profile in profiles:
+        if profile is not None:
+            if config.build_actions is None or profile not in config.build_actions:
+                print_error(f"Profile {profile} is not a build action", console)
+                exit_fail()
+        profile_cli = profile_args(cli, profile)
+
+        with trace.span("load actions", build_name=config.build_name):
+            api: Api = Api(config, profile_cli, cli.debug_mode)
+        context = BuildContext(cli.path, config, profile_cli, api, profile)
+        contexts.append(context)
+        legacy = legacy_context(context)
+        if legacy is not None:
+            contexts.append(legacy)
+    return contexts
+
+
+def profile_args(cli: Args, profile: Optional[str]) -> Args:
+    """
+    Get the arguments used to build a profile
+
+    cli: Parsed arguments
+    profile: Name of the profile, or None
+
+    Returns:
+        cli, with the profile's action added
+    """
+    if profile is None or profile in cli.actions:
+        return cli
+    return attrs.evolve(cli, actions=cli.actions + [profile])
+
+
+def load_contexts(cli: Args) -> Optional[list[BuildContext]]:
+    """
+    Load the config and create the contexts of all builds
+
+    cli: Parsed arguments
+
+    Returns:
+        - List of build contexts
+        - None if the addon folder doesn't exist
+    """
+    config = load_config(cli)
+    if not cli.path.parent.joinpath(config.addon_folder).exists():
+        print("Addon folder does not exist!")
+        return None
+    return create_contexts(cli, config)
+
+
+def action_scripts(contexts: list[BuildContext]) -> set[Path]:
+    """
+    Get the scripts of all actions that are used
+
+    contexts: Build contexts
+
+    Returns:
+        Resolved paths of the scripts
+    """
+    scripts: set[Path] = set()
+    for ctx in contexts:
+        for action in ctx.api.action_mods:
+            script = ctx.api.build_actions[action].script
+            if script is not None:
+                scripts.add(
+                    ctx.config_path.parent.resolve().joinpath(Path(script)).resolve()
+                )
+    return scripts
+
+
+def _stat_key(path: Path) -> tuple[int, int]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return (-1, -1)
+    return (st.st_mtime_ns, st.st_size)
+
+
+class ContextCache:
+    """
+    Contexts of earlier runs, so the config isn't parsed
+    and actions aren't imported again on every run
+
+    Contexts are reused as long as the config and the
+    scripts of all used actions are unchanged, and the
+    same actions are used.
+
+    Attributes
+    ----------
+    entries: dict[tuple[str, ...], tuple[dict[Path, tuple[int, int]], list[BuildContext]]]
+        Key of the config and actions, to the state of the
+        config and scripts when the contexts were created
+    """
+
+    def __init__(self) -> None:
+        self.entries: dict[
+            tuple[str, ...],
+            tuple[dict[Path, tuple[int, int]], list[BuildContext]],
+        ] = {}
+
+    def get(self, cli: Args) -> Optional[list[BuildContext]]:
+        """
+        Get the contexts of all builds, reusing
+        earlier ones if nothing changed
+
+        cli: Parsed arguments
+
+        Returns:
+            - List of build contexts, using cli
+            - None if the addon folder doesn't exist
+        """
+        # Contexts are reused from other working directories,
+        # so they must only hold the absolute path of the config
+        cli = attrs.evolve(cli, path=cli.path.resolve())
+        key = (
+            str(cli.path),
+            str(cli.build_extension_only),
+            str(cli.debug_mode),
+            ",".join(cli.profiles),
+            *cli.actions,
+        )
+        entry = self.entries.get(key)
+        if entry is not None and all(
+            _stat_key(path) == state for path, state in entry[0].items()
+        ):
+            contexts = [
+                attrs.evolve(ctx, cli=profile_args(cli, ctx.profile))
+                for ctx in entry[1]
+            ]
+            if not cli.path.parent.joinpath(contexts[0].config.addon_folder).exists():
+                print("Addon folder does not exist!")
+                return None
+            return contexts
+
+        loaded = load_contexts(cli)
+        if loaded is None:
+            return None
+        states = {path: _stat_key(path) for path in {cli.path} | action_scripts(loaded)}
+        self.entries[key] = (states, loaded)
+        return loaded
+
+
+def run(
+    contexts: list[BuildContext], installed: Optional[dict[Path, str]] = None
+) -> list[Path]:
+    """
+    Build every context, then install them in order
+
+    All contexts are built at the same time, sharing a
+    single scan of the addon folder. When building several
+    profiles, only the first profile is installed.
+
+    pre_build and clean_up hooks may change the addon folder
+    and undo it again, so if any build has them, every build
+    is built, installed, and cleaned up before the next one
+    starts, so their hooks never see each other's changes.
+
+    contexts: Build contexts from create_contexts
+    installed: Fingerprints of the archives installed by earlier
+        runs, which are kept up to date. Archives that are the
+        same as the one that was last installed aren't installed
+        again, including their install hooks
+
+    Returns:
+        Paths to the archives of all builds
+    """
+    for ctx in contexts:
+        if ctx.cli.debug_mode:
+            console.print(ctx)
+
+    one_at_a_time = any(
+        hooks.has_hook(ctx, PRE_BUILD) or hooks.has_hook(ctx, CLEAN_UP)
+        for ctx in contexts
+    )
+    groups = [[ctx] for ctx in contexts] if one_at_a_time else [contexts]
+
+    build_paths: list[Path] = []
+    for group in groups:
+        with trace.span("build", builds=len(group)):
+            results = build_all(group)
+        for ctx, result in zip(group, results):
+            if installs(ctx):
+                _install_changed(ctx, result.path, installed)
+
+            # Reused archives never ran pre_build
+            # hooks, so there's nothing to clean up
+            if result.built:
+                hooks.run_cleanup_hooks(ctx)
+        build_paths += [result.path for result in results]
+    return build_paths
+
+
+def _install_changed(
+    ctx: BuildContext, build_path: Path, installed: Optional[dict[Path, str]]
+) -> None:
+    if installed is None:
+        install(ctx, build_path)
+        return
+    key = receipt.read_artifact(build_path, ctx.config.build_name).fingerprint
+    if installed.get(build_path) == key:
+        if not ctx.cli.supress_messages:
+            print(f"{build_path.name} didn't change, skipping install")
+        return
+    install(ctx, build_path)
+    installed[build_path] = key
+
+
+def installs(ctx: BuildContext) -> bool:
+    """
+    Check if a build is installed after building,
+    which is only the case for the first profile
+
+    ctx: Build context
+
+    Returns:
+        True if the build is installed
+    """
+    return ctx.profile is None or ctx.profile == ctx.cli.profiles[0]
+
+
+def legacy_context(context: BuildContext) -> Optional[BuildContext]:
+    """
+    Create the context used to build a legacy addon
+    alongside an extension.
+
+    To reduce as many issues as possible, we
+    treat this as if it were a separate call
+    of BpyBuild but with an altered config
+
+    context: Build context of the extension
+
+    Returns:
+        - BuildContext if a legacy addon should be built
+        - None otherwise
+    """
+    config = context.config
+    cli = context.cli
+    if not (
+        (config.build_extension and config.extension_settings is not None)
+        and config.extension_settings.build_legacy
+        and not cli.build_extension_only
+    ):
+        return None
+
+    # Remove extension action in a copy
+    # of additional_actions
+    additional_actions = copy.deepcopy(config.additional_actions)
+    if "extension" in additional_actions:
+        additional_actions.remove("extension")
+
+    override_config = attrs.evolve(
+        config,
+        build_name=config.build_name + "_legacy",
+        build_extension=False,
+        extension_settings=None,
+        additional_actions=additional_actions,
+    )
+
+    with trace.span("load actions", build_name=override_config.build_name):
+        override_api: Api = Api(override_config, cli, cli.debug_mode)
+    if cli.debug_mode:
+        console.print(override_api.actions_to_execute)
+    return BuildContext(
+        context.config_path, override_config, cli, override_api, context.profile
+    )
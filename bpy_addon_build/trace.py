@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from types import TracebackType
+from typing import Optional, Union
+
+# Values that can be attached to a span
+ArgValue = Union[str, int, float, bool]
+
+
+class Span:
+    """A timed section of a build, recorded as a complete event
+
+    Spans are used as context managers, and extra
+    information like file counts can be added with set
+    while the span is open.
+
+    Attributes
+    ----------
+    name: str
+        Name shown in the timeline
+
+    cat: str
+        Category, used to filter events in the viewer
+
+    args: dict[str, ArgValue]
+        Extra information shown when selecting the span
+    """
+
+    def __init__(self, tracer: Tracer, name: str, cat: str, args: dict[str, ArgValue]):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0
+
+    def set(self, **args: ArgValue) -> None:
+        self.args.update(args)
+
+    def __enter__(self) -> Span:
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add(self, end)
+
+
+class NullSpan:
+    """Span used when tracing is off, which does nothing"""
+
+    def set(self, **args: ArgValue) -> None:
+        pass
+
+    def __enter__(self) -> NullSpan:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """Collects spans in the Trace Event Format, which
+    chrome://tracing and Perfetto can open
+
+    Attributes
+    ----------
+    events: list[dict[str, object]]
+        Recorded events
+
+    origin: int
+        Time the tracer was created, in nanoseconds
+    """
+
+    def __init__(self) -> None:
+        self.events: list[dict[str, object]] = []
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.threads: dict[int, int] = {}
+        self.lock = threading.Lock()
+
+    def _tid(self) -> int:
+        # Thread identifiers are large and unreadable,
+        # so threads are numbered in order of appearance
+        ident = threading.get_ident()
+        with self.lock:
+            if ident not in self.threads:
+                self.threads[ident] = len(self.threads)
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": self.pid,
+                        "tid": self.threads[ident],
+                        "args": {"name": threading.current_thread().name},
+                    }
+                )
+            return self.threads[ident]
+
+    def add(self, span: Span, end: int) -> None:
+        event: dict[str, object] = {
+            "name": span.name,
+            "cat": span.cat,
+            "ph": "X",
+            "ts": (span.start - self.origin) / 1000,
+            "dur": (end - span.start) / 1000,
+            "pid": self.pid,
+            "tid": self._tid(),
+        }
+        if len(span.args):
+            event["args"] = span.args
+        with self.lock:
+            self.events.append(event)
+
+    def save(self, path: Path) -> None:
+        data: dict[str, object] = {
+            "traceEvents": self.events,
+            "displayTimeUnit": "ms",
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+
+# Tracer of the current run, or None if tracing is off
+TRACER: Optional[Tracer] = None
+
+
+def start() -> None:
+    """Start recording spans"""
+    global TRACER
+    TRACER = Tracer()
+
+
+def finish(path: Path) -> None:
+    """Stop recording spans, and save them to path"""
+    global TRACER
+    if TRACER is not None:
+        TRACER.save(path)
+    TRACER = None
+
+
+def span(name: str, cat: str = "build", **args: ArgValue) -> Union[Span, NullSpan]:
+    """
+    Create a span, which records the time spent in a with block
+
+    When tracing is off, this returns a shared span that
+    does nothing, so spans can be left in hot paths.
+
+    name: Name shown in the timeline
+    cat: Category of the span
+    args: Extra information, like file and byte counts
+
+    Returns:
+        Span to use in a with statement
+    """
+    if TRACER is None:
+        return NULL_SPAN
+    return Span(TRACER, name, cat, args)
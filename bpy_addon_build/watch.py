@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Optional, Protocol, cast
+
+from rich.console import Console
+
+from bpy_addon_build.args import Args
+from bpy_addon_build.build_context.core import BuildContext, ignore_matcher
+from bpy_addon_build.session import action_scripts, create_contexts, load_config, run
+from bpy_addon_build.util import print_error
+
+console = Console()
+
+# Time without new events before a rebuild starts, so a
+# burst of saves (or a git checkout) causes a single rebuild
+DEBOUNCE = 0.1
+
+# Longest time to wait for events to stop, so a
+# constant stream of changes doesn't delay rebuilds forever
+MAX_DEBOUNCE = 0.5
+
+# Interval used when polling for changes
+POLL_INTERVAL = 0.5
+
+# Events from linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+# struct inotify_event, without the name
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Watcher(Protocol):
+    """Interface of all file watchers"""
+
+    def wait(self, timeout: Optional[float]) -> set[Path]:
+        """Wait for changes.
+
+        timeout: Seconds to wait, or None to wait forever
+
+        Returns:
+            Paths that changed, which is empty on a timeout
+        """
+        ...
+
+    def close(self) -> None: ...
+
+
+class InotifyWatcher:
+    """Watcher using inotify, which is only available on Linux
+
+    Folders in recursive are watched along with all of
+    their subfolders, including ones created later.
+    Folders in shallow are watched without their subfolders.
+    """
+
+    def __init__(self, recursive: list[Path], shallow: list[Path]) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = cast(Callable[[int, bytes, int], int], libc.inotify_add_watch)
+        init = cast(Callable[[int], int], libc.inotify_init1)
+        self.fd = init(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watch descriptor to the folder and
+        # whether its subfolders are watched
+        self.watches: dict[int, tuple[Path, bool]] = {}
+        for folder in shallow:
+            self._watch(folder, False)
+        for folder in recursive:
+            self._watch_tree(folder)
+
+    def _watch(self, folder: Path, recursive: bool) -> None:
+        wd = self._add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = (folder, recursive)
+
+    def _watch_tree(self, root: Path) -> set[Path]:
+        """Watch a folder and its subfolders.
+
+        Returns:
+            All files in the tree, as changes before the
+            watches were added would otherwise be missed
+        """
+        files: set[Path] = set()
+        for dirpath, _, filenames in os.walk(root):
+            self._watch(Path(dirpath), True)
+            files.update(Path(dirpath, name) for name in filenames)
+        return files
+
+    def _read(self) -> set[Path]:
+        changed: set[Path] = set()
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = cast(
+                "tuple[int, int, int, int]",
+                EVENT_HEADER.unpack_from(data, offset),
+            )
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so assume everything changed
+                changed.update(folder for folder, _ in self.watches.values())
+                continue
+            if wd not in self.watches:
+                continue
+            folder, recursive = self.watches[wd]
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+
+            path = folder.joinpath(os.fsdecode(name)) if len(name) else folder
+            changed.add(path)
+            if recursive and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                changed.update(self._watch_tree(path))
+        return changed
+
+    def wait(self, timeout: Optional[float]) -> set[Path]:
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        if not len(poller.poll(None if timeout is None else timeout * 1000)):
+            return set()
+        return self._read()
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Watcher that compares the state of all files periodically,
+    for platforms without inotify
+    """
+
+    def __init__(self, recursive: list[Path], shallow: list[Path]) -> None:
+        self.recursive = recursive
+        self.shallow = shallow
+        self.state = self._snapshot()
+
+    def _snapshot(self) -> dict[Path, tuple[int, int]]:
+        state: dict[Path, tuple[int, int]] = {}
+        paths: list[Path] = []
+        for root in self.recursive:
+            for dirpath, _, filenames in os.walk(root):
+                paths.extend(Path(dirpath, name) for name in filenames)
+        for folder in self.shallow:
+            if folder.is_dir():
+                paths.extend(p for p in folder.iterdir() if p.is_file())
+        for path in paths:
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            state[path] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def wait(self, timeout: Optional[float]) -> set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = self._snapshot()
+            changed = {
+                p
+                for p in state.keys() | self.state.keys()
+                if state.get(p) != self.state.get(p)
+            }
+            self.state = state
+            if len(changed):
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(
+                POLL_INTERVAL
+                if deadline is None
+                else min(POLL_INTERVAL, max(0.0, deadline - time.monotonic()))
+            )
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(recursive: list[Path], shallow: list[Path]) -> Watcher:
+    """Create the best watcher available on this platform"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(recursive, shallow)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(recursive, shallow)
+
+
+def wait_debounced(watcher: Watcher) -> set[Path]:
+    """Wait for a change, then keep collecting changes
+    until no new ones come in for DEBOUNCE seconds
+
+    watcher: Watcher to wait on
+
+    Returns:
+        All paths that changed
+    """
+    changed = watcher.wait(None)
+    deadline = time.monotonic() + MAX_DEBOUNCE
+    while time.monotonic() < deadline:
+        more = watcher.wait(min(DEBOUNCE, deadline - time.monotonic()))
+        if not len(more):
+            break
+        changed |= more
+    return changed
+
+
+def needs_rebuild(ctx: BuildContext, changed: set[Path]) -> bool:
+    """Check if any changed path is in the addon folder and not ignored"""
+    addon_folder = ctx.config_path.parent.joinpath(ctx.config.addon_folder).resolve()
+    matcher = ignore_matcher(ctx)
+    for path in changed:
+        try:
+            rel = path.resolve().relative_to(addon_folder)
+        except ValueError:
+            continue
+        if len(rel.parts) == 0:
+            return True
+
+        # Check every parent, since ignored
+        # folders exclude everything in them
+        parts = rel.parts
+        if not any(
+            matcher.match("/".join(parts[: i + 1]), i < len(parts) - 1)
+            for i in range(len(parts))
+        ):
+            return True
+    return False
+
+
+def rebuild(contexts: list[BuildContext], installed: dict[Path, str]) -> None:
+    """
+    Build and install, without exiting on failures
+
+    contexts: Build contexts from create_contexts
+    installed: Fingerprints of the archives installed by
+        earlier rebuilds, so unchanged ones aren't installed again
+
+    Returns:
+        None
+    """
+    start = time.monotonic()
+    try:
+        run(contexts, installed)
+    except SystemExit:
+        print_error("Build failed, waiting for changes", console)
+        return
+    except Exception as e:
+        # Anything raised by hooks or actions only ends this
+        # build, as the next change may fix it
+        print_error(f"Build failed: {type(e).__name__}: {e}", console)
+        if contexts[0].cli.debug_mode:
+            traceback.print_exc()
+        print_error("Waiting for changes", console)
+        return
+    if not contexts[0].cli.supress_messages:
+        console.print(
+            f"Rebuilt in {time.monotonic() - start:.2f}s, waiting for changes",
+            style="green",
+        )
+
+
+def watch(cli: Args, contexts: list[BuildContext]) -> None:
+    """
+    Build and install, then do so again every time
+    the addon folder, config, or action scripts change
+
+    The config is only parsed again when the config
+    changes, and actions are only imported again when
+    the config or action scripts change
+
+    cli: Parsed arguments
+    contexts: Build contexts from create_contexts
+
+    Returns:
+        None
+    """
+    config_path = cli.path.resolve()
+
+    # Archives that didn't change since they were last installed
+    # aren't installed again. Install targets and hooks come from
+    # the config and actions, so this is cleared when they change
+    installed: dict[Path, str] = {}
+
+    # Watches are added before building, so
+    # changes made during a build aren't missed
+    pending = True
+    try:
+        while True:
+            addon_folder = cli.path.parent.joinpath(contexts[0].config.addon_folder)
+            scripts = action_scripts(contexts)
+            watcher = create_watcher(
+                [addon_folder.resolve()],
+                sorted({config_path.parent} | {s.parent for s in scripts}),
+            )
+            try:
+                if pending:
+                    rebuild(contexts, installed)
+                    pending = False
+                while True:
+                    changed = {p.resolve() for p in wait_debounced(watcher)}
+                    if config_path in changed:
+                        try:
+                            contexts = create_contexts(cli, load_config(cli))
+                        except SystemExit:
+                            print_error("Invalid config, waiting for changes", console)
+                            continue
+
+                        # The addon folder or scripts may have
+                        # changed, so the watches are added again
+                        installed.clear()
+                        pending = True
+                        break
+                    elif len(changed & scripts):
+                        try:
+                            contexts = create_contexts(cli, contexts[0].config)
+                        except SystemExit:
+                            print_error("Invalid actions, waiting for changes", console)
+                            continue
+                        except Exception as e:
+                            print_error(f"Could not load actions: {e}", console)
+                            print_error("Waiting for changes", console)
+                            continue
+                        installed.clear()
+                        rebuild(contexts, installed)
+                    elif any(needs_rebuild(ctx, changed) for ctx in contexts):
+                        rebuild(contexts, installed)
+            finally:
+                watcher.close()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from decimal import getcontext
+from pathlib import Path
+from typing import NoReturn, Optional
+
+import attrs
+import yaml
+from attrs import frozen
+from rich.console import Console
+from rich.table import Table
+
+from bpy_addon_build.args import Args
+from bpy_addon_build.build_context import install
+from bpy_addon_build.session import load_config, load_contexts, run
+from bpy_addon_build.util import EXIT_FAIL, exit_fail, print_error
+
+console = Console()
+
+# Name of configs in folders listed in a workspace
+CONFIG_FILE = "bpy-build.yaml"
+
+CONFIGS = "configs"
+PARALLEL = "parallel"
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class Workspace:
+    """
+    A set of configs that are built together
+
+    Attributes
+    ----------
+    configs: list[Path]
+        Paths to the configs, in order
+
+    parallel: Optional[int]
+        Number of configs to build at the same
+        time. If None, the number of CPUs is used
+    """
+
+    configs: list[Path]
+    parallel: Optional[int]
+
+
+# Must be ignored to pass Mypy as this has
+# an expression of Any, likely due to how
+# attrs works
+@frozen  # type: ignore
+class WorkspaceResult:
+    """
+    Result of building a single config in a workspace
+
+    Attributes
+    ----------
+    config: Path
+        Path to the config
+
+    ok: bool
+        Whether the build succeeded
+
+    seconds: float
+        Time the build took
+
+    archives: list[Path]
+        Archives that were built
+
+    output: str
+        Everything the build printed
+    """
+
+    config: Path
+    ok: bool
+    seconds: float
+    archives: list[Path]
+    output: str
+
+
+def _fail(message: str) -> NoReturn:
+    print_error(message, console)
+    sys.exit(EXIT_FAIL)
+
+
+def load_workspace(path: Path) -> Workspace:
+    """
+    Read and parse a workspace file
+
+    Entries in configs are relative to the workspace
+    file, and can be configs, folders with a
+    bpy-build.yaml, or glob patterns of either
+
+    path: Path to the workspace file
+
+    Returns:
+        Workspace
+    """
+    with open(path, "r") as f:
+        data: dict[str, object] = yaml.safe_load(f)
+    if not isinstance(data, dict) or not isinstance(data.get(CONFIGS), list):
+        _fail(f"{path} must have a list of {CONFIGS}")
+
+    root = path.parent
+    configs: list[Path] = []
+    entries = data[CONFIGS]
+    assert isinstance(entries, list)
+    for entry in entries:  # type: ignore[misc]
+        if not isinstance(entry, str):
+            _fail(f"Expected a path in {CONFIGS}, got {entry}")
+        matches = (
+            sorted(root.glob(entry))
+            if any(c in entry for c in "*?[")
+            else [root.joinpath(entry)]
+        )
+        if not len(matches):
+            _fail(f"{entry} doesn't match any configs")
+        for match in matches:
+            if match.is_dir():
+                match = match.joinpath(CONFIG_FILE)
+            if not match.is_file():
+                _fail(f"Could not find {match}")
+            if match.resolve() not in configs:
+                configs.append(match.resolve())
+
+    parallel = data.get(PARALLEL)
+    if parallel is not None and (not isinstance(parallel, int) or parallel < 1):
+        _fail(f"{PARALLEL} must be a positive number")
+    return Workspace(configs, parallel if isinstance(parallel, int) else None)
+
+
+def build_one(cli: Args) -> WorkspaceResult:
+    """
+    Build and install a single config of a
+    workspace, capturing everything it prints
+
+    This runs in a worker process, from the
+    folder of the config
+
+    cli: Arguments of the build
+
+    Returns:
+        WorkspaceResult
+    """
+    getcontext().prec = 3
+    out = io.StringIO()
+    ok = True
+    archives: list[Path] = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+        try:
+            os.chdir(cli.path.parent)
+            contexts = load_contexts(cli)
+            if contexts is None:
+                ok = False
+            else:
+                archives = run(contexts)
+        except SystemExit as e:
+            ok = e.code is None or e.code == 0
+        except Exception:
+            traceback.print_exc()
+            ok = False
+    return WorkspaceResult(
+        cli.path, ok, time.perf_counter() - start, archives, out.getvalue()
+    )
+
+
+def run_workspace(cli: Args) -> None:
+    """
+    Build every config in a workspace, several at a time,
+    and print a table of the results
+
+    All configs are parsed before anything is built, so
+    mistakes are reported early. Builds run in a pool of
+    processes, which are forked where possible so they
+    share the interpreter, imports, and the Blender
+    versions found here.
+
+    cli: Parsed arguments, where path is the workspace file.
+        Other arguments apply to every config
+
+    Returns:
+        None
+    """
+    workspace = load_workspace(cli.path)
+    if not len(workspace.configs):
+        _fail(f"{cli.path} doesn't list any configs")
+
+    builds: list[Args] = []
+    for path in workspace.configs:
+        build_cli = attrs.evolve(cli, path=path, command="build")
+        try:
+            load_config(build_cli)
+        except SystemExit:
+            _fail(f"Invalid config {path}")
+        builds.append(build_cli)
+    install.version_index()
+
+    jobs = (
+        workspace.parallel
+        if workspace.parallel is not None
+        else min(len(builds), os.cpu_count() or 1)
+    )
+    context = multiprocessing.get_context(
+        "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    )
+    start = time.perf_counter()
+    with ProcessPoolExecutor(jobs, mp_context=context) as executor:
+        results = list(executor.map(build_one, builds))
+    elapsed = time.perf_counter() - start
+
+    root = cli.path.parent.resolve()
+    for result in results:
+        if not result.ok or cli.debug_mode:
+            console.rule(str(_relative(result.config, root)))
+            print(result.output, end="")
+
+    table = Table(title=f"Built {len(results)} configs in {elapsed:.2f}s")
+    table.add_column("Config", overflow="fold")
+    table.add_column("Status")
+    table.add_column("Time", justify="right")
+    table.add_column("Archives")
+    for result in results:
+        table.add_row(
+            str(_relative(result.config, root)),
+            "[green]ok[/green]" if result.ok else "[red]failed[/red]",
+            f"{result.seconds:.2f}s",
+            ", ".join(a.name for a in result.archives),
+        )
+    console.print(table)
+
+    if not all(result.ok for result in results):
+        exit_fail()
+
+
+def _relative(path: Path, root: Path) -> Path:
+    try:
+        return path.relative_to(root)
+    except ValueError:
+        return path
@@ -5,6 +5,8 @@ from pathlib import Path
 
 from typing_extensions import override
 
+from .ignore import IgnoreMatcher
+
 
 class BlInfoVisitor(ast.NodeVisitor):
     """Check for assignment and use of bl_info"""
@@ -53,7 +55,9 @@ class AbsoluteImportVisitor(ast.NodeVisitor):
 
 
 def check_for_compat_issues(
-    addon_src: Path, alternate_module_name: str | None = None
+    addon_src: Path,
+    alternate_module_name: str | None = None,
+    exclude: IgnoreMatcher | None = None,
 ) -> None:
     """Detect compatibility issues in addons
 
@@ -68,12 +72,19 @@ def check_for_compat_issues(
     :param alternate_module_name: Alternative base module name
     :type alternate_module_name: str | None
 
+    :param exclude: Paths to skip, such as build.paths_exclude_pattern in the manifest
+    :type exclude: IgnoreMatcher | None
+
     :raises SyntaxError: If any compatibility issues are found
     """
 
     if not addon_src.is_dir():
         raise NotADirectoryError("addon_src must be a directory!")
-    for file in addon_src.rglob("*.py"):
+    if exclude is None:
+        exclude = IgnoreMatcher([])
+    for file in exclude.walk(addon_src):
+        if file.suffix != ".py":
+            continue
         with open(file, "r") as f:
             root = ast.parse(f.read())
             blinfo_visitor = BlInfoVisitor()
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Iterator
+
+# Windows paths are case insensitive, which fnmatch
+# also respects, so we do the same
+FLAGS = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+
+
+def _translate_class(pattern: str, i: int) -> tuple[str, int]:
+    """Translate a character class starting at pattern[i] == "[".
+
+    :return: The regex of the class, and the index after it. If
+        the class isn't closed, "[" is matched literally
+    """
+    j = i + 1
+    if j < len(pattern) and pattern[j] in "!^":
+        j += 1
+    if j < len(pattern) and pattern[j] == "]":
+        j += 1
+    while j < len(pattern) and pattern[j] != "]":
+        j += 1
+    if j >= len(pattern):
+        return re.escape("["), i + 1
+
+    body = pattern[i + 1 : j].replace("\\", "\\\\")
+    if body[0] in "!^":
+        body = "^" + body[1:]
+    # Slashes are never matched by a class, just like in git
+    return f"(?!/)[{body}]", j + 1
+
+
+def translate(pattern: str) -> str:
+    """Translate a single gitignore-style glob into a regex.
+
+    ``*`` and ``?`` don't match slashes, while ``**`` matches any
+    number of folders when it's a whole path component.
+
+    :param pattern: Glob without the leading ``!``, or trailing ``/``
+    :type pattern: str
+
+    :return: Regex matching the whole relative path
+    :rtype: str
+    """
+    res = ""
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern[i : i + 2] == "**":
+                j = i + 2
+                whole = (i == 0 or pattern[i - 1] == "/") and (
+                    j == n or pattern[j] == "/"
+                )
+                if whole and j == n:
+                    res += ".*"
+                    i = j
+                    continue
+                elif whole:
+                    res += "(?:.*/)?"
+                    i = j + 1
+                    continue
+                i = j
+            else:
+                i += 1
+            res += "[^/]*"
+            continue
+        elif c == "?":
+            res += "[^/]"
+        elif c == "[":
+            class_re, i = _translate_class(pattern, i)
+            res += class_re
+            continue
+        elif c == "\\" and i + 1 < n:
+            res += re.escape(pattern[i + 1])
+            i += 2
+            continue
+        else:
+            res += re.escape(c)
+        i += 1
+    return res
+
+
+class IgnoreMatcher:
+    """Precompiled set of gitignore-style patterns
+
+    The following is supported:
+    - Blank lines and lines starting with ``#`` are skipped
+    - Patterns starting with ``!`` re-include paths excluded before
+    - Patterns ending with ``/`` only match folders
+    - Patterns with a ``/`` anywhere else are anchored to the root,
+      while other patterns match a name at any depth
+    - ``*``, ``?``, ``[...]`` and ``**``
+
+    Like git, the last matching pattern wins, and excluded
+    folders are never entered, so their contents can't be
+    included again.
+
+    Consecutive patterns of the same kind are combined into
+    a single regex, so the cost of matching a path barely
+    depends on the number of patterns.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        """
+        :param patterns: Patterns to compile, in order
+        :type patterns: Iterable[str]
+
+        :raises re.error: If a pattern can't be compiled
+        """
+        self.patterns: list[str] = []
+
+        # Groups of (negate, dir_only, regexes), in order
+        groups: list[tuple[bool, bool, list[str]]] = []
+        for raw in patterns:
+            pattern = raw.rstrip("\n")
+            if pattern.strip() == "" or pattern.startswith("#"):
+                continue
+            self.patterns.append(pattern)
+
+            negate = pattern.startswith("!")
+            if negate:
+                pattern = pattern[1:]
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            if "/" in pattern:
+                regex = translate(pattern[1:] if pattern.startswith("/") else pattern)
+            else:
+                regex = "(?:.*/)?" + translate(pattern)
+
+            if len(groups) and groups[-1][0] == negate and groups[-1][1] == dir_only:
+                groups[-1][2].append(regex)
+            else:
+                groups.append((negate, dir_only, [regex]))
+
+        # Checked last to first, as later patterns win
+        self._groups: list[tuple[bool, bool, re.Pattern[str]]] = [
+            (negate, dir_only, re.compile("(?:" + "|".join(regexes) + r")\Z", FLAGS))
+            for negate, dir_only, regexes in reversed(groups)
+        ]
+
+    def __bool__(self) -> bool:
+        return len(self._groups) > 0
+
+    def match(self, rel_path: str, is_dir: bool = False) -> bool:
+        """Check if a path is excluded by the patterns.
+
+        This only checks the path itself, and not its parents.
+
+        :param rel_path: POSIX path relative to the root of the patterns
+        :type rel_path: str
+
+        :param is_dir: Whether the path is a folder
+        :type is_dir: bool
+
+        :return: True if the path is excluded
+        :rtype: bool
+        """
+        for negate, dir_only, regex in self._groups:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                return not negate
+        return False
+
+    def prune(
+        self, rel_dir: str, dirnames: list[str], filenames: list[str]
+    ) -> list[str]:
+        """Remove excluded entries of a folder, for use with os.walk.
+
+        dirnames is changed in place, so os.walk doesn't
+        enter excluded folders.
+
+        :param rel_dir: POSIX path of the folder relative to the root, or ""
+        :type rel_dir: str
+
+        :param dirnames: Folders in the folder, which is changed in place
+        :type dirnames: list[str]
+
+        :param filenames: Files in the folder
+        :type filenames: list[str]
+
+        :return: Files that aren't excluded
+        :rtype: list[str]
+        """
+        if not self:
+            return filenames
+        prefix = "" if rel_dir == "" else rel_dir + "/"
+        dirnames[:] = [d for d in dirnames if not self.match(prefix + d, True)]
+        return [f for f in filenames if not self.match(prefix + f)]
+
+    def walk(self, root: Path) -> Iterator[Path]:
+        """Get all files in a folder that aren't excluded.
+
+        :param root: Folder to walk, which the patterns are relative to
+        :type root: Path
+
+        :return: Iterator of the paths of all files, in a stable order
+        :rtype: Iterator[Path]
+        """
+        for dirpath, dirnames, filenames in os.walk(root):
+            rel_dir = os.path.relpath(dirpath, root)
+            rel_dir = "" if rel_dir == "." else Path(rel_dir).as_posix()
+            dirnames.sort()
+            for name in sorted(self.prune(rel_dir, dirnames, filenames)):
+                yield Path(dirpath, name)
@@ -27,19 +27,50 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import errno
+import json
+import os
+import shutil
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+import zipfile
+from decimal import Decimal
 from io import StringIO
 from pathlib import Path
+from typing import Optional
 from unittest import mock
 
 import bpy_addon_build as bab
+from bpy_addon_build import client, daemon, trace, watch
+from bpy_addon_build.args import parse_args
+from bpy_addon_build.build_context import archive, artifacts, fileio, receipt, stage
 from bpy_addon_build.build_context.install import get_paths
+from bpy_addon_build.config import build_config
+from bpy_addon_build.session import ContextCache
+from lib_bpybuild_ext.ignore import IgnoreMatcher
 
 # parent folder of the tests
 TEST_FOLDER = Path(__file__).parent
 VERSIONS = [2.8, 3.4, 3.5]
 
 
+def install_folders(home: str, versions: list[str]) -> list[Path]:
+    """Create a folder for each version of Blender in home,
+    and return the paths test_addon gets installed to"""
+    addons: list[Path] = []
+    for version in versions:
+        Path(home, ".config", "blender", version).mkdir(parents=True)
+        addons.append(
+            Path(home, ".config/blender", version, "scripts/addons/MCprep_addon")
+        )
+    return addons
+
+
 class TestBpyBuild(unittest.TestCase):
     """A lot of the argument stuff requires complex
     unittest mocking, half of which I only learned from
@@ -304,6 +335,400 @@ class TestBpyBuild(unittest.TestCase):
         for path in get_paths(VERSIONS):
             self.assertIn(f"POST INSTALL {path}", stdout_list)
 
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_all_installed(self, mock_stdout: StringIO) -> None:
+        """Install test_addon with --all-installed, with
+        and without a floor, then add a version.
+
+        This test will check for:
+        - Every version at or above 2.8 being installed to,
+          including 6.0 which isn't in install_versions
+        - Only versions at or above 3.0 with a floor of 3.0
+        - 2.8 matching the 2.80 folder
+        - A new version being found without a new process
+        - 4.2 getting extensions without a precision of 3,
+          like in a new thread
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        argv = ["bab", "-c", config, "-s", "--all-installed"]
+        with tempfile.TemporaryDirectory() as tmp:
+            blender = Path(tmp, ".config", "blender")
+            for name in ["2.79", "2.80", "3.5", "6.0", "config"]:
+                blender.joinpath(name).mkdir(parents=True)
+            with mock.patch.dict(os.environ, {"HOME": tmp}):
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                installed = list(blender.glob("*/scripts/addons/MCprep_addon"))
+                self.assertEqual(len(installed), 3)
+                self.assertFalse(blender.joinpath("2.79", "scripts").exists())
+                self.assertTrue(blender.joinpath("6.0", "scripts").exists())
+                self.assertEqual(
+                    get_paths([2.8]), [blender.joinpath("2.80", "scripts/addons")]
+                )
+
+                shutil.rmtree(blender.joinpath("2.80", "scripts"))
+                with mock.patch("sys.argv", argv + ["3.0"]):
+                    bab.main()
+                self.assertFalse(blender.joinpath("2.80", "scripts").exists())
+
+                blender.joinpath("7.0").mkdir()
+                self.assertEqual(
+                    get_paths([7.0]), [blender.joinpath("7.0", "scripts/addons")]
+                )
+
+                blender.joinpath("4.2").mkdir()
+                found: list[Path] = []
+                thread = threading.Thread(
+                    target=lambda: found.extend(get_paths([Decimal("4.2")], True))
+                )
+                thread.start()
+                thread.join()
+                self.assertEqual(
+                    found, [blender.joinpath("4.2", "extensions/user_default")]
+                )
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_parallel_install(self, mock_stdout: StringIO) -> None:
+        """Install test_addon to 6 versions of Blender
+        with -j 4, twice.
+
+        This test will check for:
+        - Every version having all files of the archive
+        - "POST INSTALL {install_path}" once per version, in order
+        - The output being the same both times
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        zip_path = TEST_FOLDER / "test_addon/build/MCprep_addon.zip"
+        versions = ["3.0", "3.1", "3.2", "3.3", "3.4", "3.5"]
+        with tempfile.TemporaryDirectory() as tmp:
+            for ver in versions:
+                Path(tmp, ".config", "blender", ver).mkdir(parents=True)
+            argv = ["bab", "-c", config, "-s", "-j", "4", "-v", *versions]
+            outputs: list[list[str]] = []
+            with mock.patch.dict(os.environ, {"HOME": tmp}):
+                for _ in range(2):
+                    with mock.patch("sys.argv", argv):
+                        bab.main()
+                    outputs.append(mock_stdout.getvalue().split("\n"))
+                    mock_stdout.truncate(0)
+                    mock_stdout.seek(0)
+
+            with zipfile.ZipFile(zip_path) as zf:
+                names = sorted(n for n in zf.namelist() if not n.endswith("/"))
+            installed = [
+                Path(tmp, ".config", "blender", ver, "scripts", "addons")
+                for ver in versions
+            ]
+            for path in installed:
+                files = sorted(
+                    p.relative_to(path).as_posix()
+                    for p in path.joinpath("MCprep_addon").rglob("*")
+                    if p.is_file()
+                )
+                self.assertEqual(names, files)
+
+            self.assertEqual(outputs[0], outputs[1])
+            post = [line for line in outputs[0] if line.startswith("POST INSTALL")]
+            self.assertEqual(post, [f"POST INSTALL {path}" for path in installed])
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_install_hook_pairs(self, mock_stdout: StringIO) -> None:
+        """Install a copy of test_addon with pre_install and
+        post_install hooks to 4 versions of Blender with -j 4.
+
+        This test will check for:
+        - pre_install and post_install running in pairs
+          for every version, in order
+        - Every version being installed to
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            project = Path(tmp, "test_addon")
+            shutil.copytree(
+                TEST_FOLDER / "test_addon",
+                project,
+                ignore=shutil.ignore_patterns("build"),
+            )
+            project.joinpath("default.py").write_text(
+                "from bpy_addon_build.api import BabContext\n\n\n"
+                + "def pre_install(ctx: BabContext) -> None:\n"
+                + '    print("PRE INSTALL")\n\n\n'
+                + "def post_install(ctx: BabContext) -> None:\n"
+                + '    print("POST INSTALL", ctx.current_path)\n'
+            )
+            versions = ["3.0", "3.1", "3.2", "3.3"]
+            installed = install_folders(tmp, versions)
+            argv = ["bab", "-c", str(project / "bpy-build.yaml"), "-s", "-j", "4"]
+            with mock.patch.dict(os.environ, {"HOME": tmp}):
+                with mock.patch("sys.argv", argv + ["-v", *versions]):
+                    bab.main()
+
+            hooks = [
+                line
+                for line in mock_stdout.getvalue().split("\n")
+                if line.endswith("INSTALL") or line.startswith("POST INSTALL")
+            ]
+            expected: list[str] = []
+            for addon in installed:
+                expected += ["PRE INSTALL", f"POST INSTALL {addon.parent}"]
+                self.assertTrue(addon.joinpath("hello.txt").exists())
+            self.assertEqual(hooks, expected)
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_sync_install(self, mock_stdout: StringIO) -> None:
+        """Install test_addon with --install-mode sync, then
+        add a stale file and a __pycache__ folder, change an
+        installed file, and install it again.
+
+        This test will check for:
+        - ignore.blend not being written again
+        - hello.txt being restored
+        - The stale file being removed
+        - The __pycache__ folder being kept
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        argv = ["bab", "-c", config, "-s", "-v", "3.5", "--install-mode", "sync"]
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, ".config", "blender", "3.5").mkdir(parents=True)
+            addon = Path(tmp, ".config/blender/3.5/scripts/addons/MCprep_addon")
+            with mock.patch.dict(os.environ, {"HOME": tmp}):
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                inode = addon.joinpath("ignore.blend").stat().st_ino
+                mtime = addon.joinpath("ignore.blend").stat().st_mtime_ns
+
+                addon.joinpath("hello.txt").write_text("changed")
+                addon.joinpath("stale.py").write_text("")
+                addon.joinpath("__pycache__").mkdir()
+                addon.joinpath("__pycache__", "cached.pyc").write_bytes(b"pyc")
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+
+            self.assertEqual(addon.joinpath("ignore.blend").stat().st_ino, inode)
+            self.assertEqual(addon.joinpath("ignore.blend").stat().st_mtime_ns, mtime)
+            self.assertEqual(addon.joinpath("hello.txt").read_text(), "")
+            self.assertFalse(addon.joinpath("stale.py").exists())
+            self.assertTrue(addon.joinpath("__pycache__", "cached.pyc").exists())
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_atomic_install(self, mock_stdout: StringIO) -> None:
+        """Install test_addon with --install-mode atomic,
+        then with -b dev, then roll back twice.
+
+        This test will check for:
+        - The dev install replacing the first one
+        - The first install being kept in .bab-previous
+        - rollback restoring the first install
+        - Rolling back again restoring the dev install,
+          without swapping the folders in one step
+        - A warning when an install can't be swapped in one step
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        argv = ["bab", "-c", config, "-s", "-v", "3.5", "--install-mode", "atomic"]
+        rollback = ["bab", "rollback", "-c", config, "-v", "3.5"]
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, ".config", "blender", "3.5").mkdir(parents=True)
+            addons = Path(tmp, ".config/blender/3.5/scripts/addons")
+            addon = addons.joinpath("MCprep_addon")
+            with mock.patch.dict(os.environ, {"HOME": tmp}):
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                with mock.patch("sys.argv", argv + ["-b", "dev"]):
+                    bab.main()
+                self.assertTrue(addon.joinpath("mcprep_dev.txt").exists())
+                self.assertFalse(addon.joinpath("ignore.blend").exists())
+                previous = addons.joinpath(".bab-previous", "MCprep_addon")
+                self.assertTrue(previous.joinpath("ignore.blend").exists())
+                self.assertFalse(addons.joinpath(".bab-staging").exists())
+
+                with mock.patch("sys.argv", rollback):
+                    bab.main()
+                self.assertIn("Rolled back MCprep_addon", mock_stdout.getvalue())
+                self.assertTrue(addon.joinpath("ignore.blend").exists())
+                self.assertFalse(addon.joinpath("mcprep_dev.txt").exists())
+
+                # Without renameat2, like on NFS
+                with mock.patch("sys.argv", rollback):
+                    with mock.patch.object(fileio, "exchange", return_value=False):
+                        bab.main()
+                self.assertTrue(addon.joinpath("mcprep_dev.txt").exists())
+                self.assertFalse(addons.joinpath(".bab-staging").exists())
+                self.assertNotIn("single step", mock_stdout.getvalue())
+
+                with mock.patch("sys.argv", argv):
+                    with mock.patch.object(fileio, "exchange", return_value=False):
+                        bab.main()
+                self.assertIn("in a single step", mock_stdout.getvalue())
+                self.assertTrue(addon.joinpath("ignore.blend").exists())
+                self.assertTrue(previous.joinpath("mcprep_dev.txt").exists())
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_link_install(self, mock_stdout: StringIO) -> None:
+        """Install test_addon to two versions with --install-mode
+        link, then with -b dev, then with --install-mode sync.
+
+        This test will check for:
+        - Both installs being symlinks to build/linked
+        - The dev build showing up in both installs
+        - A sync install replacing the symlink with a folder
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        argv = ["bab", "-c", config, "-s", "--install-mode", "link", "-v", "3.5", "4.0"]
+        linked = Path(TEST_FOLDER, "test_addon/build/linked/MCprep_addon").resolve()
+        with tempfile.TemporaryDirectory() as tmp:
+            addons = install_folders(tmp, ["3.5", "4.0"])
+            with mock.patch.dict(os.environ, {"HOME": tmp}):
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                for addon in addons:
+                    self.assertTrue(addon.is_symlink())
+                    self.assertEqual(addon.resolve(), linked)
+                    self.assertTrue(addon.joinpath("ignore.blend").exists())
+
+                with mock.patch("sys.argv", argv + ["-b", "dev"]):
+                    bab.main()
+                for addon in addons:
+                    self.assertTrue(addon.is_symlink())
+                    self.assertTrue(addon.joinpath("mcprep_dev.txt").exists())
+                    self.assertFalse(addon.joinpath("ignore.blend").exists())
+
+                sync = [
+                    "bab",
+                    "-c",
+                    config,
+                    "-s",
+                    "--install-mode",
+                    "sync",
+                    "-v",
+                    "3.5",
+                ]
+                with mock.patch("sys.argv", sync):
+                    bab.main()
+                self.assertFalse(addons[0].is_symlink())
+                self.assertTrue(addons[0].joinpath("ignore.blend").exists())
+                self.assertTrue(linked.joinpath("mcprep_dev.txt").exists())
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_hardlink_install(self, mock_stdout: StringIO) -> None:
+        """Install test_addon to two versions with --install-mode
+        hardlink, then with -b dev, then without hardlinks.
+
+        This test will check for:
+        - Both installs sharing the files in build/linked
+        - The dev build replacing both installs
+        - Files being copied when they can't be hardlinked
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        argv = ["bab", "-c", config, "-s", "--install-mode", "hardlink"]
+        argv += ["-v", "3.5", "4.0"]
+        linked = Path(TEST_FOLDER, "test_addon/build/linked/MCprep_addon")
+        with tempfile.TemporaryDirectory() as tmp:
+            addons = install_folders(tmp, ["3.5", "4.0"])
+            with mock.patch.dict(os.environ, {"HOME": tmp}):
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                source = linked.joinpath("hello.txt").stat()
+                for addon in addons:
+                    self.assertFalse(addon.is_symlink())
+                    self.assertEqual(
+                        addon.joinpath("hello.txt").stat().st_ino, source.st_ino
+                    )
+                    self.assertTrue(addon.joinpath("ignore.blend").exists())
+
+                with mock.patch("sys.argv", argv + ["-b", "dev"]):
+                    bab.main()
+                source = linked.joinpath("mcprep_dev.txt").stat()
+                for addon in addons:
+                    self.assertEqual(
+                        addon.joinpath("mcprep_dev.txt").stat().st_ino, source.st_ino
+                    )
+                    self.assertFalse(addon.joinpath("ignore.blend").exists())
+
+                # Like when installing to another device
+                with mock.patch("sys.argv", argv):
+                    with mock.patch.object(
+                        os, "link", side_effect=OSError(errno.EXDEV, "Cross-device")
+                    ):
+                        bab.main()
+                source = linked.joinpath("hello.txt").stat()
+                for addon in addons:
+                    copied = addon.joinpath("hello.txt").stat()
+                    self.assertNotEqual(copied.st_ino, source.st_ino)
+                    self.assertTrue(addon.joinpath("ignore.blend").exists())
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_receipts(self, mock_stdout: StringIO) -> None:
+        """Install test_addon to two versions twice, verify
+        the installs, change them, and verify them again.
+
+        This test will check for:
+        - The second install skipping both versions
+        - verify passing, even when only a modification time changed
+          or __pycache__ was written to
+        - verify failing and listing changed, missing, and added files
+        - Changed files being found by their SHA-256, even with
+          the same size and CRC-32
+        - The next install replacing the installs that changed
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        argv = ["bab", "-c", config, "-s", "-v", "3.5", "4.0"]
+        verify = ["bab", "verify", "-c", config, "-v", "3.5", "4.0"]
+        with tempfile.TemporaryDirectory() as tmp:
+            addons = install_folders(tmp, ["3.5", "4.0"])
+            with mock.patch.dict(os.environ, {"HOME": tmp}):
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                inodes = [a.joinpath("hello.txt").stat().st_ino for a in addons]
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                self.assertEqual(
+                    [a.joinpath("hello.txt").stat().st_ino for a in addons], inodes
+                )
+                self.assertTrue(addons[0].parent.joinpath(".bab-receipts").exists())
+
+                st = addons[0].joinpath("ignore.blend").stat()
+                os.utime(
+                    addons[0].joinpath("ignore.blend"),
+                    ns=(st.st_atime_ns, st.st_mtime_ns + 10**9),
+                )
+                addons[0].joinpath("__pycache__").mkdir()
+                addons[0].joinpath("__pycache__", "hello.pyc").touch()
+                with mock.patch("sys.argv", verify):
+                    bab.main()
+                self.assertIn("Verified 2 installs", mock_stdout.getvalue())
+
+                # A CRC-32 collision is made by writing the size
+                # and CRC of a changed file to the receipt
+                blend = addons[0].joinpath("ignore.blend")
+                blend.write_text("changed")
+                file = receipt.receipt_file(addons[0].parent, "MCprep_addon")
+                data = json.loads(file.read_text())
+                crc, size = fileio.crc32_file(blend)
+                data["files"]["ignore.blend"] = [size, 0, crc]
+                file.write_text(json.dumps(data))
+                installed = receipt.load(addons[0].parent, "MCprep_addon")
+                assert installed is not None
+                self.assertEqual(
+                    receipt.check(addons[0], installed).changed, ["ignore.blend"]
+                )
+
+                addons[0].joinpath("hello.txt").write_text("changed")
+                addons[1].joinpath("ignore.blend").unlink()
+                addons[1].joinpath("extra.txt").touch()
+                with mock.patch("sys.argv", verify), self.assertRaises(SystemExit):
+                    bab.main()
+                output = mock_stdout.getvalue()
+                self.assertIn("~ hello.txt", output)
+                self.assertIn("- ignore.blend", output)
+                self.assertIn("+ extra.txt", output)
+
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                self.assertEqual(addons[0].joinpath("hello.txt").read_text(), "")
+                self.assertTrue(addons[1].joinpath("ignore.blend").exists())
+                self.assertFalse(addons[1].joinpath("extra.txt").exists())
+                with mock.patch("sys.argv", verify):
+                    bab.main()
+
     @mock.patch("sys.stdout", new_callable=StringIO)
     def test_old(self, mock_stdout: StringIO) -> None:
         """Performs a test build using the
@@ -378,6 +803,82 @@ class TestBpyBuild(unittest.TestCase):
             ).exists()
         )
 
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_parallel_old_main(self, mock_stdout: StringIO) -> None:
+        """Build a copy of test_legacy_extension with a relative
+        config, while its main hook without arguments changes the
+        working directory as the other variant is being copied
+
+        This test will check for:
+        - MCprep_addon.zip
+        - MCprep_addon_legacy.zip, with mcprep_dev.txt
+        """
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            project = Path(tmp, "project")
+            shutil.copytree(
+                TEST_FOLDER / "test_legacy_extension",
+                project,
+                ignore=shutil.ignore_patterns("build"),
+            )
+            # Without pre_build and clean_up hooks,
+            # variants are built at the same time
+            project.joinpath("default.py").write_text("")
+            project.joinpath("old.py").write_text(
+                "import time\n\n\n"
+                + "def main() -> None:\n"
+                + "    time.sleep(0.3)\n"
+                + "    open('mcprep_dev.txt', 'w').write('hi guys c:')\n"
+            )
+            for i in range(1000):
+                project.joinpath("MCprep_addon", f"f{i}.txt").write_text(str(i))
+            try:
+                os.chdir(project)
+                with mock.patch(
+                    "sys.argv", ["bab", "-c", "bpy-build.yaml", "-b", "old"]
+                ):
+                    with mock.patch("os.cpu_count", return_value=4):
+                        bab.main()
+            finally:
+                os.chdir(cwd)
+
+            build = project.joinpath("build")
+            self.assertTrue(build.joinpath("MCprep_addon.zip").exists())
+            with zipfile.ZipFile(build / "MCprep_addon_legacy.zip") as zf:
+                self.assertIn("MCprep_addon_legacy/mcprep_dev.txt", zf.namelist())
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_variant_hook_order(self, mock_stdout: StringIO) -> None:
+        """Build test_legacy_extension, whose default action
+        has pre_build and clean_up hooks, with 4 CPUs
+
+        This test will check for:
+        - The extension running pre_build, main, and clean_up
+          before the legacy addon runs any of them
+        """
+        config = f"{TEST_FOLDER}/test_legacy_extension/bpy-build.yaml"
+        with mock.patch("sys.argv", ["bab", "-c", config]):
+            with mock.patch("os.cpu_count", return_value=4):
+                bab.main()
+
+        folder = TEST_FOLDER / "test_legacy_extension"
+        hooks = [
+            line
+            for line in mock_stdout.getvalue().split("\n")
+            if line.startswith(("PRE BUILD", "MAIN", "CLEAN UP"))
+        ]
+        self.assertEqual(
+            hooks,
+            [
+                f"PRE BUILD {folder}/MCprep_addon",
+                f"MAIN {folder}/build/stage-1_extension/MCprep_addon",
+                f"CLEAN UP {folder}/MCprep_addon",
+                f"PRE BUILD {folder}/MCprep_addon",
+                f"MAIN {folder}/build/stage-1/MCprep_addon_legacy",
+                f"CLEAN UP {folder}/MCprep_addon",
+            ],
+        )
+
     @mock.patch("sys.stdout", new_callable=StringIO)
     def test_legacy_extension_build(self, mock_stdout: StringIO) -> None:
         """Perform a test build using the
@@ -416,6 +917,964 @@ class TestBpyBuild(unittest.TestCase):
             ).exists()
         )
 
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_incremental(self, mock_stdout: StringIO) -> None:
+        """Perform two incremental builds using the
+        project in test_addon, first with -b dev, then
+        without.
+
+        This test will check for:
+        - stage-1/MCprep_addon/mcprep_dev.txt after the first build
+        - Lack of stage-1/MCprep_addon/ignore.blend after the first build
+        - Lack of stage-1/MCprep_addon/mcprep_dev.txt after the second build
+        - stage-1/MCprep_addon/ignore.blend after the second build
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        stage = Path(f"{TEST_FOLDER}/test_addon/build/stage-1/MCprep_addon")
+        with mock.patch("sys.argv", ["bab", "-c", config, "-i", "-b", "dev"]):
+            bab.main()
+        self.assertTrue((stage / "mcprep_dev.txt").exists())
+        self.assertFalse((stage / "ignore.blend").exists())
+
+        with mock.patch("sys.argv", ["bab", "-c", config, "-i"]):
+            bab.main()
+        self.assertFalse((stage / "mcprep_dev.txt").exists())
+        self.assertTrue((stage / "ignore.blend").exists())
+        self.assertTrue((stage / "hello.txt").exists())
+
+    def test_sync_touched(self) -> None:
+        """Sync a folder, change a file in the destination
+        while keeping its size and modification time, and
+        sync again.
+
+        This test will check for:
+        - The changed file being reported by find_touched
+        - The changed file being restored by the second sync
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp, "src")
+            dst = Path(tmp, "dst")
+            src.joinpath("sub").mkdir(parents=True)
+            src.joinpath("sub", "a.txt").write_text("aaaa")
+
+            scan = stage.scan_tree(src)
+            stats = stage.sync_tree(src, scan, dst, set())
+            self.assertEqual(stats.files, 1)
+
+            changed = dst / "sub" / "a.txt"
+            st = changed.stat()
+            changed.write_text("bbbb")
+            os.utime(changed, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+            touched = stage.find_touched(dst, stats.staged)
+            self.assertEqual(touched, {"sub/a.txt"})
+
+            _ = stage.sync_tree(src, stage.scan_tree(src), dst, touched)
+            self.assertEqual(changed.read_text(), "aaaa")
+
+    def test_incremental_archive(self) -> None:
+        """Archive a folder twice in incremental mode,
+        changing one file between both archives.
+
+        This test will check for:
+        - The unchanged file being reused from the first archive
+        - The changed file being compressed again
+        - The second archive passing ZipFile.testzip
+        - The contents of both files in the second archive
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp, "stage")
+            root.joinpath("addon").mkdir(parents=True)
+            root.joinpath("addon", "a.txt").write_text("a" * 1000)
+            root.joinpath("addon", "b.txt").write_text("b" * 1000)
+            zip_path = Path(tmp, "addon.zip")
+
+            stats = archive.write_archive(root, zip_path, True)
+            self.assertEqual(stats.compressed, 2)
+
+            root.joinpath("addon", "b.txt").write_text("c" * 1000)
+            stats = archive.write_archive(root, zip_path, True)
+            self.assertEqual(stats.reused, 1)
+            self.assertEqual(stats.compressed, 1)
+
+            with zipfile.ZipFile(zip_path) as zf:
+                self.assertIsNone(zf.testzip())
+                self.assertEqual(zf.read("addon/a.txt"), b"a" * 1000)
+                self.assertEqual(zf.read("addon/b.txt"), b"c" * 1000)
+
+    def test_archive_workers(self) -> None:
+        """Archive the same folder with 1 and 4 workers.
+
+        This test will check for:
+        - Both archives being byte for byte identical
+        - The archive passing ZipFile.testzip
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp, "stage")
+            root.joinpath("addon", "sub").mkdir(parents=True)
+            for i in range(20):
+                root.joinpath("addon", "sub", f"{i}.py").write_text(str(i) * i * 100)
+
+            archive.write_archive(root, Path(tmp, "one.zip"), workers=1)
+            archive.write_archive(root, Path(tmp, "four.zip"), workers=4)
+            self.assertEqual(
+                Path(tmp, "one.zip").read_bytes(), Path(tmp, "four.zip").read_bytes()
+            )
+            with zipfile.ZipFile(Path(tmp, "four.zip")) as zf:
+                self.assertIsNone(zf.testzip())
+
+    def test_compression(self) -> None:
+        """Parse a config with compression rules,
+        and check how files would be compressed.
+
+        This test will check for:
+        - *.png being stored
+        - *.py being deflated with level 9
+        - Other files being deflated with the default level
+        - Every file being stored with --fast
+        - Patterns being matched like ignore_filters,
+          with the last matching pattern winning
+        """
+        config = build_config(
+            {
+                "addon_folder": "MCprep_addon",
+                "build_name": "MCprep_addon",
+                "build_extension": False,
+                "compression": {
+                    "*.png": "store",
+                    "*.py": {"method": "deflate", "level": 9},
+                    "data/": "lzma",
+                    "/data/keep/**/*.png": "bzip2",
+                },
+            }
+        )
+        policy = archive.compression_policy(config.compression)
+        self.assertEqual(policy("icons/a.png").compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(policy("__init__.py").level, 9)
+        self.assertEqual(policy("hello.txt"), archive.Compression())
+        self.assertEqual(policy("sub/data/a.py").compress_type, zipfile.ZIP_LZMA)
+        self.assertEqual(policy("data").compress_type, zipfile.ZIP_DEFLATED)
+        for path in ["data/keep/a.png", "data/keep/x/y/a.png"]:
+            self.assertEqual(policy(path).compress_type, zipfile.ZIP_BZIP2)
+
+        globs = archive.compression_policy(
+            build_config(
+                {
+                    "addon_folder": "MCprep_addon",
+                    "build_name": "MCprep_addon",
+                    "build_extension": False,
+                    "compression": {"**/*.png": "store"},
+                }
+            ).compression
+        )
+        self.assertEqual(globs("a.png").compress_type, zipfile.ZIP_STORED)
+
+        fast = archive.compression_policy(config.compression, True)
+        self.assertEqual(fast("__init__.py").compress_type, zipfile.ZIP_STORED)
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_fast(self, mock_stdout: StringIO) -> None:
+        """Perform a test build using the
+        project in test_addon with --fast.
+
+        This test will check for:
+        - Every file in MCprep_addon.zip being stored
+        """
+        with mock.patch(
+            "sys.argv",
+            ["bab", "-c", f"{TEST_FOLDER}/test_addon/bpy-build.yaml", "--fast"],
+        ):
+            bab.main()
+        build = Path(f"{TEST_FOLDER}/test_addon/build")
+        with zipfile.ZipFile(build / "MCprep_addon.zip") as zf:
+            for info in zf.infolist():
+                self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_fingerprint(self, mock_stdout: StringIO) -> None:
+        """Print the fingerprint of test_addon twice,
+        then build it twice with --skip-unchanged.
+
+        This test will check for:
+        - The fingerprint being the same both times
+        - The second build being skipped with that fingerprint
+        - MCprep_addon.zip being the same as a full rebuild
+        - clean_up hooks only running when pre_build hooks did
+        - SOURCE_DATE_EPOCH changing the fingerprint
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        for _ in range(2):
+            with mock.patch("sys.argv", ["bab", "-c", config, "fingerprint"]):
+                bab.main()
+        lines = mock_stdout.getvalue().split()
+        self.assertEqual(lines[0], "MCprep_addon")
+        self.assertEqual(lines[1], lines[3])
+
+        with mock.patch("sys.argv", ["bab", "-c", config, "--skip-unchanged"]):
+            bab.main()
+        build = Path(f"{TEST_FOLDER}/test_addon/build")
+        first = (build / "MCprep_addon.zip").read_bytes()
+        with mock.patch("sys.argv", ["bab", "-c", config, "--skip-unchanged"]):
+            bab.main()
+        self.assertRegex(mock_stdout.getvalue(), f"Nothing changed.*{lines[1]}")
+        self.assertEqual(mock_stdout.getvalue().count("PRE BUILD"), 1)
+        self.assertEqual(mock_stdout.getvalue().count("CLEAN UP"), 1)
+
+        with mock.patch("sys.argv", ["bab", "-c", config]):
+            bab.main()
+        self.assertEqual(first, (build / "MCprep_addon.zip").read_bytes())
+
+        with mock.patch("sys.argv", ["bab", "-c", config, "fingerprint"]):
+            with mock.patch.dict(os.environ, {"SOURCE_DATE_EPOCH": "1700000000"}):
+                bab.main()
+        self.assertNotEqual(mock_stdout.getvalue().split()[-1], lines[1])
+
+    def test_reproducible_archive(self) -> None:
+        """Archive the same files with different
+        timestamps and permissions.
+
+        This test will check for:
+        - Both archives being identical
+        - Executable files keeping the executable bit
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            zips = []
+            for i, mode in enumerate([0o644, 0o664]):
+                root = Path(tmp, f"stage{i}")
+                root.joinpath("addon").mkdir(parents=True)
+                root.joinpath("addon", "__init__.py").write_text("print('hi')")
+                root.joinpath("addon", "run.sh").write_text("echo hi")
+                os.chmod(root.joinpath("addon", "__init__.py"), mode)
+                os.chmod(root.joinpath("addon", "run.sh"), 0o755)
+                os.utime(root.joinpath("addon", "__init__.py"), (i * 1000, i * 1000))
+                zips.append(Path(tmp, f"{i}.zip"))
+                archive.write_archive(root, zips[-1])
+
+            self.assertEqual(zips[0].read_bytes(), zips[1].read_bytes())
+            with zipfile.ZipFile(zips[0]) as zf:
+                info = zf.getinfo("addon/run.sh")
+                self.assertEqual(info.external_attr >> 16 & 0o777, 0o755)
+                self.assertEqual(info.date_time, archive.ZIP_EPOCH)
+
+    def test_stage_modes(self) -> None:
+        """Sync a folder with every stage mode, then
+        copy over the hardlinked stage.
+
+        This test will check for:
+        - Every mode producing the same files
+        - Copying replacing hardlinks, even if nothing changed
+        - The permissions of the source never changing
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp, "src")
+            src.joinpath("sub").mkdir(parents=True)
+            src.joinpath("a.py").write_text("a")
+            src.joinpath("sub", "b.py").write_text("b")
+            before = os.stat(src / "a.py")
+            scan = stage.scan_tree(src)
+
+            for mode in ["copy", "hardlink", "reflink"]:
+                dst = Path(tmp, mode)
+                stats = stage.sync_tree(src, scan, dst, set(), mode=mode)
+                self.assertEqual(dst.joinpath("sub", "b.py").read_text(), "b")
+                self.assertEqual(len(stats.linked), 2 if mode == "hardlink" else 0)
+
+            dst = Path(tmp, "hardlink")
+            stats = stage.sync_tree(src, scan, dst, set(), mode="copy")
+            self.assertEqual(len(stats.linked), 0)
+            self.assertEqual(stats.files, 2)
+            dst.joinpath("a.py").write_text("new a")
+            self.assertEqual(src.joinpath("a.py").read_text(), "a")
+
+            self.assertEqual(os.stat(src / "a.py").st_mode, before.st_mode)
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_hardlink_build(self, mock_stdout: StringIO) -> None:
+        """Perform a test build using a copy of the project in
+        test_addon with --stage-mode hardlink, with and without
+        main hooks.
+
+        This test will check for:
+        - "DEV MAIN" in mock_stdout
+        - mcprep_dev.txt in stage-1, but not in MCprep_addon
+        - The stage being copied while there are main hooks
+        - The stage being hardlinked without main hooks
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            project = Path(tmp, "project")
+            shutil.copytree(
+                TEST_FOLDER / "test_addon",
+                project,
+                ignore=shutil.ignore_patterns("build"),
+            )
+            config = str(project / "bpy-build.yaml")
+            argv = ["bab", "-c", config, "--stage-mode", "hardlink", "-i"]
+            source = project.joinpath("MCprep_addon", "hello.txt")
+            staged = project.joinpath("build", "stage-1", "MCprep_addon", "hello.txt")
+            default = project.joinpath("default.py")
+            hooks = default.read_text()
+            default.write_text("")
+            with mock.patch("sys.argv", argv):
+                bab.main()
+            self.assertTrue(os.path.samefile(source, staged))
+
+            # The links are broken once main hooks run
+            default.write_text(hooks)
+            with mock.patch("sys.argv", argv + ["-b", "dev"]):
+                bab.main()
+            self.assertRegex(mock_stdout.getvalue(), r"DEV MAIN")
+            self.assertTrue(staged.with_name("mcprep_dev.txt").exists())
+            self.assertFalse(source.with_name("mcprep_dev.txt").exists())
+            self.assertFalse(os.path.samefile(source, staged))
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_stage_backend(self, mock_stdout: StringIO) -> None:
+        """Build test_addon with -b dev on disk, then with
+        --stage-backend tmpfs, then with a --stage-memory
+        of 0.
+
+        This test will check for:
+        - "DEV MAIN" in mock_stdout
+        - mcprep_dev.txt in the stage in --scratch-root
+        - The stage being removed when it doesn't fit
+        - MCprep_addon.zip being the same every time
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        zip_path = TEST_FOLDER / "test_addon/build/MCprep_addon.zip"
+        with mock.patch("sys.argv", ["bab", "-c", config, "-b", "dev"]):
+            bab.main()
+        first = zip_path.read_bytes()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            argv = ["bab", "-c", config, "-b", "dev", "-i"]
+            argv += ["--stage-backend", "tmpfs", "--scratch-root", tmp]
+            with mock.patch("sys.argv", argv):
+                bab.main()
+            self.assertRegex(mock_stdout.getvalue(), r"DEV MAIN")
+            self.assertEqual(first, zip_path.read_bytes())
+            staged = list(Path(tmp).glob("bpy-build/*/tmpfs-stage-1"))
+            self.assertEqual(len(staged), 1)
+            self.assertTrue(
+                staged[0].joinpath("MCprep_addon", "mcprep_dev.txt").exists()
+            )
+
+            with mock.patch("sys.argv", argv + ["--stage-memory", "0"]):
+                bab.main()
+            self.assertFalse(staged[0].exists())
+            self.assertEqual(first, zip_path.read_bytes())
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_plan(self, mock_stdout: StringIO) -> None:
+        """Build a copy of test_addon with -b dev, then add
+        a file and remove one, and run it with --plan.
+
+        This test will check for:
+        - The main hook of dev being listed
+        - The added and removed files being listed
+        - MCprep_addon.zip not being rebuilt
+        - An install that matches its receipt being skipped
+        - Only changed files being listed for an install,
+          without __pycache__
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            project = Path(tmp, "test_addon")
+            shutil.copytree(
+                TEST_FOLDER / "test_addon",
+                project,
+                ignore=shutil.ignore_patterns("build"),
+            )
+            config = str(project / "bpy-build.yaml")
+            addon = project / "MCprep_addon"
+            zip_path = project / "build" / "MCprep_addon.zip"
+            [installed] = install_folders(tmp, ["3.5"])
+            argv = ["bab", "-c", config, "-b", "dev", "-v", "3.5"]
+            argv += ["--install-mode", "sync"]
+            with mock.patch.dict(os.environ, {"HOME": tmp}):
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                built = zip_path.stat().st_mtime_ns
+                installed.joinpath("__pycache__").mkdir()
+                installed.joinpath("__pycache__", "a.pyc").write_text("")
+
+                with mock.patch("sys.argv", argv + ["--plan"]):
+                    bab.main()
+                self.assertIn("matches its receipt, skipped", mock_stdout.getvalue())
+
+                addon.joinpath("hello.txt").unlink()
+                addon.joinpath("planned.txt").write_text("planned")
+                with mock.patch("sys.argv", argv + ["--plan"]):
+                    bab.main()
+            output = mock_stdout.getvalue()
+            self.assertIn("main (dev)", output)
+            self.assertIn("Build: 1 added, 0 changed, 1 removed", output)
+            self.assertIn("(sync): 1 added, 0 changed, 1 removed", output)
+            self.assertIn("+ planned.txt", output)
+            self.assertIn("- hello.txt", output)
+            self.assertNotIn("__pycache__", output)
+            self.assertEqual(built, zip_path.stat().st_mtime_ns)
+
+    def test_ignore_matcher(self) -> None:
+        """Match paths against gitignore-style patterns.
+
+        This test will check for:
+        - Names matching at any depth
+        - Anchored paths and ** only matching from the root
+        - Patterns ending with / only matching folders
+        - Negated patterns including files again
+        - Excluded folders being pruned
+        """
+        matcher = IgnoreMatcher(
+            ["# comment", "*.blend", "!keep.blend", "/top.txt", "a/**/b", "cache/"]
+        )
+        self.assertTrue(matcher.match("sub/x.blend"))
+        self.assertFalse(matcher.match("sub/keep.blend"))
+        self.assertTrue(matcher.match("top.txt"))
+        self.assertFalse(matcher.match("sub/top.txt"))
+        self.assertTrue(matcher.match("a/b"))
+        self.assertTrue(matcher.match("a/x/y/b"))
+        self.assertTrue(matcher.match("x/cache", True))
+        self.assertFalse(matcher.match("x/cache"))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            root.joinpath("cache").mkdir()
+            root.joinpath("cache", "keep.blend").write_text("")
+            root.joinpath("keep.blend").write_text("")
+            root.joinpath("x.blend").write_text("")
+            self.assertEqual([p.name for p in matcher.walk(root)], ["keep.blend"])
+            self.assertEqual(list(stage.scan_tree(root, matcher).files), ["keep.blend"])
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_paths_exclude_pattern(self, mock_stdout: StringIO) -> None:
+        """Perform a test build of a copy of the project
+        in test_extension, with build.paths_exclude_pattern
+        set in blender_manifest.toml.
+
+        This test will check for:
+        - Excluded files not being in MCprep_addon.zip
+        - Excluded files created by main hooks not being in MCprep_addon.zip
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            project = Path(tmp, "test_extension")
+            shutil.copytree(
+                TEST_FOLDER / "test_extension",
+                project,
+                ignore=shutil.ignore_patterns("build"),
+            )
+            manifest = project / "MCprep_addon" / "blender_manifest.toml"
+            with open(manifest, "a") as f:
+                f.write('\n[build]\npaths_exclude_pattern = ["*.blend", "/*.txt"]\n')
+
+            with mock.patch(
+                "sys.argv", ["bab", "-c", f"{project}/bpy-build.yaml", "-b", "dev"]
+            ):
+                bab.main()
+            with zipfile.ZipFile(project / "build" / "MCprep_addon.zip") as zf:
+                names = zf.namelist()
+            self.assertIn("MCprep_addon/blender_manifest.toml", names)
+            self.assertNotIn("MCprep_addon/ignore.blend", names)
+            self.assertNotIn("MCprep_addon/hello.txt", names)
+            self.assertNotIn("MCprep_addon/mcprep_dev.txt", names)
+
+    def test_watcher(self) -> None:
+        """Watch a folder with every available watcher.
+
+        This test will check for:
+        - Changed files being reported
+        - Files in new folders being reported
+        - Nothing being reported on a timeout
+        """
+        watchers = [watch.PollingWatcher]
+        if sys.platform.startswith("linux"):
+            watchers.append(watch.InotifyWatcher)
+
+        for watcher_type in watchers:
+            with tempfile.TemporaryDirectory() as tmp:
+                root = Path(tmp).resolve()
+                root.joinpath("a.py").write_text("a")
+                watcher = watcher_type([root], [])
+                try:
+                    self.assertEqual(watcher.wait(0), set())
+
+                    # Polling relies on modification times
+                    os.utime(root / "a.py", ns=(0, 0))
+                    root.joinpath("a.py").write_text("b")
+                    self.assertIn(root / "a.py", watch.wait_debounced(watcher))
+
+                    root.joinpath("sub").mkdir()
+                    root.joinpath("sub", "b.py").write_text("b")
+                    self.assertIn(root / "sub" / "b.py", watch.wait_debounced(watcher))
+                finally:
+                    watcher.close()
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_watch(self, mock_stdout: StringIO) -> None:
+        """Run watch mode on a copy of test_addon, with changes to
+        an ignored and a copied file, a copied file that is saved
+        without changes, and an action that raises an exception.
+
+        This test will check for:
+        - One build at the start, and one for the copied file
+        - The changed file being in MCprep_addon.zip
+        - Unchanged archives not being installed again
+        - Exceptions being printed, without ending watch mode
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            project = Path(tmp, "test_addon").resolve()
+            shutil.copytree(
+                TEST_FOLDER / "test_addon",
+                project,
+                ignore=shutil.ignore_patterns("build"),
+            )
+            addon = project / "MCprep_addon"
+            dev = project.joinpath("dev.py")
+            dev_script = dev.read_text()
+            failing = dev_script + '    raise RuntimeError("DEV FAILED")\n'
+
+            changes = iter(
+                [
+                    (addon / "new.blend", "changed"),
+                    (addon / "hello.txt", "changed"),
+                    (addon / "hello.txt", "changed"),
+                    (dev, failing),
+                    (dev, dev_script),
+                ]
+            )
+
+            def _change(_: watch.Watcher) -> set[Path]:
+                change = next(changes, None)
+                if change is None:
+                    raise KeyboardInterrupt
+                path, text = change
+                path.write_text(text)
+                return {path}
+
+            install_folders(tmp, ["3.5"])
+            argv = ["bab", "-c", f"{project}/bpy-build.yaml", "-b", "dev"]
+            with mock.patch.dict(os.environ, {"HOME": tmp}):
+                with mock.patch("sys.argv", argv + ["-v", "3.5", "--watch"]):
+                    with mock.patch("bpy_addon_build.watch.wait_debounced", _change):
+                        bab.main()
+
+            output = mock_stdout.getvalue()
+            self.assertEqual(output.count("Rebuilt in"), 4)
+            self.assertIn("MCprep_addon.zip didn't change, skipping install", output)
+            self.assertEqual(output.count("POST INSTALL"), 3)
+            self.assertIn("RuntimeError: DEV FAILED", output)
+            with zipfile.ZipFile(project / "build" / "MCprep_addon.zip") as zf:
+                self.assertEqual(zf.read("MCprep_addon/hello.txt"), b"changed")
+
+    def test_daemon(self) -> None:
+        """Send requests to the daemon, including
+        one with an action that fails.
+
+        This test will check for:
+        - The failing action only failing its request
+        - Output of the build being sent back
+        - Contexts being reused for the same actions
+        - Reused contexts working from another folder
+        - The environment of the client being used,
+          and the daemon's being restored after
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            project = Path(tmp, "test_addon").resolve()
+            shutil.copytree(
+                TEST_FOLDER / "test_addon",
+                project,
+                ignore=shutil.ignore_patterns("build"),
+            )
+            project.joinpath("fail.py").write_text(
+                "from bpy_addon_build.api import BabContext, BpyError\n\n\n"
+                + "def main(ctx: BabContext) -> BpyError:\n"
+                + '    return BpyError("FAILED")\n'
+            )
+            with open(project / "bpy-build.yaml", "a") as f:
+                f.write('  fail:\n    script: "fail.py"\n')
+
+            cache = ContextCache()
+
+            def _request(
+                argv: list[str], cwd: Path = project, home: Optional[Path] = None
+            ) -> tuple[str, int]:
+                env = dict(os.environ)
+                if home is not None:
+                    env["HOME"] = str(home)
+                ours, theirs = socket.socketpair()
+                with ours, theirs:
+                    request = {"argv": argv, "cwd": str(cwd), "env": env}
+                    ours.sendall(json.dumps(request).encode() + b"\n")
+                    daemon.handle(theirs, cache)
+                    theirs.shutdown(socket.SHUT_WR)
+                    output = ""
+                    with ours.makefile("rb") as reader:
+                        for line in reader:
+                            message = json.loads(line)
+                            if "exit" in message:
+                                return output, message["exit"]
+                            output += message.get("out", "") + message.get("err", "")
+                self.fail("No exit code")
+
+            output, code = _request(["-b", "fail"])
+            self.assertEqual(code, -1)
+            self.assertIn("FAILED", output)
+
+            for _ in range(2):
+                output, code = _request(["-b", "dev"])
+                self.assertEqual(code, 0)
+                self.assertIn("DEV MAIN", output)
+            self.assertEqual(len(cache.entries), 2)
+
+            argv = ["-c", "../bpy-build.yaml", "-b", "dev"]
+            output, code = _request(argv, project / "MCprep_addon")
+            self.assertEqual(code, 0, output)
+            self.assertIn("DEV MAIN", output)
+            self.assertEqual(len(cache.entries), 2)
+
+            home = Path(tmp, "home")
+            [addon] = install_folders(str(home), ["3.5"])
+            environ = dict(os.environ)
+            output, code = _request(["-b", "dev", "-v", "3.5"], home=home)
+            self.assertEqual(code, 0, output)
+            self.assertTrue(addon.joinpath("mcprep_dev.txt").exists())
+            self.assertEqual(dict(os.environ), environ)
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_daemon_socket(self, mock_stdout: StringIO) -> None:
+        """Start the daemon, and stop it once it listens.
+
+        This test will check for:
+        - The socket only being accessible by the user
+        - The umask being restored
+        - The socket being removed when stopped
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "bab.sock")
+            modes: list[int] = []
+
+            def _accept(server: socket.socket) -> None:
+                modes.append(stat.S_IMODE(os.stat(path).st_mode))
+                raise KeyboardInterrupt
+
+            umask = os.umask(0o022)
+            try:
+                with mock.patch.object(socket.socket, "accept", _accept):
+                    daemon.serve(path)
+                self.assertEqual(os.umask(0o022), 0o022)
+            finally:
+                os.umask(umask)
+            self.assertEqual(modes, [0o600])
+            self.assertFalse(path.exists())
+
+    def test_client(self) -> None:
+        """Forward arguments to a fake daemon.
+
+        This test will check for:
+        - None being returned if no daemon is running
+        - The arguments being sent
+        - Output being printed, and the exit code returned
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "bab.sock")
+            self.assertIsNone(client.forward(["-b", "dev"], path))
+
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(str(path))
+            server.listen()
+            received: list[object] = []
+
+            def _serve() -> None:
+                conn, _ = server.accept()
+                with conn, conn.makefile("rb") as reader:
+                    received.append(json.loads(reader.readline()))
+                    conn.sendall(b'{"out": "BUILT"}\n{"exit": 3}\n')
+
+            thread = threading.Thread(target=_serve)
+            thread.start()
+            with mock.patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+                code = client.forward(["-b", "dev"], path)
+            thread.join()
+            server.close()
+
+            self.assertEqual(code, 3)
+            self.assertEqual(mock_stdout.getvalue(), "BUILT")
+            self.assertEqual(
+                received[0],
+                {"argv": ["-b", "dev"], "cwd": os.getcwd(), "env": dict(os.environ)},
+            )
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_trace(self, _: StringIO) -> None:
+        """Perform a test build using the project
+        in test_addon with --trace.
+
+        This test will check for:
+        - Spans for every phase and hook in the trace
+        - File counts on the copy span
+        - Tracing being off after the build
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "trace.json")
+            with mock.patch(
+                "sys.argv",
+                [
+                    "bab",
+                    "-c",
+                    f"{TEST_FOLDER}/test_addon/bpy-build.yaml",
+                    "-b",
+                    "dev",
+                    "--trace",
+                    str(path),
+                ],
+            ):
+                bab.main()
+            with open(path) as f:
+                events = {e["name"]: e for e in json.load(f)["traceEvents"]}
+
+        for name in [
+            "parse config",
+            "load actions",
+            "stage prep",
+            "pre_build default",
+            "copy",
+            "main dev",
+            "archive",
+            "clean_up default",
+        ]:
+            self.assertEqual(events[name]["ph"], "X")
+        self.assertEqual(events["copy"]["args"]["files"], 1)
+        self.assertIs(trace.span("off"), trace.NULL_SPAN)
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_profiles(self, mock_stdout: StringIO) -> None:
+        """Build test_addon with the dev and default
+        profiles in one run, and scan a tree for several
+        sets of ignore filters at once.
+
+        This test will check for:
+        - An archive per profile in build/<profile>
+        - Each archive only having the files of its profile
+        - Filtered shared scans being the same as separate scans
+        - A command after -P not being taken as a profile
+        """
+        with mock.patch(
+            "sys.argv",
+            [
+                "bab",
+                "-c",
+                f"{TEST_FOLDER}/test_addon/bpy-build.yaml",
+                "-P",
+                "dev",
+                "-P",
+                "default",
+            ],
+        ):
+            bab.main()
+        build = Path(f"{TEST_FOLDER}/test_addon/build")
+        with zipfile.ZipFile(build / "dev" / "MCprep_addon.zip") as zf:
+            dev_names = set(zf.namelist())
+        with zipfile.ZipFile(build / "default" / "MCprep_addon.zip") as zf:
+            default_names = set(zf.namelist())
+        self.assertIn("MCprep_addon/mcprep_dev.txt", dev_names)
+        self.assertNotIn("MCprep_addon/ignore.blend", dev_names)
+        self.assertNotIn("MCprep_addon/mcprep_dev.txt", default_names)
+        self.assertIn("MCprep_addon/ignore.blend", default_names)
+
+        args = parse_args(
+            [
+                "-c",
+                f"{TEST_FOLDER}/test_addon/bpy-build.yaml",
+                "-P",
+                "dev",
+                "-P",
+                "default",
+                "verify",
+            ]
+        )
+        self.assertEqual(args.profiles, ["dev", "default"])
+        self.assertEqual(args.command, "verify")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            for rel in ["a.py", "a.blend", "docs/b.md", "pkg/__pycache__/c.pyc"]:
+                root.joinpath(rel).parent.mkdir(parents=True, exist_ok=True)
+                root.joinpath(rel).write_text(rel)
+            ignores = [
+                IgnoreMatcher(["*.blend", "__pycache__/"]),
+                IgnoreMatcher(["docs/", "__pycache__/"]),
+                IgnoreMatcher([]),
+            ]
+            shared = stage.scan_shared(root, ignores[:2])
+            self.assertNotIn("pkg/__pycache__", shared.dirs)
+            for ignore in ignores[:2]:
+                self.assertEqual(
+                    stage.filter_scan(shared, ignore), stage.scan_tree(root, ignore)
+                )
+            shared = stage.scan_shared(root, ignores)
+            for ignore in ignores:
+                self.assertEqual(
+                    stage.filter_scan(shared, ignore), stage.scan_tree(root, ignore)
+                )
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_workspace(self, mock_stdout: StringIO) -> None:
+        """Build test_addon, test_extension and
+        test_legacy_extension from a workspace file,
+        then a workspace with a missing config.
+
+        This test will check for:
+        - A row with the status and archives of every config
+        - MCprep_addon_legacy.zip from test_legacy_extension
+        - A failed exit for a missing config
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            workspace = Path(tmp, "bab-workspace.yaml")
+            tests = os.path.relpath(TEST_FOLDER, tmp)
+            workspace.write_text(
+                "configs:\n"
+                + f"  - {TEST_FOLDER}/test_addon/bpy-build.yaml\n"
+                + f"  - {tests}/test_*extension\n"
+                + "parallel: 2\n"
+            )
+            with mock.patch("sys.argv", ["bab", "-c", str(workspace), "workspace"]):
+                bab.main()
+            output = mock_stdout.getvalue()
+            self.assertIn("Built 3 configs", output)
+            self.assertEqual(output.count(" ok "), 3)
+            self.assertIn("MCprep_addon_legacy.zip", output)
+            self.assertTrue(
+                (
+                    TEST_FOLDER / "test_legacy_extension/build/MCprep_addon_legacy.zip"
+                ).exists()
+            )
+
+            workspace.write_text("configs:\n  - missing/bpy-build.yaml\n")
+            with mock.patch("sys.argv", ["bab", "-c", str(workspace), "workspace"]):
+                with self.assertRaises(SystemExit):
+                    bab.main()
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_artifact_cache(self, mock_stdout: StringIO) -> None:
+        """Build test_addon with --cache, then with -b dev,
+        then without -b dev again, and manage the cache.
+
+        This test will check for:
+        - The third build being restored from the cache
+        - MCprep_addon.zip being the same as the first build
+        - Both archives being listed by cache stats
+        - cache gc removing archives over --cache-size
+        """
+        config = f"{TEST_FOLDER}/test_addon/bpy-build.yaml"
+        zip_path = TEST_FOLDER / "test_addon/build/MCprep_addon.zip"
+        with tempfile.TemporaryDirectory() as tmp:
+            with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": tmp}):
+                with mock.patch("sys.argv", ["bab", "-c", config, "--cache"]):
+                    bab.main()
+                first = zip_path.read_bytes()
+                self.assertNotIn("Restored", mock_stdout.getvalue())
+
+                argv = ["bab", "-c", config, "--cache", "-b", "dev"]
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                self.assertNotEqual(first, zip_path.read_bytes())
+
+                with mock.patch("sys.argv", ["bab", "-c", config, "--cache"]):
+                    bab.main()
+                self.assertIn(
+                    "Restored MCprep_addon.zip from cache", mock_stdout.getvalue()
+                )
+                self.assertEqual(first, zip_path.read_bytes())
+
+                with mock.patch("sys.argv", ["bab", "cache", "stats"]):
+                    bab.main()
+                self.assertIn("2 archives", mock_stdout.getvalue())
+
+                argv = ["bab", "--cache-size", "0", "cache", "gc"]
+                with mock.patch("sys.argv", argv):
+                    bab.main()
+                self.assertIn("Removed 2 archives", mock_stdout.getvalue())
+                self.assertEqual(len(artifacts.entries()), 0)
+
+    def test_large_files(self) -> None:
+        """Hash, copy, archive, and extract a 4 MiB and a 64 MiB
+        asset, each in a new process.
+
+        This test will check for:
+        - The peak RSS of both processes being about the same
+        """
+        script = "\n".join(
+            [
+                "import os, resource, sys",
+                "from pathlib import Path",
+                "from bpy_addon_build.build_context import archive, fileio",
+                "root, size = Path(sys.argv[1]), int(sys.argv[2])",
+                "addon = root.joinpath('stage', 'addon')",
+                "addon.mkdir(parents=True)",
+                "block = os.urandom(1024 * 1024)",
+                "with open(addon.joinpath('asset.blend'), 'wb') as f:",
+                "    for _ in range(size):",
+                "        f.write(block)",
+                "fileio.hash_file(addon.joinpath('asset.blend'))",
+                "fileio.copy_file(addon.joinpath('asset.blend'), root.joinpath('copy'))",
+                "archive.write_archive(root.joinpath('stage'), root.joinpath('a.zip'))",
+                "fileio.extract_zip(root.joinpath('a.zip'), root.joinpath('out'))",
+                "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)",
+            ]
+        )
+        peaks: list[int] = []
+        for size in [4, 64]:
+            with tempfile.TemporaryDirectory() as tmp:
+                proc = subprocess.run(
+                    [sys.executable, "-c", script, tmp, str(size)],
+                    cwd=TEST_FOLDER.parent,
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                peaks.append(int(proc.stdout.split()[-1]))
+
+        # ru_maxrss is in bytes on macOS and KiB elsewhere
+        scale = 1 if sys.platform == "darwin" else 1024
+        growth = (peaks[1] - peaks[0]) * scale
+        self.assertLess(growth, 16 * 1024 * 1024)
+
+    @mock.patch("sys.stdout", new_callable=StringIO)
+    def test_symlink_refs(self, mock_stdout: StringIO) -> None:
+        """Print the fingerprint of an addon with a symlinked
+        asset folder, change the asset without changing its
+        size or modification time, and print it again.
+
+        This test will check for:
+        - The fingerprint staying the same with --symlink-refs
+        - The fingerprint changing without --symlink-refs
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            assets = root.joinpath("assets")
+            assets.mkdir()
+            asset = assets.joinpath("asset.blend")
+            asset.write_bytes(b"a" * 1024)
+            addon = root.joinpath("addon")
+            addon.mkdir()
+            addon.joinpath("__init__.py").write_text("")
+            addon.joinpath("assets").symlink_to(assets, target_is_directory=True)
+            config = root.joinpath("bpy-build.yaml")
+            config.write_text("addon_folder: addon\nbuild_name: linked\n")
+
+            def _fingerprints() -> list[str]:
+                for flags in [["--symlink-refs"], []]:
+                    argv = ["bab", "-c", str(config), *flags, "fingerprint"]
+                    with mock.patch("sys.argv", argv):
+                        bab.main()
+                return mock_stdout.getvalue().split()[-3::2]
+
+            before = _fingerprints()
+            st = asset.stat()
+            asset.write_bytes(b"b" * 1024)
+            os.utime(asset, ns=(st.st_atime_ns, st.st_mtime_ns))
+            after = _fingerprints()
+            self.assertEqual(before[0], after[0])
+            self.assertNotEqual(before[1], after[1])
+
 
 if __name__ == "__main__":
     _ = unittest.main()